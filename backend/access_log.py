@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+访问日志中间件
+在请求前后计时，将请求方法、路由模板、状态码、响应字节数和耗时（微秒）写入访问日志；
+高频路由可按比例采样，错误响应和慢请求始终记录。流式响应在发送结束后记录完整耗时和实际发送的字节数
+"""
+
+import time
+import random
+import logging
+from flask import g, request
+from backend.config import Config
+from backend.log_manager import get_request_id
+from backend.metrics import metrics
+
+# 访问日志记录器（由 LogManager.setup_access_logger 配置）
+access_logger = logging.getLogger('access')
+
+# 请求指标（不受访问日志采样影响）
+REQUEST_LATENCY = metrics.histogram('notegen_http_request_duration_seconds', '请求处理耗时（秒）',
+                                    ('method', 'route'))
+REQUESTS_TOTAL = metrics.counter('notegen_http_requests_total', '请求数', ('method', 'route', 'status'))
+
+
+class _CountingIterable:
+    """包装流式响应体，统计已发送的字节数；关闭时一并关闭原响应体"""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+class AccessLogMiddleware:
+    """访问日志中间件"""
+
+    def __init__(self, app=None, sample_rates=None, default_rate=None, slow_ms=None):
+        """初始化访问日志中间件
+
+        Args:
+            app: Flask应用，提供时立即注册
+            sample_rates: 路由模板 -> 采样比例（0~1）
+            default_rate: 未配置路由的采样比例
+            slow_ms: 超过该耗时（毫秒）的请求不采样，始终记录
+        """
+        self.sample_rates = dict(Config.ACCESS_LOG_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.default_rate = Config.ACCESS_LOG_DEFAULT_SAMPLE_RATE if default_rate is None else default_rate
+        self.slow_ns = int((Config.ACCESS_LOG_SLOW_MS if slow_ms is None else slow_ms) * 1_000_000)
+        self.stats = {'requests': 0, 'logged': 0, 'sampled_out': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """注册请求前后的钩子"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.access_log = self
+
+    def _before_request(self):
+        g.request_start_ns = time.perf_counter_ns()
+
+    def _after_request(self, response):
+        start = g.get('request_start_ns')
+        request_id = get_request_id()
+        response.headers['X-Request-ID'] = request_id
+        if start is None:
+            return response
+
+        # 计数不加锁：仅用于粗略统计，避免在每个请求上竞争锁
+        self.stats['requests'] += 1
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        entry = {
+            'request_id': request_id,
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            'sample_rate': self.sample_rates.get(route, self.default_rate)
+        }
+        doc_id = request.view_args.get('doc_id') if request.view_args else None
+        if doc_id is not None:
+            entry['doc_id'] = doc_id
+
+        if response.is_streamed and response.direct_passthrough:
+            # 文件下载：发送结束后再记录
+            response.call_on_close(lambda: self._record(entry, start, response.content_length))
+        elif response.is_streamed and response.content_length is None:
+            # 流式响应（如SSE）：统计实际发送的字节数，发送结束（含客户端断开）后再记录
+            body = response.response = _CountingIterable(response.response)
+            response.call_on_close(lambda: self._record(entry, start, body.size))
+        else:
+            self._record(entry, start, response.content_length)
+        return response
+
+    def _record(self, entry, start, size):
+        elapsed_ns = time.perf_counter_ns() - start
+        REQUEST_LATENCY.observe(elapsed_ns / 1e9, entry['method'], entry['route'])
+        REQUESTS_TOTAL.inc(entry['method'], entry['route'], str(entry['status']))
+        rate = entry['sample_rate']
+        # 错误响应和慢请求始终记录，其余按采样比例记录
+        if rate < 1.0:
+            if entry['status'] >= 400 or elapsed_ns >= self.slow_ns:
+                rate = 1.0
+            elif random.random() >= rate:
+                self.stats['sampled_out'] += 1
+                return
+        if not access_logger.isEnabledFor(logging.INFO):
+            return
+
+        self.stats['logged'] += 1
+        duration_us = elapsed_ns // 1000
+        entry['bytes'] = size
+        entry['duration_us'] = duration_us
+        entry['duration_ms'] = round(duration_us / 1000, 3)
+        if rate >= 1.0:
+            entry['sample_rate'] = None
+        access_logger.info('%s %s %s %s %dus rid=%s%s', entry['method'], entry['route'], entry['status'],
+                           f'{size}B' if size is not None else '-', duration_us, entry['request_id'],
+                           f' sample={rate}' if rate < 1.0 else '', extra=entry)
+
+    def get_stats(self):
+        """获取访问日志统计信息"""
+        return {
+            'sample_rates': self.sample_rates,
+            'default_rate': self.default_rate,
+            **self.stats
+        }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI批量任务
+对多篇文档批量执行AI操作（摘要、标签、翻译等），使用有界线程池并遵守速率限制，
+进度持久化到数据库，中断后可继续执行
+"""
+
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend.config import Config
+from backend.rate_limiter import TokenBucket
+
+# 配置日志
+logger = logging.getLogger('app.ai_batch')
+
+# 批量任务状态
+BATCH_PENDING = 'pending'
+BATCH_RUNNING = 'running'
+BATCH_COMPLETED = 'completed'
+BATCH_CANCELLED = 'cancelled'
+BATCH_INTERRUPTED = 'interrupted'
+
+WRITE_MODES = ('none', 'append', 'replace')
+
+
+def render_prompt(template, document):
+    """根据模板生成消息和上下文
+
+    模板中可使用 {title} 和 {content} 占位符；未使用 {content} 时文档内容作为上下文发送
+    """
+    message = template.replace('{title}', document['title'] or '')
+    if '{content}' in message:
+        return message.replace('{content}', document['content'] or ''), None
+    return message, document['content'] or ''
+
+
+def failed_result(document_id, error):
+    """单篇文档处理失败的结果"""
+    return {'document_id': document_id, 'success': False, 'response': None, 'error': error}
+
+
+class BatchManager:
+    """AI批量任务管理器"""
+
+    def __init__(self, db_manager, ai_service, max_workers=None, rate_per_minute=None, flush_size=None,
+                 on_documents_changed=None):
+        """初始化批量任务管理器
+
+        Args:
+            db_manager: 数据库管理器
+            ai_service: AI服务
+            max_workers: 并发处理的文档数
+            rate_per_minute: 每分钟最多发起的AI请求数
+            flush_size: 每累计多少条结果写回一次数据库
+            on_documents_changed: 结果写回文档后的回调，参数为文档ID列表
+        """
+        logger.info("初始化AI批量任务管理器")
+        self.db_manager = db_manager
+        self.ai_service = ai_service
+        self.max_workers = max_workers or Config.AI_BATCH_WORKERS
+        self.flush_size = flush_size or Config.AI_BATCH_FLUSH_SIZE
+        self.on_documents_changed = on_documents_changed
+        rate_per_minute = rate_per_minute or Config.AI_BATCH_RATE_PER_MINUTE
+        self.rate_limiter = TokenBucket(rate_per_minute / 60.0, capacity=self.max_workers)
+        self._lock = threading.Lock()
+        self._running = {}
+
+        # 上次进程退出时仍在运行的任务标记为中断，等待手动继续
+        for batch in self.db_manager.get_ai_batches():
+            if batch['status'] == BATCH_RUNNING:
+                self.db_manager.update_ai_batch_status(batch['id'], BATCH_INTERRUPTED)
+        logger.info(f"AI批量任务管理器初始化完成 - 并发数: {self.max_workers}, 速率: {rate_per_minute}次/分钟")
+
+    def create(self, document_ids, prompt_template, write_mode='none'):
+        """创建并启动批量任务
+
+        Returns:
+            批量任务ID
+        """
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"不支持的写回方式: {write_mode}")
+
+        batch_id = uuid.uuid4().hex
+        self.db_manager.create_ai_batch(batch_id, prompt_template, write_mode, document_ids)
+        self.start(batch_id)
+        return batch_id
+
+    def start(self, batch_id):
+        """启动或继续批量任务，只处理尚未成功的文档
+
+        Returns:
+            是否启动成功（任务不存在或已在运行时返回False）
+        """
+        batch = self.db_manager.get_ai_batch(batch_id)
+        if batch is None:
+            return False
+
+        with self._lock:
+            if batch_id in self._running:
+                return False
+            cancel_event = threading.Event()
+            self._running[batch_id] = cancel_event
+
+        self.db_manager.update_ai_batch_status(batch_id, BATCH_RUNNING)
+        thread = threading.Thread(target=self._run, args=(batch, cancel_event),
+                                  name=f'ai-batch-{batch_id[:8]}', daemon=True)
+        thread.start()
+        return True
+
+    def cancel(self, batch_id):
+        """取消正在运行的批量任务，已完成的结果会保留"""
+        with self._lock:
+            cancel_event = self._running.get(batch_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        logger.info(f"AI批量任务取消请求 - ID: {batch_id}")
+        return True
+
+    def _process(self, batch, document, cancel_event):
+        """处理单篇文档"""
+        if not self.rate_limiter.acquire(cancel_event=cancel_event):
+            return None
+        message, context = render_prompt(batch['prompt_template'], document)
+        # 整体替换文档时需要完整上下文
+        result = self.ai_service.chat(message, context, trim_context=batch['write_mode'] != 'replace')
+        return {
+            'document_id': document['id'],
+            'success': result.get('success', False),
+            'response': result.get('response'),
+            'error': result.get('error')
+        }
+
+    def _flush(self, batch, results):
+        """写回一批结果，文档内容有变化时通知回调"""
+        self.db_manager.save_ai_batch_results(batch['id'], results, batch['write_mode'])
+        if self.on_documents_changed is not None and batch['write_mode'] != 'none':
+            self.on_documents_changed([item['document_id'] for item in results if item['success']])
+
+    def _run(self, batch, cancel_event):
+        """执行批量任务：线程池并发处理，按批写回结果作为检查点"""
+        batch_id = batch['id']
+        documents = self.db_manager.get_pending_ai_batch_items(batch_id)
+        logger.info(f"AI批量任务开始 - ID: {batch_id}, 待处理文档: {len(documents)}")
+
+        # 创建任务后被删除的文档直接记为失败
+        buffer = [failed_result(document['id'], '文档不存在或已被删除')
+                  for document in documents if document['deleted']]
+        documents = [document for document in documents if not document['deleted']]
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-batch-worker') as executor:
+                futures = [executor.submit(self._process, batch, document, cancel_event) for document in documents]
+                for document, future in zip(documents, futures):
+                    if future.cancelled():
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"AI批量任务条目处理异常 - ID: {batch_id}, 文档ID: {document['id']}, 错误: {str(e)}")
+                        result = failed_result(document['id'], f"处理错误: {str(e)}")
+                    if result is None:
+                        continue
+                    buffer.append(result)
+                    if len(buffer) >= self.flush_size:
+                        self._flush(batch, buffer)
+                        buffer = []
+                    if cancel_event.is_set():
+                        for pending in futures:
+                            pending.cancel()
+
+            if buffer:
+                self._flush(batch, buffer)
+
+            status = BATCH_CANCELLED if cancel_event.is_set() else BATCH_COMPLETED
+        except Exception as e:
+            logger.error(f"AI批量任务执行异常 - ID: {batch_id}, 错误: {str(e)}")
+            status = BATCH_INTERRUPTED
+        finally:
+            with self._lock:
+                self._running.pop(batch_id, None)
+
+        self.db_manager.update_ai_batch_status(batch_id, status)
+        logger.info(f"AI批量任务结束 - ID: {batch_id}, 状态: {status}")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI响应缓存
+基于SQLite的持久化缓存，支持TTL过期和按容量的LRU淘汰
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from backend.config import Config
+
+# 配置日志
+logger = logging.getLogger('app.ai_cache')
+
+
+def make_cache_key(model, temperature, max_tokens, system_prompt, context, message):
+    """生成缓存键：(模型, 温度, 最大token数, 系统提示, 上下文哈希, 消息)"""
+    context_hash = hashlib.sha256((context or '').encode('utf-8')).hexdigest()
+    raw = json.dumps(
+        [model, temperature, max_tokens, system_prompt, context_hash, message],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    """AI响应缓存"""
+
+    def __init__(self, db_path=None, max_entries=None, max_bytes=None, ttl=None):
+        logger.info("初始化AI响应缓存")
+        self.db_path = db_path or Config.AI_CACHE_PATH
+        self.max_entries = max_entries or Config.AI_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.AI_CACHE_MAX_BYTES
+        self.ttl = ttl or Config.AI_CACHE_TTL
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.init_db()
+        logger.info(f"AI响应缓存初始化完成 - 路径: {self.db_path}, 最大条目: {self.max_entries}, TTL: {self.ttl}秒")
+
+    def init_db(self):
+        """初始化缓存数据库"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_cache_accessed ON ai_cache (accessed_at)')
+        conn.commit()
+        conn.close()
+
+    def get_connection(self):
+        """获取数据库连接"""
+        return sqlite3.connect(self.db_path)
+
+    def get(self, key):
+        """读取缓存，过期条目视为未命中并删除"""
+        now = time.time()
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT response, created_at FROM ai_cache WHERE key = ?', (key,))
+                row = cursor.fetchone()
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                if now - row[1] > self.ttl:
+                    cursor.execute('DELETE FROM ai_cache WHERE key = ?', (key,))
+                    conn.commit()
+                    self.misses += 1
+                    return None
+
+                cursor.execute('UPDATE ai_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+            finally:
+                conn.close()
+
+    def set(self, key, response):
+        """写入缓存并按容量淘汰最久未使用的条目"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                INSERT OR REPLACE INTO ai_cache (key, response, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (key, response, size, now, now))
+
+                # 先清理过期条目，再按LRU淘汰到容量以内
+                cursor.execute('DELETE FROM ai_cache WHERE created_at < ?', (now - self.ttl,))
+                self.evictions += cursor.rowcount
+
+                cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_cache')
+                count, total_size = cursor.fetchone()
+                if count > self.max_entries or total_size > self.max_bytes:
+                    cursor.execute('SELECT key, size FROM ai_cache ORDER BY accessed_at ASC')
+                    evict_keys = []
+                    for evict_key, evict_size in cursor.fetchall():
+                        if count <= self.max_entries and total_size <= self.max_bytes:
+                            break
+                        evict_keys.append((evict_key,))
+                        count -= 1
+                        total_size -= evict_size
+                    cursor.executemany('DELETE FROM ai_cache WHERE key = ?', evict_keys)
+                    self.evictions += len(evict_keys)
+
+                conn.commit()
+            finally:
+                conn.close()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                conn.execute('DELETE FROM ai_cache')
+                conn.commit()
+            finally:
+                conn.close()
+        logger.info("AI响应缓存已清空")
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_cache')
+                count, total_size = cursor.fetchone()
+            finally:
+                conn.close()
+
+            total = self.hits + self.misses
+            return {
+                'entries': count,
+                'bytes': total_size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
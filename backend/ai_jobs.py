@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI任务队列
+使用独立的工作线程执行AI请求，限制并发数和排队长度，支持状态查询与取消
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from backend.config import Config
+
+# 配置日志
+logger = logging.getLogger('app.ai_jobs')
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# 任务耗时的指数移动平均系数（用于估算排队等待时间）
+RUN_TIME_EWMA_ALPHA = 0.2
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+    pass
+
+
+class AIJob:
+    """AI任务"""
+
+    def __init__(self, task, kind='chat'):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.task = task
+        self.status = JOB_QUEUED
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    def to_dict(self, include_result=True):
+        """转换为可序列化的字典"""
+        job = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queue_time': round((self.started_at or time.time()) - self.created_at, 3),
+            'run_time': round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+        }
+        if include_result and self.status in FINISHED_STATES:
+            job['result'] = self.result
+        return job
+
+
+class AIJobQueue:
+    """有界AI任务队列"""
+
+    def __init__(self, max_workers=None, max_queue=None, retention=None):
+        """初始化任务队列
+
+        Args:
+            max_workers: 并发执行的任务数
+            max_queue: 最多排队的任务数，超出时拒绝提交
+            retention: 保留的已完成任务数
+        """
+        self.max_workers = max_workers or Config.AI_MAX_CONCURRENCY
+        self.max_queue = max_queue or Config.AI_QUEUE_SIZE
+        self.retention = retention or Config.AI_JOB_RETENTION
+        # 排队中的任务；取消时立即移出，不再占用排队名额
+        self._queue = deque()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._running = 0
+        self.avg_run_time = None
+        self.stats = {'submitted': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0}
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._worker, name=f'ai-worker-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"AI任务队列启动 - 并发数: {self.max_workers}, 队列长度: {self.max_queue}")
+
+    def submit(self, task, kind='chat'):
+        """提交任务
+
+        Args:
+            task: 可调用对象 task(cancel_event) -> 结果字典
+            kind: 任务类型
+
+        Returns:
+            AIJob
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        job = AIJob(task, kind)
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.stats['rejected'] += 1
+                raise QueueFullError(f'AI任务队列已满（{self.max_queue}）')
+            self._queue.append(job)
+            self._not_empty.notify()
+            self._jobs[job.id] = job
+            self.stats['submitted'] += 1
+            self._prune()
+        logger.info(f"AI任务已提交 - ID: {job.id}, 类型: {kind}")
+        return job
+
+    def get(self, job_id):
+        """获取任务"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接取消，运行中的任务通知其尽快停止
+
+        Returns:
+            任务对象，不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return job
+            job.cancel_event.set()
+            if job.status == JOB_QUEUED:
+                self._queue.remove(job)
+                self._finish(job, JOB_CANCELLED, {'success': False, 'error': '任务已取消', 'cancelled': True})
+        logger.info(f"AI任务取消请求 - ID: {job_id}")
+        return job
+
+    def wait(self, job, timeout=None):
+        """等待任务完成，超时返回False"""
+        return job.done_event.wait(timeout)
+
+    def _worker(self):
+        """工作线程：依次执行队列中的任务"""
+        while True:
+            with self._not_empty:
+                while not self._queue:
+                    self._not_empty.wait()
+                job = self._queue.popleft()
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                self._running += 1
+
+            try:
+                result = job.task(job.cancel_event)
+                if job.cancel_event.is_set():
+                    status = JOB_CANCELLED
+                elif result.get('success'):
+                    status = JOB_SUCCEEDED
+                else:
+                    status = JOB_FAILED
+            except Exception as e:
+                logger.error(f"AI任务执行异常 - ID: {job.id}, 错误: {str(e)}")
+                result = {'success': False, 'error': f'处理错误: {str(e)}'}
+                status = JOB_FAILED
+
+            with self._lock:
+                self._running -= 1
+                self._finish(job, status, result)
+                run_time = job.finished_at - job.started_at
+                if self.avg_run_time is None:
+                    self.avg_run_time = run_time
+                else:
+                    self.avg_run_time += RUN_TIME_EWMA_ALPHA * (run_time - self.avg_run_time)
+            logger.info(f"AI任务结束 - ID: {job.id}, 状态: {status}, 耗时: {job.finished_at - job.started_at:.2f}秒")
+
+    def _finish(self, job, status, result):
+        """标记任务完成（调用方需持有锁）"""
+        job.status = status
+        job.result = result
+        job.finished_at = time.time()
+        self.stats[status] += 1
+        job.done_event.set()
+
+    def _prune(self):
+        """清理超出保留数量的已完成任务（调用方需持有锁）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(len(finished) - self.retention, 0)]:
+            del self._jobs[job_id]
+
+    def estimate_wait(self):
+        """按平均任务耗时估算新任务的排队等待秒数"""
+        with self._lock:
+            avg_run_time = self.avg_run_time if self.avg_run_time is not None else 1.0
+            return (len(self._queue) + 1) / self.max_workers * avg_run_time
+
+    def get_stats(self):
+        """获取队列统计信息"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': len(self._queue),
+                'running': self._running,
+                'avg_run_time': round(self.avg_run_time, 3) if self.avg_run_time is not None else None,
+                **self.stats
+            }
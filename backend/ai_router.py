@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI端点路由
+多端点加权选择、失败重试（指数退避+抖动，遵循Retry-After）、熔断以及可选的对冲请求
+"""
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from backend.config import Config
+from backend.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger('app.ai_router')
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# 熔断器状态
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+# 延迟的指数移动平均系数
+LATENCY_EWMA_ALPHA = 0.3
+
+# 每次上游请求（含重试和对冲）收到响应头的耗时
+AI_REQUEST_LATENCY = metrics.histogram('notegen_ai_request_duration_seconds', 'AI上游请求耗时（秒，至收到响应头）',
+                                       ('endpoint', 'outcome'))
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），返回等待秒数或None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Endpoint:
+    """单个AI端点及其统计信息"""
+
+    def __init__(self, base_url, api_key=None, model=None, weight=1.0):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.weight = max(float(weight), 0.0)
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.state = BREAKER_CLOSED
+        self.opened_at = None
+        self.half_open_trial = False
+
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+    def score(self):
+        """路由权重：配置权重按平均延迟和错误率折减"""
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return self.weight * (1.0 - min(self.error_rate(), 0.9)) / (0.1 + latency)
+
+    def to_dict(self):
+        return {
+            'base_url': self.base_url,
+            'model': self.model,
+            'weight': self.weight,
+            'state': self.state,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.error_rate(), 4),
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ewma': round(self.latency_ewma, 4) if self.latency_ewma is not None else None
+        }
+
+
+class EndpointRouter:
+    """AI端点路由器"""
+
+    def __init__(self, endpoints, max_retries=2, hedge_after=0):
+        """初始化路由器
+
+        Args:
+            endpoints: 端点配置列表，每项包含 base_url，可选 api_key、model、weight
+            max_retries: 失败后的最大重试次数
+            hedge_after: 对冲请求的等待秒数，超过该时间未响应则向另一端点并发请求，0表示关闭
+        """
+        self.endpoints = [Endpoint(**endpoint) for endpoint in endpoints]
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {'retries': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0}
+        logger.info(f"AI端点路由器初始化 - 端点数: {len(self.endpoints)}, 最大重试: {max_retries}, 对冲等待: {hedge_after}秒")
+
+    def choose(self, exclude=()):
+        """按权重随机选择可用端点，熔断中的端点在冷却期后允许一次试探"""
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint in exclude or endpoint.weight <= 0:
+                    continue
+                if endpoint.state == BREAKER_OPEN:
+                    if now - endpoint.opened_at < Config.AI_BREAKER_COOLDOWN:
+                        continue
+                    endpoint.state = BREAKER_HALF_OPEN
+                    endpoint.half_open_trial = False
+                if endpoint.state == BREAKER_HALF_OPEN and endpoint.half_open_trial:
+                    continue
+                candidates.append(endpoint)
+
+            if not candidates:
+                # 全部熔断时选择最早可恢复的端点，避免完全不可用
+                fallback = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+                if not fallback:
+                    return None
+                return min(fallback, key=lambda endpoint: endpoint.opened_at or 0)
+
+            chosen = random.choices(candidates, weights=[endpoint.score() or 1e-6 for endpoint in candidates])[0]
+            if chosen.state == BREAKER_HALF_OPEN:
+                chosen.half_open_trial = True
+            return chosen
+
+    def record(self, endpoint, success, latency):
+        """记录一次请求结果，更新延迟、错误率与熔断状态"""
+        AI_REQUEST_LATENCY.observe(latency, endpoint.base_url, 'success' if success else 'error')
+        with self._lock:
+            endpoint.requests += 1
+            if endpoint.latency_ewma is None:
+                endpoint.latency_ewma = latency
+            else:
+                endpoint.latency_ewma += LATENCY_EWMA_ALPHA * (latency - endpoint.latency_ewma)
+
+            if success:
+                endpoint.consecutive_failures = 0
+                if endpoint.state != BREAKER_CLOSED:
+                    logger.info(f"AI端点恢复 - {endpoint.base_url}")
+                endpoint.state = BREAKER_CLOSED
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.state == BREAKER_HALF_OPEN or endpoint.consecutive_failures >= Config.AI_BREAKER_THRESHOLD:
+                if endpoint.state != BREAKER_OPEN:
+                    logger.warning(f"AI端点熔断 - {endpoint.base_url}, 连续失败: {endpoint.consecutive_failures}")
+                endpoint.state = BREAKER_OPEN
+                endpoint.opened_at = time.time()
+
+    def _attempt(self, session, endpoint, path, headers, data, timeout, stream, endpoint_model=True):
+        """向指定端点发送一次请求（endpoint_model 为真时使用端点配置的对话模型）"""
+        request_headers = dict(headers)
+        if endpoint.api_key:
+            request_headers['Authorization'] = f"Bearer {endpoint.api_key}"
+        request_data = dict(data, model=endpoint.model) if endpoint.model and endpoint_model else data
+
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{endpoint.base_url}{path}", headers=request_headers,
+                                    json=request_data, timeout=timeout, stream=stream)
+        except requests.exceptions.RequestException:
+            self.record(endpoint, False, time.perf_counter() - start)
+            raise
+        self.record(endpoint, response.status_code not in RETRYABLE_STATUS, time.perf_counter() - start)
+        return response
+
+    def _hedged_attempt(self, session, endpoint, path, headers, data, timeout, endpoint_model=True):
+        """对冲请求：首个请求超过 hedge_after 未返回时，向另一端点并发请求，取先成功者"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-hedge')
+        executor = self._executor
+
+        futures = {executor.submit(self._attempt, session, endpoint, path, headers, data, timeout, False,
+                                   endpoint_model): endpoint}
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            backup = self.choose(exclude=(endpoint,))
+            if backup is not None:
+                with self._lock:
+                    self.stats['hedges'] += 1
+                logger.info(f"AI请求对冲 - {endpoint.base_url} 超过 {self.hedge_after}秒未响应，并发请求 {backup.base_url}")
+                futures[executor.submit(self._attempt, session, backup, path, headers, data, timeout, False,
+                                        endpoint_model)] = backup
+
+        pending = set(futures)
+        result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code == 200:
+                    result = future
+                    break
+            if result is not None:
+                break
+            if not pending:
+                result = next(iter(done))
+
+        # 关闭未被采用的响应
+        for future in futures:
+            if future is not result:
+                future.add_done_callback(
+                    lambda f: f.exception() is None and f.result().close())
+
+        if futures[result] is not endpoint:
+            with self._lock:
+                self.stats['hedge_wins'] += 1
+        return result.result()
+
+    def request(self, session, path, headers, data, timeout, stream=False, deadline=None, endpoint_model=True):
+        """发送请求，失败时重试并切换端点
+
+        Args:
+            endpoint_model: 是否以端点配置的 model 替换请求中的模型（对话请求），向量等其他接口传False
+            deadline: 整体截止时间（time.monotonic()），每次请求的超时不超过剩余时间，
+                退避等待会越过截止时间时不再重试；None表示只受重试次数限制
+
+        Returns:
+            最后一次请求的响应（成功或不可重试的失败）
+
+        Raises:
+            requests.exceptions.RequestException: 所有尝试均因网络错误失败或已超过截止时间
+        """
+        tried = []
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                attempt_timeout = min(timeout, remaining)
+
+            endpoint = self.choose(exclude=tried) or self.choose()
+            if endpoint is None:
+                break
+            if tried and endpoint is not tried[-1]:
+                with self._lock:
+                    self.stats['failovers'] += 1
+            tried.append(endpoint)
+
+            try:
+                if self.hedge_after and not stream and len(self.endpoints) > 1:
+                    response = self._hedged_attempt(session, endpoint, path, headers, data, attempt_timeout,
+                                                    endpoint_model)
+                else:
+                    response = self._attempt(session, endpoint, path, headers, data, attempt_timeout, stream,
+                                             endpoint_model)
+                if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    return response
+                backoff = self._backoff(attempt, parse_retry_after(response.headers.get('Retry-After')))
+                if not self._can_retry(backoff, deadline):
+                    logger.warning(f"AI请求失败，剩余时间不足以重试 - {endpoint.base_url}, 状态码: {response.status_code}")
+                    return response
+                logger.warning(f"AI请求失败，准备重试 - {endpoint.base_url}, 状态码: {response.status_code}")
+                response.close()
+            except requests.exceptions.RequestException as e:
+                last_error = e
+                if attempt == self.max_retries:
+                    raise
+                backoff = self._backoff(attempt)
+                if not self._can_retry(backoff, deadline):
+                    logger.warning(f"AI请求异常，剩余时间不足以重试 - {endpoint.base_url}, 错误: {str(e)}")
+                    raise
+                logger.warning(f"AI请求异常，准备重试 - {endpoint.base_url}, 错误: {str(e)}")
+
+            with self._lock:
+                self.stats['retries'] += 1
+            time.sleep(backoff)
+
+        if last_error is not None:
+            raise last_error
+        if deadline is not None and time.monotonic() >= deadline:
+            raise requests.exceptions.Timeout('已超过AI请求的截止时间')
+        raise requests.exceptions.RequestException('没有可用的AI端点')
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        """指数退避（全抖动），服务端给出Retry-After时以其为准"""
+        if retry_after is not None:
+            return min(retry_after, Config.AI_RETRY_AFTER_MAX)
+        return random.uniform(0, min(Config.AI_BACKOFF_MAX, Config.AI_BACKOFF_BASE * (2 ** attempt)))
+
+    @staticmethod
+    def _can_retry(backoff, deadline):
+        """退避结束后是否仍在截止时间之前"""
+        return deadline is None or time.monotonic() + backoff < deadline
+
+    def get_stats(self):
+        """获取路由统计信息"""
+        with self._lock:
+            return {
+                **self.stats,
+                'endpoints': [endpoint.to_dict() for endpoint in self.endpoints]
+            }
+
+    def close(self):
+        """关闭对冲请求线程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -6,88 +6,636 @@ AI服务模块
 
 import requests
 import json
+import time
+import socket
+import ssl
 import logging
-from backend.config_manager import ConfigManager
+import threading
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from backend.config_manager import get_config_manager, CONFIG_AI
+from backend.ai_cache import AIResponseCache, make_cache_key
+from backend.context_builder import ContextBuilder
+from backend.token_counter import TokenCounter, TokenUsageTracker
+from backend.ai_router import EndpointRouter
+from backend.metrics import metrics
 
 # 配置日志
 logger = logging.getLogger('app.ai_service')
 
+# 流式对话从发出请求到结束（完成、出错或被取消）的总耗时
+AI_STREAM_DURATION = metrics.histogram('notegen_ai_stream_duration_seconds', '流式AI对话总耗时（秒）', ('outcome',))
+
+# 系统提示
+SYSTEM_PROMPT = "你是一个专业的Markdown助手，可以帮助用户生成、编辑和优化Markdown内容。"
+
+def measure_connection(base_url, timeout=10):
+    """分别测量DNS解析、TCP连接和TLS握手耗时（毫秒）
+
+    使用独立的临时连接，测量完成后立即关闭
+    """
+    parts = urlsplit(base_url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f"Base URL无效: {base_url}")
+    secure = parts.scheme == 'https'
+    host = parts.hostname
+    port = parts.port or (443 if secure else 80)
+    timings = {}
+
+    start = time.perf_counter()
+    address_info = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    timings['dns_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    family, socktype, proto, _, address = address_info[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(timeout)
+    try:
+        start = time.perf_counter()
+        sock.connect(address)
+        timings['connect_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        if secure:
+            start = time.perf_counter()
+            context = ssl.create_default_context()
+            sock = context.wrap_socket(sock, server_hostname=host)
+            timings['tls_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        else:
+            timings['tls_ms'] = None
+    finally:
+        sock.close()
+
+    return timings
+
+
+# 等待响应期间检查取消信号的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.1
+
+# 任务被取消时的结果
+CANCELLED_RESULT = {'success': False, 'error': '任务已取消', 'cancelled': True}
+
+
+def consume_events(events, cancel_event=None, on_event=None):
+    """消费流式事件直到结束，返回与 chat 相同格式的结果；cancel_event 被设置时关闭上游请求
+
+    Args:
+        on_event: 可选的回调，依次接收每个事件（用于把任务中的事件转发给SSE响应）
+    """
+    try:
+        for event in events:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info("AI任务已取消，停止接收响应")
+                return dict(CANCELLED_RESULT)
+            if on_event is not None:
+                on_event(event)
+            if event['type'] == 'done':
+                result = {'success': True, 'response': event['response']}
+                for key in ('prompt_tokens', 'cached', 'session'):
+                    if event.get(key) is not None:
+                        result[key] = event[key]
+                return result
+            if event['type'] == 'error':
+                if event.get('cancelled'):
+                    return dict(CANCELLED_RESULT)
+                return {'success': False, 'error': event['error']}
+        return {'success': False, 'error': '响应意外结束'}
+    finally:
+        events.close()
+
+
+class UpstreamCall:
+    """可取消的上游请求
+
+    提供 cancel_event 时在辅助线程中发送请求，调用方等待响应期间定期检查取消信号：
+    尚未收到响应时不再等待（响应到达后随即关闭），已在读取流式响应时由辅助线程关闭响应，
+    中断阻塞的读取，执行任务的线程因此能立即结束。未提供 cancel_event 时直接在当前线程发送。
+    非流式请求（stream 为False）返回时响应体已读取完毕，辅助线程随即结束，不再监视取消信号
+    """
+
+    def __init__(self, send, cancel_event=None, stream=False):
+        self.cancel_event = cancel_event
+        self.stream = stream
+        self.response = None
+        self.error = None
+        self._send = send
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._finished = threading.Event()
+        self._abandoned = False
+        if cancel_event is None:
+            self._ready.set()
+            self.response = send()
+            return
+        threading.Thread(target=self._run, name='ai-upstream', daemon=True).start()
+
+    def _run(self):
+        response = None
+        try:
+            response = self._send()
+        except Exception as e:
+            self.error = e
+        with self._lock:
+            self.response = response
+            self._ready.set()
+            abandoned = self._abandoned
+        if response is None:
+            return
+        if abandoned:
+            response.close()
+            return
+        if not self.stream:
+            return
+        # 调用方读取响应期间监视取消信号
+        while not self._finished.wait(CANCEL_POLL_INTERVAL):
+            if self.cancel_event.is_set():
+                response.close()
+                return
+
+    def wait_response(self):
+        """等待上游响应，已取消时返回None"""
+        while not self._ready.wait(CANCEL_POLL_INTERVAL):
+            if self.cancel_event.is_set():
+                with self._lock:
+                    if not self._ready.is_set():
+                        self._abandoned = True
+                        return None
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def finish(self):
+        """响应读取完毕，停止监视"""
+        self._finished.set()
+
+
 class AIService:
     """AI服务类"""
     
-    def __init__(self):
+    def __init__(self, config=None):
         logger.info("初始化AI服务")
-        self.config_manager = ConfigManager()
-        self.config = self.config_manager.get_config()
+        self.config_manager = get_config_manager()
+        # 未显式传入配置时使用共享配置，并订阅其变化，请求路径上不再读取配置文件
+        self._subscribed = config is None
+        self.config = config if config is not None else self.config_manager.get_config()
+        self._session_lock = threading.Lock()
+        self._session_key = None
+        self.session = None
+        self.router = None
+        self._ensure_session()
+        self.cache = AIResponseCache() if self.config.get('cache_enabled', True) else None
+        self.token_counter = TokenCounter()
+        self.usage_tracker = TokenUsageTracker()
+        self.context_builder = ContextBuilder(token_budget=self.config.get('context_token_budget', 3000),
+                                              token_counter=self.token_counter.count)
+        if self._subscribed:
+            self.config_manager.subscribe(self._on_config_changed)
         logger.info(f"AI服务初始化完成 - 模型: {self.config.get('model', '未知')}")
     
+    def _get_endpoints(self):
+        """获取端点列表：优先使用 endpoints 配置，否则使用单个 base_url"""
+        endpoints = self.config.get('endpoints') or [{'base_url': self.config.get('base_url', '')}]
+        return [
+            {
+                'base_url': endpoint.get('base_url', ''),
+                'api_key': endpoint.get('api_key'),
+                'model': endpoint.get('model'),
+                'weight': endpoint.get('weight', 1.0)
+            }
+            for endpoint in endpoints
+        ]
+    
+    def _get_session_key(self):
+        """连接池与路由相关配置，任一项变化都需要重建会话"""
+        return (
+            json.dumps(self._get_endpoints(), sort_keys=True),
+            self.config.get('pool_size', 10),
+            self.config.get('keep_alive', True),
+            self.config.get('max_retries', 2),
+            self.config.get('hedge_after', 0)
+        )
+    
+    def _ensure_session(self):
+        """确保持有与当前配置匹配的连接池会话和端点路由器
+        
+        Returns:
+            (会话, 路由器)，二者在同一把锁内读取，不会拿到并发重建时已关闭的路由器
+        """
+        session_key = self._get_session_key()
+        with self._session_lock:
+            if self.session is not None and self._session_key == session_key:
+                return self.session, self.router
+            
+            old_session, old_router = self.session, self.router
+            endpoints = self._get_endpoints()
+            _, pool_size, keep_alive, max_retries, hedge_after = session_key
+            
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=pool_size, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not keep_alive:
+                session.headers['Connection'] = 'close'
+            
+            self.session = session
+            self.router = router = EndpointRouter(endpoints, max_retries=max_retries, hedge_after=hedge_after)
+            self._session_key = session_key
+            base_urls = ', '.join(endpoint['base_url'] for endpoint in endpoints)
+            logger.info(f"创建AI连接池会话 - 端点: {base_urls}, 连接池大小: {pool_size}, 长连接: {keep_alive}")
+        
+        if old_session is not None:
+            old_session.close()
+        if old_router is not None:
+            old_router.close()
+        return session, router
+    
+    def _post(self, headers, data, timeout, stream=False, deadline=None):
+        """经端点路由发送对话请求（失败时重试、切换端点，deadline 为整体截止的 time.monotonic() 时间）"""
+        session, router = self._ensure_session()
+        return router.request(session, '/chat/completions', headers, data, timeout, stream=stream, deadline=deadline)
+    
+    def probe(self, api_key, base_url, model=None, timeout=None):
+        """轻量连接探测：不修改、不保存当前配置
+        
+        先测量连接与TLS握手耗时，再通过连接池请求 /models（不支持时改用1个token的对话补全），
+        测量首字节时间
+        
+        Returns:
+            结果字典，包含各阶段耗时
+        """
+        base_url = base_url.rstrip('/')
+        timeout = timeout or self.config.get('timeout', 30)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        logger.info(f"探测AI连接 - Base URL: {base_url}")
+        
+        try:
+            timings = measure_connection(base_url, timeout)
+        except (OSError, ValueError) as e:
+            error_msg = f"无法建立连接: {str(e)}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg}
+        
+        session, _ = self._ensure_session()
+        total_start = time.perf_counter()
+        try:
+            # 首选模型列表接口，不消耗token
+            method = 'models'
+            start = time.perf_counter()
+            response = session.get(f"{base_url}/models", headers=headers, timeout=timeout, stream=True)
+            timings['first_byte_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            response.close()
+            
+            if response.status_code in (404, 405) and model:
+                # 不支持模型列表时，发送仅生成1个token的补全请求
+                method = 'completion'
+                data = {
+                    "model": model,
+                    "messages": [{"role": "user", "content": "ping"}],
+                    "max_tokens": 1
+                }
+                start = time.perf_counter()
+                response = session.post(f"{base_url}/chat/completions", headers=headers, json=data,
+                                        timeout=timeout, stream=True)
+                timings['first_byte_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                response.close()
+        except requests.exceptions.Timeout:
+            error_msg = f"请求超时 (超过 {timeout} 秒)"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg, 'timings': timings}
+        except requests.exceptions.RequestException as e:
+            error_msg = f"网络请求错误: {str(e)}"
+            logger.error(error_msg)
+            return {'success': False, 'error': error_msg, 'timings': timings}
+        
+        timings['total_ms'] = round((time.perf_counter() - total_start) * 1000, 2)
+        result = {'method': method, 'status_code': response.status_code, 'timings': timings}
+        
+        if response.status_code == 200:
+            logger.info(f"AI连接探测成功 - 方式: {method}, 耗时: {timings}")
+            return {'success': True, **result}
+        
+        if response.status_code in (401, 403):
+            error_msg = f"API密钥无效或无权限: {response.status_code}"
+        else:
+            error_msg = f"API请求失败: {response.status_code}"
+        logger.error(f"AI连接探测失败 - {error_msg}")
+        return {'success': False, 'error': error_msg, **result}
+    
+    def get_router_stats(self):
+        """获取端点路由统计信息"""
+        _, router = self._ensure_session()
+        return router.get_stats()
+    
+    def _apply_config(self, config):
+        """应用新配置：按需重建连接池，更新上下文预算并开启/关闭响应缓存"""
+        self.config = config
+        self._ensure_session()
+        self.context_builder.token_budget = config.get('context_token_budget', 3000)
+        if not config.get('cache_enabled', True):
+            self.cache = None
+        elif self.cache is None:
+            self.cache = AIResponseCache()
+    
+    def _on_config_changed(self, kind, config):
+        """共享配置变化时的回调"""
+        if kind == CONFIG_AI:
+            self._apply_config(config)
+            logger.info("AI服务已应用新配置")
+    
     def update_config(self, new_config):
-        """更新配置"""
+        """更新配置（与已保存的配置合并，未提交的配置项保持不变）"""
         logger.info("更新AI服务配置")
-        self.config = new_config
-        self.config_manager.save_config(new_config)
+        config = self.config_manager.update_config(new_config)
+        if not self._subscribed:
+            self._apply_config(config)
         logger.info("AI服务配置更新完成")
     
-    def chat(self, message, context=None):
-        """与AI对话"""
+    def close(self):
+        """关闭连接池会话"""
+        if self._subscribed:
+            self.config_manager.unsubscribe(self._on_config_changed)
+            self._subscribed = False
+        with self._session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+                self._session_key = None
+            if self.router is not None:
+                self.router.close()
+                self.router = None
+    
+    def _check_config(self):
+        """检查配置是否完整，返回错误信息或None"""
+        missing_keys = [key for key in ['api_key', 'base_url', 'model'] if key not in self.config]
+        if missing_keys:
+            return f"配置不完整，缺少: {', '.join(missing_keys)}"
+        return None
+    
+    def _build_request(self, message, context=None, stream=False, history=None):
+        """构建请求头和请求数据
+        
+        Args:
+            history: 此前的对话消息列表（会话模式），插入在系统提示和当前消息之间
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config['api_key']}"
+        }
+        
+        # 构建消息内容
+        messages = []
+        
+        # 添加系统提示和上下文（如果有）
+        system_prompt = SYSTEM_PROMPT
+        if context:
+            system_prompt += f"\n\n当前Markdown内容：\n{context}"
+        
+        messages.append({"role": "system", "content": system_prompt})
+        
+        # 添加历史对话（如果有）
+        if history:
+            messages.extend(history)
+        
+        # 添加用户消息
+        messages.append({"role": "user", "content": message})
+        
+        # 请求数据
+        data = {
+            "model": self.config['model'],
+            "messages": messages,
+            "temperature": self.config.get('temperature', 0.7),
+            "max_tokens": self.config.get('max_tokens', 2000)
+        }
+        if stream:
+            data["stream"] = True
+        
+        return headers, data
+    
+    def _get_cache_key(self, data, message, context):
+        """根据请求参数生成响应缓存键"""
+        return make_cache_key(data['model'], data['temperature'], data['max_tokens'],
+                              SYSTEM_PROMPT, context, message)
+    
+    def _prepare_context(self, message, context, selection=None, cursor=None, trim_context=True, history=None):
+        """准备上下文：按相关性裁剪到预算内，并确保提示不超出模型上下文窗口
+        
+        Returns:
+            (上下文, 错误信息)，提示无法放入上下文窗口时错误信息不为None
+        """
+        # 模型上下文窗口需同时容纳提示和 max_tokens 的生成内容
+        available = self.config.get('context_window', 8192) - self.config.get('max_tokens', 2000)
+        base_tokens = self.token_counter.count_messages([
+            {'content': SYSTEM_PROMPT},
+            *(history or []),
+            {'content': message}
+        ])
+        if base_tokens > available:
+            self.usage_tracker.record_event('rejected')
+            return context, f"提示过长：约 {base_tokens} token，超出可用预算 {available} token"
+        
+        if context and trim_context:
+            # 对原始文档只裁剪一次：预算取上下文预算与窗口剩余空间（预留上下文前缀的开销）中较小者
+            window_budget = available - base_tokens - 16
+            limited_by_window = window_budget < self.context_builder.token_budget
+            context, metrics = self.context_builder.build(
+                context, message, selection, cursor,
+                token_budget=window_budget if limited_by_window else None)
+            if metrics['trimmed']:
+                if limited_by_window:
+                    self.usage_tracker.record_event('trimmed')
+                    logger.info(f"上下文超出模型窗口，已裁剪至 {metrics['context_tokens']} token")
+                else:
+                    logger.info(f"上下文已裁剪 - 节省token: {metrics['saved_tokens']}")
+            return context, None
+        
+        context_tokens = self.token_counter.count(context) if context else 0
+        if base_tokens + context_tokens <= available:
+            return context, None
+        
+        self.usage_tracker.record_event('rejected')
+        return context, f"文档过长：提示约 {base_tokens + context_tokens} token，超出可用预算 {available} token"
+    
+    def _record_usage(self, data, result=None, response_content=''):
+        """记录token用量，上游未返回usage时使用本地估算
+        
+        Returns:
+            本次请求的提示token数
+        """
+        usage = (result or {}).get('usage') or {}
+        if usage.get('prompt_tokens') is not None:
+            self.usage_tracker.record(data['model'], usage.get('prompt_tokens', 0),
+                                      usage.get('completion_tokens', 0))
+            return usage.get('prompt_tokens', 0)
+        prompt_tokens = self.token_counter.count_messages(data['messages'])
+        self.usage_tracker.record(data['model'], prompt_tokens,
+                                  self.token_counter.count(response_content), estimated=True)
+        return prompt_tokens
+    
+    def complete(self, messages, max_tokens=None):
+        """直接发送消息列表并返回生成内容（用于摘要等内部任务，不使用缓存）
+        
+        Returns:
+            (生成内容, 错误信息)
+        """
+        error_msg = self._check_config()
+        if error_msg:
+            return None, error_msg
+        
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config['api_key']}"
+        }
+        data = {
+            "model": self.config['model'],
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": max_tokens or self.config.get('max_tokens', 2000)
+        }
+        
+        try:
+            response = self._post(headers, data, self.config.get('timeout', 30))
+            if response.status_code != 200:
+                return None, f"API请求失败: {response.status_code} - {response.text}"
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+        except requests.exceptions.RequestException as e:
+            return None, f"网络请求错误: {str(e)}"
+        except (ValueError, KeyError, IndexError) as e:
+            return None, f"API响应格式不正确: {str(e)}"
+        
+        self._record_usage(data, result, content)
+        return content, None
+    
+    def embed(self, texts, model=None):
+        """调用 /embeddings 接口批量计算文本向量
+        
+        Returns:
+            (向量列表, 错误信息)
+        """
+        error_msg = self._check_config()
+        if error_msg:
+            return None, error_msg
+        
+        session, router = self._ensure_session()
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config['api_key']}"
+        }
+        data = {
+            "model": model or self.config.get('embedding_model'),
+            "input": texts
+        }
+        
+        try:
+            # 与对话请求一样经端点路由（重试、熔断、切换端点），但保留向量模型
+            response = router.request(session, '/embeddings', headers, data, self.config.get('timeout', 30),
+                                      endpoint_model=False)
+            if response.status_code != 200:
+                return None, f"API请求失败: {response.status_code} - {response.text}"
+            items = sorted(response.json()['data'], key=lambda item: item.get('index', 0))
+            vectors = [item['embedding'] for item in items]
+        except requests.exceptions.RequestException as e:
+            return None, f"网络请求错误: {str(e)}"
+        except (ValueError, KeyError, TypeError) as e:
+            return None, f"API响应格式不正确: {str(e)}"
+        
+        if len(vectors) != len(texts):
+            return None, f"API返回的向量数量不匹配: {len(vectors)} != {len(texts)}"
+        return vectors, None
+    
+    def get_usage(self):
+        """获取token用量统计"""
+        return {'tokenizer': self.token_counter.tokenizer_name, **self.usage_tracker.get_usage()}
+    
+    def get_context_stats(self):
+        """获取上下文裁剪统计信息"""
+        return self.context_builder.get_stats()
+    
+    def get_cache_stats(self):
+        """获取响应缓存统计信息"""
+        if self.cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.cache.get_stats()}
+    
+    def chat(self, message, context=None, use_cache=True, selection=None, cursor=None, trim_context=True,
+             history=None, cancel_event=None, deadline=None):
+        """与AI对话
+        
+        Args:
+            message: 用户消息
+            context: 当前Markdown内容
+            use_cache: 是否使用响应缓存，False时绕过缓存直接请求
+            selection: 用户选中的文本，裁剪上下文时始终保留
+            cursor: 光标字符偏移，无选区时保留光标附近内容
+            trim_context: 是否按token预算裁剪上下文
+            history: 此前的对话消息列表（会话模式下不使用响应缓存）
+            cancel_event: 被设置时放弃等待上游响应，返回已取消的结果
+            deadline: 整体截止时间（time.monotonic()），超过后不再重试，None表示只受重试次数限制
+        """
         logger.info(f"开始AI对话 - 消息长度: {len(message)} 字符")
         
+        timeout = self.config.get('timeout', 30)
         try:
             # 检查配置是否完整
-            if not all(key in self.config for key in ['api_key', 'base_url', 'model']):
-                missing_keys = [key for key in ['api_key', 'base_url', 'model'] if key not in self.config]
-                error_msg = f"配置不完整，缺少: {', '.join(missing_keys)}"
+            error_msg = self._check_config()
+            if error_msg:
                 logger.error(error_msg)
                 return {
                     'success': False,
                     'error': error_msg
                 }
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.config['api_key']}"
-            }
-            
-            # 构建消息内容
-            messages = []
-            
-            # 添加系统提示和上下文（如果有）
-            system_prompt = "你是一个专业的Markdown助手，可以帮助用户生成、编辑和优化Markdown内容。"
-            if context:
-                system_prompt += f"\n\n当前Markdown内容：\n{context}"
-            
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # 添加用户消息
-            messages.append({"role": "user", "content": message})
+            context, error_msg = self._prepare_context(message, context, selection, cursor, trim_context, history)
+            if error_msg:
+                logger.error(error_msg)
+                return {
+                    'success': False,
+                    'error': error_msg
+                }
+            headers, data = self._build_request(message, context, history=history)
             
-            # 请求数据
-            data = {
-                "model": self.config['model'],
-                "messages": messages,
-                "temperature": self.config.get('temperature', 0.7),
-                "max_tokens": self.config.get('max_tokens', 2000)
-            }
+            # 查询响应缓存（取一次引用，配置变化时缓存可能被替换为None）
+            cache = self.cache
+            cache_key = None
+            if use_cache and cache is not None and not history:
+                cache_key = self._get_cache_key(data, message, context)
+                cached_response = cache.get(cache_key)
+                if cached_response is not None:
+                    logger.info(f"AI对话命中缓存 - 响应长度: {len(cached_response)} 字符")
+                    return {
+                        'success': True,
+                        'response': cached_response,
+                        'cached': True
+                    }
             
-            timeout = self.config.get('timeout', 30)
             logger.info(f"发送AI请求 - 模型: {self.config['model']}, Base URL: {self.config['base_url']}, 超时: {timeout}秒")
             
-            # 发送请求
-            response = requests.post(
-                f"{self.config['base_url']}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=timeout
-            )
+            # 发送请求（复用连接池中的长连接，失败时重试并切换端点）
+            call = UpstreamCall(lambda: self._post(headers, data, timeout, deadline=deadline), cancel_event)
+            try:
+                response = call.wait_response()
+            finally:
+                call.finish()
+            if response is None:
+                logger.info("AI对话已取消，不再等待上游响应")
+                return dict(CANCELLED_RESULT)
             
             if response.status_code == 200:
                 result = response.json()
                 if 'choices' in result and len(result['choices']) > 0 and 'message' in result['choices'][0]:
                     response_content = result['choices'][0]['message']['content']
                     logger.info(f"AI对话成功 - 响应长度: {len(response_content)} 字符")
+                    prompt_tokens = self._record_usage(data, result, response_content)
+                    if cache_key is not None:
+                        cache.set(cache_key, response_content)
                     return {
                         'success': True,
-                        'response': response_content  # 使用 'response' 而不是 'message' 以匹配前端期望
+                        'response': response_content,  # 使用 'response' 而不是 'message' 以匹配前端期望
+                        'prompt_tokens': prompt_tokens
                     }
                 else:
                     error_msg = f"API响应格式不正确: {result}"
@@ -124,4 +672,140 @@ class AIService:
             return {
                 'success': False,
                 'error': error_msg
-            }
\ No newline at end of file
+            }
+    
+    def chat_stream(self, message, context=None, use_cache=True, selection=None, cursor=None, trim_context=True,
+                    history=None, cancel_event=None):
+        """流式AI对话
+
+        调用兼容OpenAI的接口并设置 stream=True，逐个产出事件字典：
+        {'type': 'token', 'content': ...}、{'type': 'done', 'response': 完整内容, 'prompt_tokens': 提示token数}
+        或 {'type': 'error', 'error': ...}。
+        生成器被关闭时（例如客户端断开）会关闭上游响应，终止上游生成；cancel_event 被设置时
+        （包括等待响应头期间）同样立即停止，产出 cancelled 为True的错误事件。
+        """
+        logger.info(f"开始流式AI对话 - 消息长度: {len(message)} 字符")
+        
+        error_msg = self._check_config()
+        if error_msg:
+            logger.error(error_msg)
+            yield {'type': 'error', 'error': error_msg}
+            return
+        
+        # 响应头此时已发出，准备上下文时的异常（如无效的 cursor）也须以错误事件返回
+        try:
+            context, error_msg = self._prepare_context(message, context, selection, cursor, trim_context, history)
+        except Exception as e:
+            context, error_msg = None, f"处理错误: {str(e)}"
+        if error_msg:
+            logger.error(error_msg)
+            yield {'type': 'error', 'error': error_msg}
+            return
+        headers, data = self._build_request(message, context, stream=True, history=history)
+        timeout = self.config.get('timeout', 30)
+        
+        # 命中缓存时直接以单个片段返回完整内容
+        cache = self.cache
+        cache_key = None
+        if use_cache and cache is not None and not history:
+            cache_key = self._get_cache_key(data, message, context)
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                logger.info(f"流式AI对话命中缓存 - 响应长度: {len(cached_response)} 字符")
+                yield {'type': 'token', 'content': cached_response}
+                yield {'type': 'done', 'response': cached_response, 'cached': True}
+                return
+        
+        logger.info(f"发送流式AI请求 - 模型: {self.config['model']}, Base URL: {self.config['base_url']}, 超时: {timeout}秒")
+        
+        response = None
+        call = None
+        chunks = []
+        usage = None
+        completed = False
+        start = time.perf_counter()
+        try:
+            call = UpstreamCall(lambda: self._post(headers, data, timeout, stream=True), cancel_event,
+                                stream=True)
+            response = call.wait_response()
+            if response is None:
+                logger.info("流式AI对话已取消，不再等待上游响应")
+                yield dict(CANCELLED_RESULT, type='error')
+                return
+            
+            if response.status_code != 200:
+                error_msg = f"API请求失败: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                yield {'type': 'error', 'error': error_msg}
+                return
+            
+            for raw_line in response.iter_lines():
+                # SSE固定使用UTF-8；响应头未声明charset时requests会按ISO-8859-1解码，因此按字节读取后自行解码
+                line = raw_line.decode('utf-8')
+                # SSE格式：每个事件以 "data: " 开头，以 [DONE] 结束
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+                
+                chunk = json.loads(payload)
+                # 部分服务会在最后的分片中返回usage
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    chunks.append(content)
+                    yield {'type': 'token', 'content': content}
+            
+            response_content = ''.join(chunks)
+            completed = True
+            logger.info(f"流式AI对话成功 - 响应长度: {len(response_content)} 字符")
+            prompt_tokens = self._record_usage(data, {'usage': usage}, response_content)
+            if cache_key is not None:
+                cache.set(cache_key, response_content)
+            yield {'type': 'done', 'response': response_content, 'prompt_tokens': prompt_tokens}
+        
+        except Exception as e:
+            # 取消时由监视线程关闭响应，读取随之抛出异常
+            if call is not None and call.cancelled():
+                logger.info("流式AI对话已取消，上游响应已关闭")
+                yield dict(CANCELLED_RESULT, type='error')
+                return
+            if isinstance(e, requests.exceptions.Timeout):
+                error_msg = f"请求超时 (超过 {timeout} 秒)"
+            elif isinstance(e, requests.exceptions.RequestException):
+                error_msg = f"网络请求错误: {str(e)}"
+            elif isinstance(e, ValueError):
+                error_msg = f"流式响应解析失败: {str(e)}"
+            else:
+                raise
+            logger.error(error_msg)
+            yield {'type': 'error', 'error': error_msg}
+        finally:
+            if call is not None:
+                call.finish()
+            if response is not None:
+                # 关闭上游连接；未读完时连接不会归还连接池，上游随之停止生成
+                response.close()
+            if not completed and chunks:
+                logger.info(f"流式AI对话已取消 - 已接收 {len(chunks)} 个片段")
+                # 已生成的部分同样计费，按估算记录
+                self._record_usage(data, None, ''.join(chunks))
+            AI_STREAM_DURATION.observe(time.perf_counter() - start,
+                                       'completed' if completed else 'cancelled' if chunks else 'error')
+    
+    def run_job(self, message, context=None, cancel_event=None, **options):
+        """在AI任务队列中执行对话（非流式请求），返回与 chat 相同格式的结果
+        
+        cancel_event 被设置时不再等待上游响应，任务立即结束
+        """
+        return self.chat(message, context, cancel_event=cancel_event, **options)
+    
+    def run_stream_job(self, message, context=None, cancel_event=None, on_event=None, **options):
+        """在AI任务队列中执行流式对话：每个事件交给 on_event，返回与 chat 相同格式的结果"""
+        return consume_events(self.chat_stream(message, context, cancel_event=cancel_event, **options),
+                              cancel_event, on_event)
\ No newline at end of file
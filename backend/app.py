@@ -4,16 +4,30 @@
 Flask应用主文件
 """
 
-from flask import Flask, request, jsonify, send_from_directory, render_template, send_file
+from flask import Flask, request, jsonify, send_from_directory, render_template, send_file, Response
 from flask_cors import CORS
 import os
 import sys
+import math
+import time
 import logging
 import json
+import queue
+import functools
 from backend.database import DBManager
 from backend.ai_service import AIService
-from backend.config_manager import ConfigManager
+from backend.ai_jobs import AIJobQueue, QueueFullError
+from backend.ai_batch import BatchManager
+from backend.rate_limiter import RateLimiter
+from backend.config import Config
+from backend.chat_sessions import ChatSessionManager
+from backend.embedding_index import EmbeddingIndex
+from backend.config_manager import get_config_manager as get_shared_config_manager
 from backend.log_manager import LogManager
+from backend.access_log import AccessLogMiddleware
+from backend.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from backend.db_trace import tracer as db_tracer
+from backend.renderer import MarkdownRenderer
 
 # 配置日志
 logger = logging.getLogger('app')
@@ -58,11 +72,20 @@ def create_app():
     # 启用CORS，明确允许所有HTTP方法
     CORS(app, methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
     
+    # 访问日志：记录每个请求的方法、路由、状态码、响应大小和耗时
+    AccessLogMiddleware(app)
+    
     # 全局变量，用于存储管理器实例
     app.db_manager = None
     app.ai_service = None
     app.config_manager = None
     app.log_manager = None
+    app.renderer = None
+    app.ai_jobs = None
+    app.batch_manager = None
+    app.chat_sessions = None
+    app.embedding_index = None
+    app.rate_limiter = None
     
     # 延迟初始化函数
     def get_db_manager():
@@ -80,7 +103,7 @@ def create_app():
     def get_config_manager():
         if app.config_manager is None:
             logger.info("正在初始化配置管理器...")
-            app.config_manager = ConfigManager()
+            app.config_manager = get_shared_config_manager()
         return app.config_manager
     
     def get_log_manager():
@@ -89,6 +112,171 @@ def create_app():
             app.log_manager = LogManager()
         return app.log_manager
     
+    def get_ai_jobs():
+        if app.ai_jobs is None:
+            logger.info("正在初始化AI任务队列...")
+            app.ai_jobs = AIJobQueue()
+        return app.ai_jobs
+    
+    def get_batch_manager():
+        if app.batch_manager is None:
+            logger.info("正在初始化AI批量任务管理器...")
+            app.batch_manager = BatchManager(get_db_manager(), get_ai_service(),
+                                             on_documents_changed=lambda doc_ids: get_embedding_index().schedule(doc_ids))
+        return app.batch_manager
+    
+    def get_chat_sessions():
+        if app.chat_sessions is None:
+            logger.info("正在初始化AI对话会话管理器...")
+            app.chat_sessions = ChatSessionManager(get_db_manager(), get_ai_service())
+        return app.chat_sessions
+    
+    def get_embedding_index():
+        if app.embedding_index is None:
+            logger.info("正在初始化向量索引...")
+            # AI服务由索引的后台线程首次使用时创建，保存文档的请求不必等待其初始化
+            app.embedding_index = EmbeddingIndex(get_db_manager(), get_ai_service)
+        return app.embedding_index
+    
+    def get_rate_limiter():
+        if app.rate_limiter is None:
+            logger.info("正在初始化AI限流器...")
+            app.rate_limiter = RateLimiter()
+        return app.rate_limiter
+    
+    def get_renderer():
+        if app.renderer is None:
+            logger.info("正在初始化Markdown渲染器...")
+            app.renderer = MarkdownRenderer()
+        return app.renderer
+    
+    def sse_response(events):
+        """将AI流式事件转换为Server-Sent Events响应
+        
+        客户端断开时服务器会关闭响应迭代器，这里随之关闭事件生成器以终止上游请求
+        """
+        def generate():
+            try:
+                for event in events:
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            finally:
+                events.close()
+        
+        # 进行中的流式请求计入积压，响应关闭时（含客户端断开）释放
+        rate_limiter = get_rate_limiter()
+        rate_limiter.stream_started()
+        response = Response(generate(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(rate_limiter.stream_finished)
+        return response
+    
+    def ai_rate_limited(view):
+        """AI接口限流：超出客户端或全局速率时返回429，积压超过阈值时直接返回503，均附带Retry-After"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            rate_limiter = get_rate_limiter()
+            # 按连接地址区分客户端；仅当请求来自配置的可信代理时才采用代理传入的 X-Client-ID
+            client_id = request.remote_addr or 'unknown'
+            if client_id in Config.AI_TRUSTED_PROXIES:
+                client_id = request.headers.get('X-Client-ID') or client_id
+            
+            allowed, wait, scope = rate_limiter.check(client_id)
+            if not allowed:
+                retry_after = max(math.ceil(wait), 1)
+                logger.warning(f"AI请求被限流 - 客户端: {client_id}, 范围: {scope}, 建议等待: {retry_after}秒")
+                error = '请求过于频繁，请稍后重试' if scope == 'client' else 'AI服务繁忙，请稍后重试'
+                return jsonify({'success': False, 'error': error, 'retry_after': retry_after}), 429, \
+                    {'Retry-After': str(retry_after)}
+            
+            threshold = Config.AI_QUEUE_REJECT_THRESHOLD
+            if threshold:
+                ai_jobs = get_ai_jobs()
+                # 流式请求同样经任务队列执行，排队与执行中的任务即为全部积压
+                stats = ai_jobs.get_stats()
+                backlog = stats['queued'] + stats['running']
+                if backlog >= threshold:
+                    rate_limiter.record_queue_rejection()
+                    retry_after = max(math.ceil(ai_jobs.estimate_wait()), 1)
+                    logger.warning(f"AI请求积压过多，拒绝请求 - 积压: {backlog}, 阈值: {threshold}")
+                    return jsonify({'success': False, 'error': 'AI请求积压过多，请稍后重试',
+                                    'retry_after': retry_after}), 503, {'Retry-After': str(retry_after)}
+            
+            # 任务队列已满时的503响应同样附带Retry-After
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 503 and response.is_json and 'Retry-After' not in response.headers:
+                retry_after = (response.get_json() or {}).get('retry_after')
+                if retry_after:
+                    response.headers['Retry-After'] = str(retry_after)
+            return response
+        return wrapper
+    
+    def execute_ai_job(kind, task, run_async=False):
+        """通过AI任务队列执行请求
+        
+        Args:
+            task: 接收 (cancel_event, deadline) 的可调用对象，deadline 为上游请求的整体截止时间，异步模式下为None
+        
+        Returns:
+            (结果字典, HTTP状态码)；异步模式下立即返回任务ID
+        """
+        ai_jobs = get_ai_jobs()
+        # 同步模式下请求线程最多等待 timeout 秒；上游重试与退避在等待结束前截止，不在无人等待时继续占用上游
+        timeout = get_ai_service().config.get('timeout', 30) + 10
+        deadline = None if run_async else time.monotonic() + timeout - Config.AI_SYNC_DEADLINE_MARGIN
+        try:
+            job = ai_jobs.submit(lambda cancel_event: task(cancel_event, deadline), kind)
+        except QueueFullError as e:
+            logger.warning(f"AI任务提交失败 - {str(e)}")
+            get_rate_limiter().record_queue_rejection()
+            return {'success': False, 'error': str(e), 'retry_after': max(math.ceil(ai_jobs.estimate_wait()), 1)}, 503
+        
+        if run_async:
+            return {'success': True, 'job_id': job.id, 'status': job.status}, 202
+        
+        # 同步模式：在请求线程中等待任务完成，超时则取消任务
+        if not ai_jobs.wait(job, timeout):
+            ai_jobs.cancel(job.id)
+            return {'success': False, 'error': f'AI任务等待超时 (超过 {timeout} 秒)'}, 504
+        return job.result, 200
+    
+    def stream_ai_job(kind, task):
+        """通过AI任务队列执行流式请求，任务产生的事件经内存队列转发为SSE响应
+        
+        Args:
+            task: 接收 (cancel_event, on_event) 的可调用对象
+        
+        客户端断开时取消任务（排队中的任务直接出队，执行中的任务关闭上游响应）
+        """
+        ai_jobs = get_ai_jobs()
+        events = queue.Queue()
+        try:
+            job = ai_jobs.submit(lambda cancel_event: task(cancel_event, events.put), kind)
+        except QueueFullError as e:
+            logger.warning(f"AI任务提交失败 - {str(e)}")
+            get_rate_limiter().record_queue_rejection()
+            return jsonify({'success': False, 'error': str(e),
+                            'retry_after': max(math.ceil(ai_jobs.estimate_wait()), 1)}), 503
+        return sse_response(job_events(ai_jobs, job, events))
+    
+    def job_events(ai_jobs, job, events):
+        """依次产出任务转发的事件，任务结束但未产出结束事件时（如排队中被取消、执行异常）补一个错误事件"""
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=0.5)
+                except queue.Empty:
+                    if job.done_event.is_set() and events.empty():
+                        result = job.result or {}
+                        if not result.get('success'):
+                            yield {'type': 'error', 'error': result.get('error') or '任务已结束'}
+                        return
+                    continue
+                yield event
+                if event.get('type') in ('done', 'error'):
+                    return
+        finally:
+            ai_jobs.cancel(job.id)
+    
     logger.info("Flask应用创建完成")
     
     # 路由：主页
@@ -130,6 +318,7 @@ def create_app():
         logger.info(f"保存文档 - 标题: {title}, ID: {doc_id}")
         db_manager = get_db_manager()
         document_id = db_manager.save_document(title, content, doc_id)
+        get_embedding_index().schedule([document_id])
         logger.info(f"文档保存成功 - 新ID: {document_id}")
         return jsonify({'success': True, 'id': document_id})
     
@@ -152,6 +341,7 @@ def create_app():
             
             # 更新文档
             document_id = db_manager.save_document(title, content, doc_id)
+            get_embedding_index().schedule([document_id])
             logger.info(f"文档更新成功 - ID: {document_id}")
             return jsonify({'success': True, 'id': document_id})
         except Exception as e:
@@ -164,6 +354,7 @@ def create_app():
         logger.info(f"删除文档 ID: {doc_id}")
         db_manager = get_db_manager()
         db_manager.delete_document(doc_id)
+        get_embedding_index().schedule([doc_id])
         logger.info(f"文档 ID: {doc_id} 删除成功")
         return jsonify({'success': True})
     
@@ -185,15 +376,13 @@ def create_app():
         logger.info("AI配置获取成功")
         return jsonify({'success': True, 'config': config})
     
-    # 路由：更新AI配置
+    # 路由：更新AI配置（合并更新，AI服务通过配置订阅获得新配置）
     @app.route('/api/config', methods=['POST'])
     def update_config():
         data = request.json
         logger.info("更新AI配置")
-        ai_service = get_ai_service()
         config_manager = get_config_manager()
-        ai_service.update_config(data)
-        config_manager.save_config(data)
+        config_manager.update_config(data)
         logger.info("AI配置更新成功")
         return jsonify({'success': True})
     
@@ -220,22 +409,20 @@ def create_app():
         data = request.json
         logger.info("更新所有设置")
         
-        # 分离AI配置和应用配置
-        ai_config_keys = ['api_key', 'base_url', 'model', 'temperature', 'max_tokens']
+        # 分离AI配置和应用配置（AI配置项以默认AI配置的键为准）
+        ai_config_keys = set(Config.OPENAI_CONFIG) | {'endpoints'}
         ai_config = {k: v for k, v in data.items() if k in ai_config_keys}
         app_config = {k: v for k, v in data.items() if k not in ai_config_keys}
         
-        # 更新AI配置
+        # 只提交的配置项合并到已保存的配置中，其余配置项保持不变；
+        # AI服务订阅了配置变化，无需再单独更新
+        config_manager = get_config_manager()
         if ai_config:
-            ai_service = get_ai_service()
-            ai_service.update_config(ai_config)
-            config_manager = get_config_manager()
-            config_manager.save_config(ai_config)
+            config_manager.update_config(ai_config)
         
         # 更新应用配置
         if app_config:
-            config_manager = get_config_manager()
-            config_manager.save_app_config(app_config)
+            config_manager.update_app_config(app_config)
         
         logger.info("所有设置更新成功")
         return jsonify({'success': True})
@@ -255,24 +442,17 @@ def create_app():
                 logger.warning("测试连接失败 - API密钥为空")
                 return jsonify({'success': False, 'error': 'API密钥不能为空'}), 400
             
-            # 创建临时AI服务实例进行测试
-            temp_config = {
-                'api_key': api_key,
-                'base_url': base_url,
-                'model': model
-            }
-            temp_ai_service = AIService()
-            temp_ai_service.update_config(temp_config)
-            
-            # 发送测试消息
-            test_result = temp_ai_service.chat("测试连接", "")
+            # 轻量探测：复用连接池，不修改、不保存已持久化的配置
+            ai_service = get_ai_service()
+            test_result = ai_service.probe(api_key, base_url, model)
             
             if test_result.get('success'):
                 logger.info("AI连接测试成功")
-                return jsonify({'success': True, 'message': '连接成功'})
+                return jsonify({'success': True, 'message': '连接成功', 'timings': test_result['timings']})
             else:
                 logger.error(f"AI连接测试失败 - 错误: {test_result.get('error')}")
-                return jsonify({'success': False, 'error': test_result.get('error', '连接失败')}), 400
+                return jsonify({'success': False, 'error': test_result.get('error', '连接失败'),
+                                'timings': test_result.get('timings')}), 400
                 
         except Exception as e:
             logger.error(f"AI连接测试异常: {str(e)}")
@@ -293,17 +473,22 @@ def create_app():
         data = request.json
         logger.info("更新应用配置")
         config_manager = get_config_manager()
-        config_manager.save_app_config(data)
+        config_manager.update_app_config(data)
         logger.info("应用配置更新成功")
         return jsonify({'success': True})
     
     # 路由：AI对话
     @app.route('/api/chat', methods=['POST'])
+    @ai_rate_limited
     def chat():
         try:
             data = request.json
             message = data.get('message', '')
             context = data.get('context', '')
+            use_cache = data.get('use_cache', True)
+            selection = data.get('selection')
+            cursor = data.get('cursor')
+            session_id = data.get('session_id')
             
             logger.info(f"AI对话请求 - 消息长度: {len(message)} 字符")
             
@@ -312,72 +497,429 @@ def create_app():
                 return jsonify({'success': False, 'error': '消息不能为空'}), 400
             
             ai_service = get_ai_service()
-            result = ai_service.chat(message, context)
+            
+            # 会话模式：携带服务端保存的历史对话（较早轮次以摘要形式）
+            if session_id:
+                chat_sessions = get_chat_sessions()
+                if chat_sessions.get(session_id) is None:
+                    logger.warning(f"AI对话请求失败 - 会话不存在: {session_id}")
+                    return jsonify({'success': False, 'error': '会话不存在'}), 404
+                
+                if data.get('stream'):
+                    logger.info(f"AI会话对话请求使用流式响应 - 会话ID: {session_id}")
+                    task = lambda cancel_event, on_event: chat_sessions.run_stream_job(
+                        session_id, message, context, cancel_event, on_event, selection=selection, cursor=cursor)
+                    return stream_ai_job('chat', task)
+                
+                task = lambda cancel_event, deadline: chat_sessions.run_job(
+                    session_id, message, context, cancel_event, selection=selection, cursor=cursor, deadline=deadline)
+                result, status = execute_ai_job('chat', task, data.get('async', False))
+                
+                if result.get('success'):
+                    logger.info(f"AI会话对话请求成功 - 会话ID: {session_id}")
+                else:
+                    logger.error(f"AI会话对话请求失败 - 错误: {result.get('error')}")
+                
+                return jsonify(result), status
+            
+            # 流式模式（可选）：以SSE逐个返回token
+            if data.get('stream'):
+                logger.info("AI对话请求使用流式响应")
+                task = lambda cancel_event, on_event: ai_service.run_stream_job(
+                    message, context, cancel_event, on_event,
+                    use_cache=use_cache, selection=selection, cursor=cursor)
+                return stream_ai_job('chat', task)
+            
+            # 通过AI任务队列执行，async为真时立即返回任务ID
+            task = lambda cancel_event, deadline: ai_service.run_job(
+                message, context, cancel_event,
+                use_cache=use_cache, selection=selection, cursor=cursor, deadline=deadline)
+            result, status = execute_ai_job('chat', task, data.get('async', False))
             
             if result.get('success'):
                 logger.info("AI对话请求成功")
             else:
                 logger.error(f"AI对话请求失败 - 错误: {result.get('error')}")
             
-            return jsonify(result)
+            return jsonify(result), status
         except Exception as e:
             logger.error(f"AI对话处理异常: {str(e)}")
             return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
     
     # 路由：AI编辑
     @app.route('/api/edit', methods=['POST'])
+    @ai_rate_limited
     def edit():
         try:
             data = request.json
             message = data.get('message', '')
             context = data.get('context', '')
+            use_cache = data.get('use_cache', True)
+            selection = data.get('selection')
+            cursor = data.get('cursor')
+            # 编辑结果可能整体替换文档，默认不裁剪上下文
+            trim_context = data.get('trim_context', False)
             
             logger.info(f"AI编辑请求 - 消息长度: {len(message)} 字符")
-            print(f"DEBUG: AI编辑请求 - 消息: {message}, 上下文长度: {len(context)}")
+            logger.debug(f"AI编辑请求 - 消息: {message}, 上下文长度: {len(context)}")
             
             if not message:
                 logger.warning("AI编辑请求失败 - 消息为空")
                 return jsonify({'success': False, 'error': '消息不能为空'}), 400
             
             ai_service = get_ai_service()
-            result = ai_service.chat(message, context)
-            print(f"DEBUG: AI服务响应: {result}")
+            
+            # 流式模式（可选）：以SSE逐个返回token
+            if data.get('stream'):
+                logger.info("AI编辑请求使用流式响应")
+                task = lambda cancel_event, on_event: ai_service.run_stream_job(
+                    message, context, cancel_event, on_event,
+                    use_cache=use_cache, selection=selection, cursor=cursor, trim_context=trim_context)
+                return stream_ai_job('edit', task)
+            
+            # 通过AI任务队列执行，async为真时立即返回任务ID
+            task = lambda cancel_event, deadline: ai_service.run_job(
+                message, context, cancel_event,
+                use_cache=use_cache, selection=selection, cursor=cursor, trim_context=trim_context, deadline=deadline)
+            result, status = execute_ai_job('edit', task, data.get('async', False))
+            logger.debug(f"AI服务响应: {result}")
             
             if result.get('success'):
                 logger.info("AI编辑请求成功")
             else:
                 logger.error(f"AI编辑请求失败 - 错误: {result.get('error')}")
             
-            return jsonify(result)
+            return jsonify(result), status
         except Exception as e:
             logger.error(f"AI编辑处理异常: {str(e)}")
-            print(f"DEBUG: AI编辑处理异常: {str(e)}")
             return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
     
+    # 路由：获取AI响应缓存统计
+    @app.route('/api/ai/cache', methods=['GET'])
+    def get_ai_cache_stats():
+        logger.info("获取AI响应缓存统计")
+        ai_service = get_ai_service()
+        stats = ai_service.get_cache_stats()
+        return jsonify({'success': True, 'stats': stats})
+    
+    # 路由：获取上下文裁剪统计
+    @app.route('/api/ai/context-stats', methods=['GET'])
+    def get_ai_context_stats():
+        logger.info("获取上下文裁剪统计")
+        ai_service = get_ai_service()
+        stats = ai_service.get_context_stats()
+        return jsonify({'success': True, 'stats': stats})
+    
+    # 路由：获取token用量统计
+    @app.route('/api/ai/usage', methods=['GET'])
+    def get_ai_usage():
+        logger.info("获取token用量统计")
+        ai_service = get_ai_service()
+        usage = ai_service.get_usage()
+        return jsonify({'success': True, 'usage': usage})
+    
+    # 路由：获取AI端点路由统计
+    @app.route('/api/ai/endpoints', methods=['GET'])
+    def get_ai_endpoints():
+        logger.info("获取AI端点路由统计")
+        ai_service = get_ai_service()
+        return jsonify({'success': True, 'stats': ai_service.get_router_stats()})
+    
+    # 路由：清空AI响应缓存
+    @app.route('/api/ai/cache/clear', methods=['POST'])
+    def clear_ai_cache():
+        logger.info("清空AI响应缓存")
+        ai_service = get_ai_service()
+        if ai_service.cache is None:
+            return jsonify({'success': False, 'error': 'AI响应缓存未启用'}), 400
+        ai_service.cache.clear()
+        return jsonify({'success': True})
+    
+    # 路由：获取AI限流状态
+    @app.route('/api/ai/rate-limit', methods=['GET'])
+    def get_ai_rate_limit():
+        stats = get_rate_limiter().get_stats()
+        stats['queue'] = get_ai_jobs().get_stats()
+        stats['queue_reject_threshold'] = Config.AI_QUEUE_REJECT_THRESHOLD
+        return jsonify({'success': True, 'stats': stats})
+    
+    # 路由：获取AI任务队列状态
+    @app.route('/api/ai/jobs', methods=['GET'])
+    def get_ai_jobs_stats():
+        logger.info("获取AI任务队列状态")
+        ai_jobs = get_ai_jobs()
+        return jsonify({'success': True, 'stats': ai_jobs.get_stats()})
+    
+    # 路由：获取AI任务状态和结果
+    @app.route('/api/ai/jobs/<job_id>', methods=['GET'])
+    def get_ai_job(job_id):
+        ai_jobs = get_ai_jobs()
+        job = ai_jobs.get(job_id)
+        if job is None:
+            logger.warning(f"AI任务不存在 - ID: {job_id}")
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        return jsonify({'success': True, 'job': job.to_dict()})
+    
+    # 路由：取消AI任务
+    @app.route('/api/ai/jobs/<job_id>/cancel', methods=['POST'])
+    def cancel_ai_job(job_id):
+        logger.info(f"取消AI任务 - ID: {job_id}")
+        ai_jobs = get_ai_jobs()
+        job = ai_jobs.cancel(job_id)
+        if job is None:
+            logger.warning(f"AI任务不存在 - ID: {job_id}")
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        return jsonify({'success': True, 'job': job.to_dict(include_result=False)})
+    
+    # 路由：创建AI对话会话
+    @app.route('/api/chat/sessions', methods=['POST'])
+    def create_chat_session():
+        try:
+            data = request.json or {}
+            session = get_chat_sessions().create(data.get('title'))
+            logger.info(f"AI对话会话创建成功 - ID: {session['id']}")
+            return jsonify({'success': True, 'session': session})
+        except Exception as e:
+            logger.error(f"创建AI对话会话异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：获取AI对话会话列表（含内存与提示长度统计）
+    @app.route('/api/chat/sessions', methods=['GET'])
+    def get_chat_session_list():
+        try:
+            chat_sessions = get_chat_sessions()
+            return jsonify({
+                'success': True,
+                'sessions': chat_sessions.get_sessions(),
+                'stats': chat_sessions.get_stats()
+            })
+        except Exception as e:
+            logger.error(f"获取AI对话会话列表异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：获取AI对话会话
+    @app.route('/api/chat/sessions/<session_id>', methods=['GET'])
+    def get_chat_session(session_id):
+        try:
+            include_messages = request.args.get('messages', 'false').lower() == 'true'
+            session = get_chat_sessions().get(session_id, include_messages)
+            if session is None:
+                return jsonify({'success': False, 'error': '会话不存在'}), 404
+            return jsonify({'success': True, 'session': session})
+        except Exception as e:
+            logger.error(f"获取AI对话会话异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：删除AI对话会话
+    @app.route('/api/chat/sessions/<session_id>', methods=['DELETE'])
+    def delete_chat_session(session_id):
+        try:
+            if not get_chat_sessions().delete(session_id):
+                return jsonify({'success': False, 'error': '会话不存在'}), 404
+            logger.info(f"AI对话会话删除成功 - ID: {session_id}")
+            return jsonify({'success': True})
+        except Exception as e:
+            logger.error(f"删除AI对话会话异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：创建AI批量任务
+    @app.route('/api/ai/batches', methods=['POST'])
+    @ai_rate_limited
+    def create_ai_batch():
+        try:
+            data = request.json
+            document_ids = data.get('document_ids', [])
+            prompt = data.get('prompt', '')
+            write_mode = data.get('write_mode', 'none')
+            
+            # document_ids 为 'all' 或文档ID（整数）列表
+            if document_ids != 'all' and not (
+                    isinstance(document_ids, list) and
+                    all(isinstance(doc_id, int) and not isinstance(doc_id, bool) for doc_id in document_ids)):
+                logger.warning(f"创建AI批量任务失败 - 文档ID列表格式不正确: {document_ids!r}")
+                return jsonify({'success': False, 'error': "document_ids 必须为 'all' 或文档ID列表"}), 400
+            
+            logger.info(f"创建AI批量任务 - 文档数: {'全部' if document_ids == 'all' else len(document_ids)}, 写回方式: {write_mode}")
+            
+            if not prompt:
+                logger.warning("创建AI批量任务失败 - 提示模板为空")
+                return jsonify({'success': False, 'error': '提示模板不能为空'}), 400
+            
+            if document_ids == 'all':
+                document_ids = [doc['id'] for doc in get_db_manager().get_all_documents()]
+            if not document_ids:
+                logger.warning("创建AI批量任务失败 - 未选择文档")
+                return jsonify({'success': False, 'error': '请选择至少一篇文档'}), 400
+            
+            batch_manager = get_batch_manager()
+            batch_id = batch_manager.create(document_ids, prompt, write_mode)
+            logger.info(f"AI批量任务已启动 - ID: {batch_id}")
+            return jsonify({'success': True, 'batch_id': batch_id}), 202
+        except ValueError as e:
+            logger.warning(f"创建AI批量任务失败 - {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"创建AI批量任务异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：获取AI批量任务列表
+    @app.route('/api/ai/batches', methods=['GET'])
+    def get_ai_batches():
+        logger.info("获取AI批量任务列表")
+        batches = get_db_manager().get_ai_batches()
+        return jsonify({'success': True, 'batches': batches})
+    
+    # 路由：获取AI批量任务进度和结果
+    @app.route('/api/ai/batches/<batch_id>', methods=['GET'])
+    def get_ai_batch(batch_id):
+        logger.info(f"获取AI批量任务 - ID: {batch_id}")
+        include_items = request.args.get('items', 'false').lower() == 'true'
+        batch = get_db_manager().get_ai_batch(batch_id, include_items)
+        if batch is None:
+            return jsonify({'success': False, 'error': '批量任务不存在'}), 404
+        return jsonify({'success': True, 'batch': batch})
+    
+    # 路由：继续执行中断或取消的AI批量任务
+    @app.route('/api/ai/batches/<batch_id>/resume', methods=['POST'])
+    def resume_ai_batch(batch_id):
+        logger.info(f"继续AI批量任务 - ID: {batch_id}")
+        batch_manager = get_batch_manager()
+        if not batch_manager.start(batch_id):
+            return jsonify({'success': False, 'error': '批量任务不存在或正在运行'}), 400
+        return jsonify({'success': True, 'batch_id': batch_id}), 202
+    
+    # 路由：取消AI批量任务
+    @app.route('/api/ai/batches/<batch_id>/cancel', methods=['POST'])
+    def cancel_ai_batch(batch_id):
+        logger.info(f"取消AI批量任务 - ID: {batch_id}")
+        batch_manager = get_batch_manager()
+        if not batch_manager.cancel(batch_id):
+            return jsonify({'success': False, 'error': '批量任务未在运行'}), 400
+        return jsonify({'success': True})
+    
     # 路由：渲染Markdown
     @app.route('/api/render', methods=['POST'])
     def render_markdown():
-        import markdown
-        from markdown.extensions import tables, toc
-        
         data = request.json
         content = data.get('content', '')
         
         logger.info(f"渲染Markdown - 内容长度: {len(content)} 字符")
         
-        # 配置Markdown扩展（移除代码高亮）
-        extensions = [
-            'tables',
-            'toc',
-            'fenced_code'
-        ]
+        renderer = get_renderer()
         
-        # 渲染Markdown
-        html = markdown.markdown(content, extensions=extensions)
+        # 分段渲染模式：仅返回分段索引，分段内容通过 /api/render/sections 按需获取
+        if data.get('paginate'):
+            split_level = data.get('split_level')
+            if split_level is not None and not (isinstance(split_level, int) and 1 <= split_level <= 6):
+                logger.warning(f"Markdown分段渲染失败 - 切分级别无效: {split_level!r}")
+                return jsonify({'success': False, 'error': 'split_level 必须为 1-6 的整数'}), 400
+            index = renderer.paginate(content, split_level)
+            logger.info(f"Markdown分段索引生成成功 - 分段数: {index['total']}")
+            return jsonify({'success': True, 'paginated': True, **index})
         
-        logger.info("Markdown渲染成功")
+        # 渲染Markdown（按内容哈希缓存）
+        html, cached = renderer.render(content)
+        
+        logger.info(f"Markdown渲染成功 - 缓存命中: {cached}")
         return jsonify({'success': True, 'html': html})
     
+    # 路由：按需渲染分段（NDJSON流，每行一个分段）
+    @app.route('/api/render/sections', methods=['POST'])
+    def render_sections():
+        data = request.json
+        document_key = data.get('hash', '')
+        start = data.get('start', 0)
+        count = data.get('count')
+        
+        if not isinstance(start, int) or start < 0 or (count is not None and (not isinstance(count, int) or count < 1)):
+            logger.warning(f"渲染Markdown分段失败 - 参数无效, 起始: {start!r}, 数量: {count!r}")
+            return jsonify({'success': False, 'error': 'start 必须为非负整数，count 必须为正整数'}), 400
+        
+        logger.info(f"渲染Markdown分段 - 哈希: {document_key}, 起始: {start}, 数量: {count}")
+        renderer = get_renderer()
+        sections = renderer.render_sections(document_key, start, count)
+        
+        if sections is None:
+            logger.info(f"分段文档缓存未命中 - 哈希: {document_key}")
+            return jsonify({'success': False, 'error': '分段文档已过期，请重新提交内容'}), 404
+        
+        def generate():
+            for section in sections:
+                yield json.dumps(section, ensure_ascii=False) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+    
+    # 路由：获取文档大纲
+    @app.route('/api/outline', methods=['POST'])
+    def get_outline():
+        data = request.json
+        content = data.get('content')
+        content_key = data.get('hash')
+        
+        if content is None and not content_key:
+            logger.warning("获取大纲失败 - 缺少内容或哈希")
+            return jsonify({'success': False, 'error': '缺少内容或内容哈希'}), 400
+        
+        renderer = get_renderer()
+        outline, cached = renderer.get_outline(content, content_key)
+        
+        if outline is None:
+            # 仅提供哈希但缓存已失效，需要客户端重新提交内容
+            logger.info(f"大纲缓存未命中 - 哈希: {content_key}")
+            return jsonify({'success': False, 'error': '大纲缓存未命中，请提交文档内容'}), 404
+        
+        logger.info(f"获取大纲成功 - 缓存命中: {cached}")
+        return jsonify({'success': True, 'outline': outline, 'cached': cached})
+    
+    # 路由：语义检索文档
+    @app.route('/api/search/semantic', methods=['POST'])
+    @ai_rate_limited
+    def semantic_search():
+        try:
+            data = request.json or {}
+            query = data.get('query') or ''
+            top_k = data.get('top_k', 10)
+            
+            if not isinstance(query, str) or not query.strip():
+                logger.warning("语义检索失败 - 查询为空")
+                return jsonify({'success': False, 'error': '查询不能为空'}), 400
+            if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+                logger.warning(f"语义检索失败 - 结果数无效: {top_k!r}")
+                return jsonify({'success': False, 'error': 'top_k 必须为正整数'}), 400
+            query = query.strip()
+            top_k = min(top_k, 50)
+            
+            results, error_msg = get_embedding_index().search(query, top_k)
+            if error_msg:
+                logger.error(f"语义检索失败 - 错误: {error_msg}")
+                return jsonify({'success': False, 'error': error_msg}), 503
+            
+            db_manager = get_db_manager()
+            documents = []
+            for result in results:
+                document = db_manager.get_document(result['id'])
+                if document:
+                    documents.append({'id': document['id'], 'title': document['title'],
+                                      'updated_at': document['updated_at'], 'score': result['score']})
+            
+            logger.info(f"语义检索成功 - 结果数: {len(documents)}")
+            return jsonify({'success': True, 'results': documents})
+        except Exception as e:
+            logger.error(f"语义检索处理异常: {str(e)}")
+            return jsonify({'success': False, 'error': f'服务器内部错误: {str(e)}'}), 500
+    
+    # 路由：获取向量索引统计信息
+    @app.route('/api/search/semantic/stats', methods=['GET'])
+    def semantic_search_stats():
+        return jsonify({'success': True, 'stats': get_embedding_index().get_stats()})
+    
+    # 路由：与数据库重新对齐向量索引（内容未变的文档不会重新计算）
+    @app.route('/api/search/semantic/reindex', methods=['POST'])
+    def semantic_search_reindex():
+        get_embedding_index().schedule()
+        logger.info("已登记向量索引全量对齐")
+        return jsonify({'success': True})
+    
     # 路由：上传图片
     @app.route('/api/upload/image', methods=['POST'])
     def upload_image():
@@ -444,13 +986,52 @@ def create_app():
         logger.info(f"成功获取 {len(log_files)} 个日志文件")
         return jsonify({'success': True, 'log_files': log_files})
     
+    # 路由：获取日志统计信息（异步日志队列、行索引、搜索）
+    @app.route('/api/logs/stats', methods=['GET'])
+    def get_log_stats():
+        log_manager = get_log_manager()
+        return jsonify({
+            'success': True,
+            'queues': log_manager.get_queue_stats(),
+            'access': app.access_log.get_stats(),
+            'reader': log_manager.reader.get_stats(),
+            'search': log_manager.searcher.get_stats()
+        })
+    
+    # 路由：运行指标（Prometheus文本格式）
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+    
+    # 路由：SQLite语句耗时统计（sort: total_ms / max_ms / avg_ms / count / slow）
+    @app.route('/api/db/stats', methods=['GET'])
+    def get_db_stats():
+        sort = request.args.get('sort', 'total_ms')
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({'success': True, 'stats': db_tracer.get_stats(sort=sort, limit=limit)})
+    
+    # 路由：开启/关闭SQLite语句追踪、调整慢查询阈值或清空统计
+    @app.route('/api/db/trace', methods=['POST'])
+    def update_db_trace():
+        data = request.json or {}
+        try:
+            db_tracer.configure(enabled=data.get('enabled'), slow_ms=data.get('slow_ms'))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'slow_ms 必须是数字'}), 400
+        if data.get('reset'):
+            db_tracer.reset()
+        return jsonify({'success': True, 'enabled': db_tracer.enabled, 'slow_ms': db_tracer.slow_ms})
+    
     # 路由：获取日志内容
     @app.route('/api/logs/<file_name>', methods=['GET'])
     def get_log_content(file_name):
         logger.info(f"获取日志内容 - 文件: {file_name}")
         lines = request.args.get('lines', 100, type=int)
+        # 分页游标：before 向前翻页，after 获取新增日志（均为字节偏移）
+        before = request.args.get('before', type=int)
+        after = request.args.get('after', type=int)
         log_manager = get_log_manager()
-        result = log_manager.get_log_content(file_name, lines)
+        result = log_manager.get_log_content(file_name, lines, before=before, after=after)
         
         if result['success']:
             logger.info(f"成功获取日志内容 - 文件: {file_name}, 行数: {result['showed_lines']}")
@@ -459,6 +1040,25 @@ def create_app():
         
         return jsonify(result)
     
+    # 路由：按时间范围获取日志内容
+    @app.route('/api/logs/<file_name>/range', methods=['GET'])
+    def get_log_range(file_name):
+        start_time = request.args.get('start')
+        end_time = request.args.get('end')
+        lines = request.args.get('lines', 100, type=int)
+        after = request.args.get('after', type=int)
+        logger.info(f"按时间范围获取日志内容 - 文件: {file_name}, 范围: {start_time} ~ {end_time}")
+        log_manager = get_log_manager()
+        result = log_manager.get_log_range(file_name, start_time, end_time, lines, after)
+        
+        if result['success']:
+            logger.info(f"成功获取日志内容 - 文件: {file_name}, 行数: {result['showed_lines']}, "
+                        f"读取: {result['bytes_read']} 字节")
+        else:
+            logger.error(f"按时间范围获取日志内容失败 - 文件: {file_name}, 错误: {result['error']}")
+        
+        return jsonify(result)
+    
     # 路由：搜索日志
     @app.route('/api/logs/search', methods=['POST'])
     def search_logs():
@@ -466,10 +1066,35 @@ def create_app():
         keyword = data.get('keyword', '')
         file_name = data.get('file_name')
         max_results = data.get('max_results', 100)
+        if not isinstance(max_results, int) or isinstance(max_results, bool) or max_results < 1:
+            logger.warning(f"搜索日志失败 - 最大结果数无效: {max_results!r}")
+            return jsonify({'success': False, 'error': 'max_results 必须为正整数'}), 400
+        options = {
+            'regex': bool(data.get('regex', False)),
+            'case_sensitive': bool(data.get('case_sensitive', False)),
+            'start_time': data.get('start_time'),
+            'end_time': data.get('end_time'),
+            'fields': data.get('fields')
+        }
         
         logger.info(f"搜索日志 - 关键词: {keyword}, 文件: {file_name}")
         log_manager = get_log_manager()
-        result = log_manager.search_logs(keyword, file_name, max_results)
+        
+        # 流式返回：每搜索完一个文件（或分段）就返回一批结果
+        if data.get('stream'):
+            events = log_manager.iter_search_logs(keyword, file_name, max_results, **options)
+            
+            def generate():
+                try:
+                    for event in events:
+                        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                finally:
+                    events.close()
+            
+            return Response(generate(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+        result = log_manager.search_logs(keyword, file_name, max_results, **options)
         
         if result['success']:
             logger.info(f"搜索成功 - 找到 {result['total']} 条结果")
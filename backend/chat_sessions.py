@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI对话会话
+在服务端保存多轮对话（SQLite），未压缩的历史超过token阈值时，
+在后台将较早的轮次压缩为滚动摘要，使提示长度保持有界
+"""
+
+import uuid
+import logging
+import threading
+from backend.config import Config
+from backend.ai_service import consume_events
+
+# 配置日志
+logger = logging.getLogger('app.chat_sessions')
+
+SUMMARY_PROMPT = """请将以下对话压缩为简洁的摘要，供后续对话参考。
+保留用户的目标、已确定的结论、涉及的文档内容要点和尚未解决的问题，省略寒暄和重复内容。
+直接输出摘要正文，不要添加额外说明。"""
+
+
+class ChatSessionManager:
+    """AI对话会话管理器"""
+
+    def __init__(self, db_manager, ai_service, summary_threshold=None, keep_recent=None):
+        """初始化会话管理器
+
+        Args:
+            db_manager: 数据库管理器
+            ai_service: AI服务
+            summary_threshold: 未压缩历史的token阈值，超过后触发压缩
+            keep_recent: 压缩时保留的最近消息条数
+        """
+        self.db_manager = db_manager
+        self.ai_service = ai_service
+        self.summary_threshold = summary_threshold or Config.CHAT_SUMMARY_THRESHOLD
+        self.keep_recent = keep_recent if keep_recent is not None else Config.CHAT_KEEP_RECENT_MESSAGES
+        self._lock = threading.Lock()
+        self._compacting = set()
+        self.stats = {'turns': 0, 'compactions': 0, 'compaction_failures': 0}
+        logger.info(f"AI对话会话管理器初始化完成 - 压缩阈值: {self.summary_threshold} tokens, 保留消息: {self.keep_recent}")
+
+    def create(self, title=None):
+        """创建会话"""
+        session_id = uuid.uuid4().hex
+        self.db_manager.create_chat_session(session_id, title)
+        return self.db_manager.get_chat_session(session_id)
+
+    def get(self, session_id, include_messages=False):
+        """获取会话及其统计信息"""
+        session = self.db_manager.get_chat_session(session_id, include_messages)
+        if session is not None:
+            with self._lock:
+                session['compacting'] = session_id in self._compacting
+        return session
+
+    def get_sessions(self):
+        """获取所有会话"""
+        return self.db_manager.get_chat_sessions()
+
+    def delete(self, session_id):
+        """删除会话"""
+        return self.db_manager.delete_chat_session(session_id)
+
+    def _build_history(self, session):
+        """构建随请求发送的历史消息：滚动摘要 + 未压缩的最近消息
+
+        压缩尚未完成时，只保留阈值以内的最近消息，保证提示长度有界
+        """
+        messages = self.db_manager.get_active_chat_messages(session['id'])
+        recent = []
+        tokens = 0
+        for message in reversed(messages):
+            tokens += message['tokens']
+            if recent and tokens > self.summary_threshold:
+                break
+            recent.append({'role': message['role'], 'content': message['content']})
+        recent.reverse()
+
+        history = []
+        if session['summary']:
+            history.append({'role': 'system', 'content': f"此前对话摘要：\n{session['summary']}"})
+        history.extend(recent)
+        return history
+
+    def _save_turn(self, session_id, message, response, prompt_tokens=None):
+        """保存本轮消息，返回会话统计信息"""
+        count = self.ai_service.token_counter.count
+        self.db_manager.add_chat_messages(session_id, [
+            {'role': 'user', 'content': message, 'tokens': count(message)},
+            {'role': 'assistant', 'content': response, 'tokens': count(response)}
+        ], prompt_tokens)
+        with self._lock:
+            self.stats['turns'] += 1
+        return self._maybe_compact(session_id)
+
+    def chat_stream(self, session_id, message, context=None, **options):
+        """在会话中进行流式对话，事件格式与 AIService.chat_stream 相同
+
+        完成时保存本轮消息，done 事件附带会话统计信息
+        """
+        session = self.db_manager.get_chat_session(session_id)
+        if session is None:
+            yield {'type': 'error', 'error': '会话不存在'}
+            return
+
+        history = self._build_history(session)
+        options['use_cache'] = False
+        events = self.ai_service.chat_stream(message, context, history=history, **options)
+        try:
+            for event in events:
+                if event['type'] == 'done':
+                    stats = self._save_turn(session_id, message, event['response'], event.get('prompt_tokens'))
+                    event = dict(event, session=stats)
+                yield event
+        finally:
+            events.close()
+
+    def run_job(self, session_id, message, context=None, cancel_event=None, **options):
+        """在AI任务队列中执行会话对话（非流式请求），返回与 AIService.chat 相同格式的结果"""
+        session = self.db_manager.get_chat_session(session_id)
+        if session is None:
+            return {'success': False, 'error': '会话不存在'}
+
+        options['use_cache'] = False
+        result = self.ai_service.chat(message, context, history=self._build_history(session),
+                                      cancel_event=cancel_event, **options)
+        if result.get('success'):
+            result['session'] = self._save_turn(session_id, message, result['response'], result.get('prompt_tokens'))
+        return result
+
+    def run_stream_job(self, session_id, message, context=None, cancel_event=None, on_event=None, **options):
+        """在AI任务队列中执行会话流式对话：每个事件交给 on_event，返回与 AIService.chat 相同格式的结果"""
+        return consume_events(self.chat_stream(session_id, message, context, cancel_event=cancel_event, **options),
+                              cancel_event, on_event)
+
+    def _maybe_compact(self, session_id):
+        """未压缩历史超过阈值时启动后台压缩
+
+        Returns:
+            会话统计信息（不含消息内容）
+        """
+        session = self.get(session_id)
+        if session['active_tokens'] > self.summary_threshold and session['active_messages'] > self.keep_recent:
+            with self._lock:
+                if session_id not in self._compacting:
+                    self._compacting.add(session_id)
+                    session['compacting'] = True
+                    thread = threading.Thread(target=self._compact, args=(session_id,),
+                                              name=f'chat-compact-{session_id[:8]}', daemon=True)
+                    thread.start()
+        session.pop('summary', None)
+        return session
+
+    def _compact(self, session_id):
+        """将较早的消息与已有摘要合并为新的摘要"""
+        try:
+            session = self.db_manager.get_chat_session(session_id)
+            if session is None:
+                return
+            messages = self.db_manager.get_active_chat_messages(session_id)
+            older = messages[:len(messages) - self.keep_recent] if self.keep_recent else messages
+            if not older:
+                return
+
+            transcript = '\n\n'.join(
+                f"{'用户' if message['role'] == 'user' else '助手'}：{message['content']}" for message in older)
+            if session['summary']:
+                transcript = f"已有摘要：\n{session['summary']}\n\n新的对话：\n{transcript}"
+
+            summary, error_msg = self.ai_service.complete([
+                {'role': 'system', 'content': SUMMARY_PROMPT},
+                {'role': 'user', 'content': transcript}
+            ], max_tokens=Config.CHAT_SUMMARY_MAX_TOKENS)
+            if error_msg:
+                logger.warning(f"AI对话会话压缩失败 - ID: {session_id}, 错误: {error_msg}")
+                with self._lock:
+                    self.stats['compaction_failures'] += 1
+                return
+
+            summary_tokens = self.ai_service.token_counter.count(summary)
+            self.db_manager.compact_chat_session(session_id, [message['id'] for message in older],
+                                                 summary, summary_tokens)
+            with self._lock:
+                self.stats['compactions'] += 1
+            logger.info(f"AI对话会话压缩完成 - ID: {session_id}, 并入消息: {len(older)}, 摘要: {summary_tokens} tokens")
+        except Exception as e:
+            logger.error(f"AI对话会话压缩异常 - ID: {session_id}, 错误: {str(e)}")
+            with self._lock:
+                self.stats['compaction_failures'] += 1
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+    def get_stats(self):
+        """获取会话管理器统计信息"""
+        with self._lock:
+            return {
+                'summary_threshold': self.summary_threshold,
+                'keep_recent': self.keep_recent,
+                'compacting': len(self._compacting),
+                **self.stats
+            }
@@ -49,7 +49,15 @@ class Config:
         "model": "hunyuan-lite",
         "temperature": 0.7,
         "max_tokens": 2000,
-        "timeout": 30
+        "timeout": 30,
+        "pool_size": 10,
+        "keep_alive": True,
+        "cache_enabled": True,
+        "context_token_budget": 3000,
+        "context_window": 8192,
+        "max_retries": 2,
+        "hedge_after": 0,
+        "embedding_model": ""
     }
     
     # 应用默认配置
@@ -68,6 +76,108 @@ class Config:
         "highlight_code": True
     }
     
+    # AI响应缓存配置：缓存文件路径、最大条目数、最大字节数、过期时间（秒）
+    AI_CACHE_PATH = os.path.join(EXECUTABLE_DIR, 'data', 'ai_cache.db')
+    AI_CACHE_MAX_ENTRIES = 500
+    AI_CACHE_MAX_BYTES = 20 * 1024 * 1024
+    AI_CACHE_TTL = 7 * 24 * 3600
+    
+    # AI端点重试与熔断配置：退避基数与上限（秒）、Retry-After最长等待（秒）、熔断阈值（连续失败次数）、熔断冷却时间（秒）
+    AI_BACKOFF_BASE = 0.5
+    AI_BACKOFF_MAX = 8
+    AI_RETRY_AFTER_MAX = 30
+    AI_BREAKER_THRESHOLD = 5
+    AI_BREAKER_COOLDOWN = 30
+    
+    # AI任务队列配置：并发数、最大排队数、保留的已完成任务数
+    AI_MAX_CONCURRENCY = 4
+    AI_QUEUE_SIZE = 32
+    AI_JOB_RETENTION = 200
+    
+    # 同步AI请求：上游重试与退避的截止时间早于请求线程结束等待的秒数（留给解析响应、写回结果）
+    AI_SYNC_DEADLINE_MARGIN = 5
+    
+    # AI接口限流：每个客户端及全局每分钟请求数与突发量（速率为0表示不限制）、最多跟踪的客户端数；
+    # 排队与执行中的AI任务（含流式请求）合计超过阈值时直接拒绝
+    AI_RATE_LIMIT_PER_MINUTE = 30
+    AI_RATE_LIMIT_BURST = 10
+    AI_GLOBAL_RATE_LIMIT_PER_MINUTE = 120
+    AI_GLOBAL_RATE_LIMIT_BURST = 30
+    AI_RATE_LIMIT_MAX_CLIENTS = 1000
+    # 可信反向代理地址：请求来自这些地址时按 X-Client-ID 请求头区分客户端，否则按连接地址
+    AI_TRUSTED_PROXIES = ()
+    AI_QUEUE_REJECT_THRESHOLD = 16
+    
+    # AI批量任务配置：并发数、每分钟请求数上限、每批写回的结果数
+    AI_BATCH_WORKERS = 4
+    AI_BATCH_RATE_PER_MINUTE = 60
+    AI_BATCH_FLUSH_SIZE = 20
+    
+    # AI对话会话配置：未压缩历史超过该token数时将较早轮次压缩为摘要，
+    # 压缩时保留最近的消息条数，以及摘要的最大token数
+    CHAT_SUMMARY_THRESHOLD = 2000
+    CHAT_KEEP_RECENT_MESSAGES = 4
+    CHAT_SUMMARY_MAX_TOKENS = 500
+    
+    # 语义检索向量索引：与数据库同目录保存（.npy矩阵 + .json元数据），
+    # 未配置 embedding_model 时使用本地哈希向量；每次请求的文本条数、单篇文档参与计算的最大字符数
+    EMBEDDING_INDEX_PATH = os.path.join(EXECUTABLE_DIR, 'data', 'embeddings')
+    EMBEDDING_LOCAL_DIM = 256
+    EMBEDDING_BATCH_SIZE = 16
+    EMBEDDING_MAX_CHARS = 8000
+    
+    # Markdown渲染缓存容量（按内容哈希缓存的文档数）
+    RENDER_CACHE_SIZE = 64
+    
+    # 分段渲染配置：切分标题级别、默认每页分段数、单次请求最大分段数、缓存的分段文档数
+    RENDER_SPLIT_LEVEL = 2
+    RENDER_PAGE_SIZE = 5
+    RENDER_MAX_PAGE_SIZE = 20
+    RENDER_PAGINATED_DOCUMENTS = 8
+    
+    # 日志文件格式：'text' 为原有的文本格式，'json' 为JSON行格式（带请求ID、路由、耗时、文档ID等字段）
+    LOG_FORMAT = 'text'
+    
+    # 异步日志：日志记录经有界队列由后台线程写入，队列容量（条）；
+    # 队列已满时INFO及以下级别直接丢弃，WARNING及以上级别最多等待的秒数
+    LOG_ASYNC = True
+    LOG_QUEUE_SIZE = 10000
+    LOG_QUEUE_BLOCK_TIMEOUT = 1.0
+    
+    # 访问日志：按路由模板配置的采样比例（高频轮询的路由只记录一部分），未配置路由的采样比例，
+    # 错误响应（状态码>=400）和耗时超过 ACCESS_LOG_SLOW_MS 毫秒的请求始终记录
+    ACCESS_LOG_SAMPLE_RATES = {
+        '/api/ai/jobs/<job_id>': 0.1,
+        '/static/<path:filename>': 0.1
+    }
+    ACCESS_LOG_DEFAULT_SAMPLE_RATE = 1.0
+    ACCESS_LOG_SLOW_MS = 1000
+    
+    # 运行指标（/api/metrics）：耗时直方图的桶上界（秒）、记录时按线程分散到的分片数（分片越多锁竞争越少）
+    METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    METRICS_STRIPES = 8
+    
+    # SQLite语句追踪（默认关闭，可通过 /api/db/trace 在运行时开启）：慢查询阈值（毫秒，超过时连同查询计划
+    # 写入 slow_query.log）、最多统计的不同语句数
+    DB_TRACE_ENABLED = False
+    DB_SLOW_QUERY_MS = 100
+    DB_TRACE_MAX_STATEMENTS = 500
+    
+    # 日志读取：反向读取日志尾部时每次读取的字节数、行索引检查点间隔（字节）
+    LOG_READ_BLOCK_SIZE = 64 * 1024
+    LOG_INDEX_CHECKPOINT_SIZE = 256 * 1024
+    
+    # 日志搜索：子进程数（小于2时不使用进程池）、待搜索数据超过该字节数时才使用进程池、
+    # 大文件按行切分为多段并行搜索时每段的字节数
+    LOG_SEARCH_WORKERS = 4
+    LOG_SEARCH_PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+    LOG_SEARCH_CHUNK_SIZE = 4 * 1024 * 1024
+    
+    # 日志三元组索引：超过该大小的已轮转日志在后台建立索引，关键词搜索时跳过不可能匹配的块
+    LOG_TRIGRAM_INDEX_ENABLED = True
+    LOG_TRIGRAM_MIN_BYTES = 4 * 1024 * 1024
+    LOG_TRIGRAM_BLOCK_SIZE = 64 * 1024
+    
     # 配置文件路径
     CONFIG_FILE = os.path.join(EXECUTABLE_DIR, 'data', 'config.json')
     APP_CONFIG_FILE = os.path.join(EXECUTABLE_DIR, 'data', 'app_config.json')
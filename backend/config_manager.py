@@ -2,16 +2,39 @@
 # -*- coding: utf-8 -*-
 """
 配置管理器
+进程内共享一个实例：解析后的配置缓存在内存中，读取时仅通过文件的修改时间和大小判断是否需要重新加载，
+配置变化时通知订阅者。写入时先写临时文件并fsync再原子替换，部分更新在锁内合并，
+写入期间到达的更新合并为下一次写入
 """
 
+import copy
 import json
 import os
 import logging
+import tempfile
+import threading
 from backend.config import Config
 
 # 配置日志
 logger = logging.getLogger('app.config_manager')
 
+# 配置类型
+CONFIG_AI = 'ai'
+CONFIG_APP = 'app'
+
+_shared_instance = None
+_shared_lock = threading.Lock()
+
+
+def get_config_manager():
+    """获取进程内共享的配置管理器"""
+    global _shared_instance
+    with _shared_lock:
+        if _shared_instance is None:
+            _shared_instance = ConfigManager()
+        return _shared_instance
+
+
 class ConfigManager:
     """配置管理器"""
     
@@ -19,6 +42,18 @@ class ConfigManager:
         logger.info("初始化配置管理器")
         self.config_file = Config.CONFIG_FILE
         self.app_config_file = Config.APP_CONFIG_FILE
+        self._lock = threading.RLock()
+        self._write_condition = threading.Condition(self._lock)
+        # 每种配置缓存 (文件签名, 解析后的配置)
+        self._cache = {}
+        self._subscribers = []
+        # 写入状态：等待写入的配置、正在写入的配置、已提交/已写入的更新序号、写入失败信息
+        self._pending = {}
+        self._writing = {}
+        self._generation = {CONFIG_AI: 0, CONFIG_APP: 0}
+        self._written = {CONFIG_AI: 0, CONFIG_APP: 0}
+        self._failed = {}
+        self.stats = {'reads': 0, 'cache_hits': 0, 'reloads': 0, 'writes': 0, 'coalesced': 0}
         self.ensure_config_exists()
         logger.info(f"配置管理器初始化完成 - 配置文件路径: {self.config_file}")
     
@@ -43,46 +78,209 @@ class ConfigManager:
         else:
             logger.info("应用配置文件已存在")
     
-    def get_config(self):
-        """获取配置"""
-        logger.info("获取配置信息")
+    def _get_path(self, kind):
+        return self.config_file if kind == CONFIG_AI else self.app_config_file
+    
+    def _get_default(self, kind):
+        return Config.OPENAI_CONFIG if kind == CONFIG_AI else Config.DEFAULT_APP_CONFIG
+    
+    def _file_signature(self, path):
+        """文件签名（修改时间和大小），文件不存在时返回None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _load(self, kind):
+        """获取配置：文件签名未变时直接返回缓存，否则重新解析并通知订阅者"""
+        path = self._get_path(kind)
+        signature = self._file_signature(path)
         
+        with self._lock:
+            self.stats['reads'] += 1
+            cached = self._cache.get(kind)
+            if cached is not None and signature is not None and cached[0] == signature:
+                self.stats['cache_hits'] += 1
+                return cached[1]
+            
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError) as e:
+                logger.warning(f"配置文件读取失败，使用默认配置: {str(e)}")
+                config = copy.deepcopy(self._get_default(kind))
+                signature = None
+            
+            changed = cached is not None and cached[1] != config
+            self._cache[kind] = (signature, config)
+            self.stats['reloads'] += 1
+            logger.debug(f"配置已从文件加载 - {path}")
+        
+        if changed:
+            logger.info(f"检测到配置文件变更 - {path}")
+            self._notify(kind, config)
+        return config
+    
+    def _write_file(self, path, config):
+        """原子写入：写临时文件并fsync后替换原文件，中途崩溃不会留下不完整的配置"""
+        directory = os.path.dirname(path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                logger.info("配置信息获取成功")
-                return config
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(f"配置文件读取失败，使用默认配置: {str(e)}")
-            return Config.OPENAI_CONFIG
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        # 同步目录项，保证替换本身落盘（Windows不支持打开目录，忽略）
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+    
+    def _commit(self, kind, changes, replace=False):
+        """提交配置更新
+        
+        更新在锁内与最新配置（含尚未写入的更新）合并；已有线程在写入时只登记更新并等待，
+        由该线程在下一次写入中一并完成
+        
+        Args:
+            changes: 要更新的配置项
+            replace: 为True时整体替换配置，否则合并
+        
+        Returns:
+            更新后的完整配置
+        """
+        path = self._get_path(kind)
+        # 在锁外加载（加载时可能通知订阅者）
+        current = self._load(kind)
+        with self._write_condition:
+            # 以最新的配置为基础合并：等待写入的 > 正在写入的 > 已加载的
+            base = self._pending.get(kind)
+            if base is None:
+                base = self._writing.get(kind)
+            if base is None:
+                base = current
+            config = copy.deepcopy(changes) if replace else {**copy.deepcopy(base), **copy.deepcopy(changes)}
+            self._pending[kind] = config
+            self._generation[kind] += 1
+            generation = self._generation[kind]
+            
+            if kind in self._writing:
+                self._write_condition.wait_for(lambda: self._written[kind] >= generation
+                                               or self._failed.get(kind, (0,))[0] >= generation)
+                failed = self._failed.get(kind)
+                if failed is not None and failed[0] >= generation:
+                    raise failed[1]
+                return copy.deepcopy(self._cache[kind][1])
+            self._writing[kind] = config
+        
+        try:
+            while True:
+                with self._write_condition:
+                    config = self._pending.pop(kind, None)
+                    if config is None:
+                        break
+                    self._writing[kind] = config
+                    target = self._generation[kind]
+                    self.stats['coalesced'] += max(target - self._written[kind] - 1, 0)
+                
+                try:
+                    self._write_file(path, config)
+                except Exception as e:
+                    logger.error(f"配置写入失败 - {path}: {str(e)}")
+                    # 本次及已登记的更新均视为失败，避免等待者一直阻塞
+                    with self._write_condition:
+                        self._pending.pop(kind, None)
+                        self._failed[kind] = (self._generation[kind], e)
+                        self._write_condition.notify_all()
+                    raise
+                
+                with self._write_condition:
+                    self._cache[kind] = (self._file_signature(path), config)
+                    self._written[kind] = target
+                    self.stats['writes'] += 1
+                    self._write_condition.notify_all()
+                self._notify(kind, config)
+        finally:
+            with self._write_condition:
+                self._writing.pop(kind, None)
+                self._write_condition.notify_all()
+        
+        with self._lock:
+            return copy.deepcopy(self._cache[kind][1])
+    
+    def subscribe(self, callback):
+        """订阅配置变化，回调参数为 (配置类型 'ai' / 'app', 新配置的副本)"""
+        with self._lock:
+            self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback):
+        """取消订阅"""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+    
+    def _notify(self, kind, config):
+        """通知订阅者（不持有锁，避免回调中再次读取配置时死锁）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(kind, copy.deepcopy(config))
+            except Exception as e:
+                logger.error(f"配置变更通知失败: {str(e)}")
+    
+    def get_config(self):
+        """获取配置"""
+        return copy.deepcopy(self._load(CONFIG_AI))
     
     def save_config(self, config):
-        """保存配置"""
+        """保存配置（整体替换）"""
         logger.info("保存配置信息")
+        self._commit(CONFIG_AI, config, replace=True)
+        logger.info("配置信息保存成功")
         
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+    def update_config(self, changes):
+        """合并更新配置，未提交的配置项保持不变
             
-        logger.info("配置信息保存成功")
+        Returns:
+            更新后的完整配置
+        """
+        logger.info(f"更新配置信息 - 配置项: {', '.join(sorted(changes))}")
+        return self._commit(CONFIG_AI, changes)
         
     def get_app_config(self):
         """获取应用配置"""
-        logger.info("获取应用配置信息")
-        
-        try:
-            with open(self.app_config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                logger.info("应用配置信息获取成功")
-                return config
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logger.warning(f"应用配置文件读取失败，使用默认配置: {str(e)}")
-            return Config.DEFAULT_APP_CONFIG
+        return copy.deepcopy(self._load(CONFIG_APP))
     
     def save_app_config(self, config):
-        """保存应用配置"""
+        """保存应用配置（整体替换）"""
         logger.info("保存应用配置信息")
+        self._commit(CONFIG_APP, config, replace=True)
+        logger.info("应用配置信息保存成功")
         
-        with open(self.app_config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+    def update_app_config(self, changes):
+        """合并更新应用配置
             
-        logger.info("应用配置信息保存成功")
\ No newline at end of file
+        Returns:
+            更新后的完整应用配置
+        """
+        logger.info(f"更新应用配置信息 - 配置项: {', '.join(sorted(changes))}")
+        return self._commit(CONFIG_APP, changes)
+    
+    def get_stats(self):
+        """获取配置缓存统计信息"""
+        with self._lock:
+            return {**self.stats, 'subscribers': len(self._subscribers)}
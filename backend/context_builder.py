@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI上下文构建器
+将文档切分为段落，按与用户消息的词汇相关性(BM25)排序，在token预算内组装上下文
+"""
+
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from backend.renderer import split_sections
+from backend.token_counter import estimate_tokens, CJK_RE
+
+# 配置日志
+logger = logging.getLogger('app.context_builder')
+
+# 分词：英文/数字单词，以及中日韩字符序列（按二元组切分）
+WORD_RE = re.compile(r'[a-z0-9_]+|[぀-ヿ㐀-䶿一-鿿가-힯]+')
+
+# BM25参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 单个分段的最大字符数，超出时在空行处继续切分
+MAX_SECTION_CHARS = 2000
+
+# 段落之间省略内容的标记
+OMITTED_MARK = '\n\n……\n\n'
+
+
+def tokenize(text):
+    """将文本切分为检索用的词项"""
+    terms = []
+    for word in WORD_RE.findall(text.lower()):
+        if CJK_RE.match(word):
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def split_chunks(content):
+    """按标题切分文档，过长的分段再按空行切分
+
+    Returns:
+        列表，每个元素为 (起始字符偏移, 文本)
+    """
+    lines, sections = split_sections(content, split_level=3)
+    line_offsets = [0]
+    for line in lines:
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    chunks = []
+    for section in sections:
+        start = line_offsets[section['start_line']]
+        text = '\n'.join(lines[section['start_line']:section['end_line']])
+        if len(text) <= MAX_SECTION_CHARS:
+            if text.strip():
+                chunks.append((start, text))
+            continue
+
+        # 过长分段：按空行累积到最大长度
+        buffer_start = start
+        buffer = ''
+        for block in re.split(r'(\n\s*\n)', text):
+            if buffer and len(buffer) + len(block) > MAX_SECTION_CHARS:
+                if buffer.strip():
+                    chunks.append((buffer_start, buffer))
+                buffer_start += len(buffer)
+                buffer = ''
+            buffer += block
+        if buffer.strip():
+            chunks.append((buffer_start, buffer))
+
+    return chunks
+
+
+class ContextBuilder:
+    """基于相关性的上下文构建器"""
+
+    def __init__(self, token_budget=3000, cursor_window=600, token_counter=None):
+        """初始化上下文构建器
+
+        Args:
+            token_budget: 上下文token预算
+            cursor_window: 未提供选区时，光标前后保留的字符数
+            token_counter: token计数函数，默认使用 estimate_tokens
+        """
+        self.token_budget = token_budget
+        self.cursor_window = cursor_window
+        self.count_tokens = token_counter or estimate_tokens
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'trimmed_requests': 0,
+            'original_tokens': 0,
+            'context_tokens': 0,
+            'saved_tokens': 0
+        }
+
+    def build(self, content, message, selection=None, cursor=None, token_budget=None):
+        """构建上下文
+
+        Args:
+            content: 完整文档
+            message: 用户消息
+            selection: 用户选中的文本，始终包含在上下文中
+            cursor: 光标字符偏移，无选区时保留光标附近内容
+            token_budget: 本次使用的token预算，默认使用 self.token_budget
+
+        Returns:
+            (上下文文本, 本次统计信息字典)
+        """
+        token_budget = self.token_budget if token_budget is None else max(token_budget, 0)
+        original_tokens = self.count_tokens(content or '')
+
+        if not content or original_tokens <= token_budget:
+            metrics = self._record(original_tokens, original_tokens, False)
+            return content, metrics
+
+        chunks = split_chunks(content)
+        scores = self._score(chunks, message)
+
+        # 必选内容：选区，或光标附近的文本
+        pinned = ''
+        pinned_range = None
+        if selection:
+            pinned = selection
+        elif cursor is not None:
+            cursor = max(0, min(int(cursor), len(content)))
+            pinned_range = (max(0, cursor - self.cursor_window), cursor + self.cursor_window)
+            pinned = content[pinned_range[0]:pinned_range[1]]
+
+        pinned_tokens = self.count_tokens(pinned)
+        if pinned_range and pinned_tokens > token_budget // 2:
+            # 光标附近内容最多占用一半预算，其余留给相关分段
+            half_window = int(len(pinned) * (token_budget // 2) / pinned_tokens) // 2
+            pinned_range = (max(0, cursor - half_window), cursor + half_window)
+            pinned = content[pinned_range[0]:pinned_range[1]]
+            pinned_tokens = self.count_tokens(pinned)
+        elif pinned_tokens > token_budget:
+            # 选区本身超出预算时按比例截断
+            pinned = pinned[:int(len(pinned) * token_budget / pinned_tokens)]
+            pinned_tokens = self.count_tokens(pinned)
+
+        budget = token_budget - pinned_tokens
+        selected = []
+        # 按相关性从高到低选取；得分相同时保持文档顺序
+        for index in sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True):
+            start, text = chunks[index]
+            if pinned_range and pinned_range[0] <= start and start + len(text) <= pinned_range[1]:
+                continue
+            chunk_tokens = self.count_tokens(text)
+            if chunk_tokens > budget:
+                continue
+            selected.append(index)
+            budget -= chunk_tokens
+
+        # 按文档顺序拼接选中的分段
+        parts = [chunks[index][1].strip('\n') for index in sorted(selected)]
+        context = OMITTED_MARK.join(parts)
+        if pinned:
+            label = '用户选中的内容' if selection else '光标附近的内容'
+            context = f"{context}{OMITTED_MARK}【{label}】\n{pinned}" if context else f"【{label}】\n{pinned}"
+
+        context_tokens = self.count_tokens(context)
+        metrics = self._record(original_tokens, context_tokens, True)
+        metrics['sections_total'] = len(chunks)
+        metrics['sections_selected'] = len(selected)
+        logger.info(f"上下文裁剪完成 - 分段: {len(selected)}/{len(chunks)}, token: {original_tokens} -> {context_tokens}")
+        return context, metrics
+
+    def _score(self, chunks, message):
+        """使用BM25计算每个分段与消息的相关性"""
+        query_terms = set(tokenize(message or ''))
+        chunk_terms = [Counter(tokenize(text)) for _, text in chunks]
+        if not query_terms or not chunk_terms:
+            return [0.0] * len(chunks)
+
+        total = len(chunk_terms)
+        avg_length = sum(sum(terms.values()) for terms in chunk_terms) / total or 1
+        document_frequency = Counter()
+        for terms in chunk_terms:
+            document_frequency.update(query_terms.intersection(terms))
+
+        scores = []
+        for terms in chunk_terms:
+            length = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+            scores.append(score)
+        return scores
+
+    def _record(self, original_tokens, context_tokens, trimmed):
+        """累计统计信息并返回本次统计"""
+        saved = max(original_tokens - context_tokens, 0)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['trimmed_requests'] += 1 if trimmed else 0
+            self.stats['original_tokens'] += original_tokens
+            self.stats['context_tokens'] += context_tokens
+            self.stats['saved_tokens'] += saved
+        return {
+            'trimmed': trimmed,
+            'original_tokens': original_tokens,
+            'context_tokens': context_tokens,
+            'saved_tokens': saved
+        }
+
+    def get_stats(self):
+        """获取累计统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['token_budget'] = self.token_budget
+        return stats
@@ -7,13 +7,62 @@
 import sqlite3
 import json
 import os
+import time
 import logging
+import functools
 from datetime import datetime
 from backend.config import Config
+from backend.metrics import metrics
+from backend.db_trace import tracer
 
 # 配置日志
 logger = logging.getLogger('app.database')
 
+# 各方法的耗时与异常次数
+DB_QUERY_LATENCY = metrics.histogram('notegen_db_query_duration_seconds', 'DBManager方法耗时（秒）', ('method',))
+DB_QUERY_ERRORS = metrics.counter('notegen_db_query_errors_total', 'DBManager方法异常次数', ('method',))
+
+# 会话查询（附带消息数、未压缩token数与存储字节数）
+CHAT_SESSION_SELECT = '''
+    SELECT s.id, s.title, s.summary, s.summary_tokens, s.last_prompt_tokens, s.compactions,
+           s.created_at, s.updated_at,
+           COUNT(m.id),
+           SUM(CASE WHEN m.summarized = 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN m.summarized = 0 THEN m.tokens ELSE 0 END),
+           SUM(LENGTH(CAST(m.content AS BLOB)))
+    FROM chat_sessions s
+    LEFT JOIN chat_messages m ON m.session_id = s.id
+'''
+
+# AI批量任务查询（附带各状态的条目数）
+AI_BATCH_SELECT = '''
+    SELECT b.id, b.prompt_template, b.write_mode, b.status, b.created_at, b.updated_at,
+           COUNT(i.document_id),
+           SUM(CASE WHEN i.status = 'pending' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN i.status = 'done' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN i.status = 'failed' THEN 1 ELSE 0 END)
+    FROM ai_batches b
+    LEFT JOIN ai_batch_items i ON i.batch_id = b.id
+'''
+
+
+def timed(func):
+    """记录DBManager方法的耗时（按方法名）"""
+    name = func.__name__
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.inc(name)
+            raise
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
 class DBManager:
     """数据库管理器"""
     
@@ -58,6 +107,66 @@ class DBManager:
         )
         ''')
         
+        # 创建AI批量任务表
+        logger.info("创建AI批量任务表")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_batches (
+            id TEXT PRIMARY KEY,
+            prompt_template TEXT NOT NULL,
+            write_mode TEXT NOT NULL DEFAULT 'none',
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # 创建AI批量任务条目表（记录每篇文档的处理进度，用于断点续跑）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_batch_items (
+            batch_id TEXT NOT NULL,
+            document_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result TEXT,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (batch_id, document_id),
+            FOREIGN KEY (batch_id) REFERENCES ai_batches (id) ON DELETE CASCADE
+        )
+        ''')
+        
+        # 创建AI对话会话表（summary为较早轮次压缩后的滚动摘要）
+        logger.info("创建AI对话会话表")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            summary TEXT,
+            summary_tokens INTEGER NOT NULL DEFAULT 0,
+            last_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            compactions INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        
+        # 创建AI对话消息表（summarized=1 表示已并入摘要，不再随请求发送）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            summarized INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES chat_sessions (id) ON DELETE CASCADE
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_session
+        ON chat_messages (session_id, summarized, id)
+        ''')
+        
         # 提交更改并关闭连接
         conn.commit()
         conn.close()
@@ -65,9 +174,10 @@ class DBManager:
         logger.info("数据库初始化完成")
     
     def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """获取数据库连接（开启语句追踪时为带计时的连接）"""
+        return tracer.connect(self.db_path)
     
+    @timed
     def save_document(self, title, content, doc_id=None):
         """保存文档"""
         logger.info(f"保存文档 - 标题: {title}, ID: {doc_id}")
@@ -113,6 +223,7 @@ class DBManager:
         logger.info(f"文档保存成功 - 文档ID: {document_id}")
         return document_id
     
+    @timed
     def get_document(self, doc_id):
         """获取单个文档"""
         logger.info(f"获取文档 - ID: {doc_id}")
@@ -138,6 +249,7 @@ class DBManager:
             logger.warning(f"文档不存在 - ID: {doc_id}")
             return None
     
+    @timed
     def get_all_documents(self):
         """获取所有文档"""
         logger.info("获取所有文档列表")
@@ -159,6 +271,7 @@ class DBManager:
             'updated_at': doc[4]
         } for doc in docs]
     
+    @timed
     def delete_document(self, doc_id):
         """删除文档"""
         logger.info(f"删除文档 - ID: {doc_id}")
@@ -179,6 +292,7 @@ class DBManager:
         
         return deleted
     
+    @timed
     def get_document_history(self, doc_id):
         """获取文档历史记录"""
         logger.info(f"获取文档历史记录 - 文档ID: {doc_id}")
@@ -201,4 +315,383 @@ class DBManager:
             'document_id': h[1],
             'content': h[2],
             'created_at': h[3]
-        } for h in history]
\ No newline at end of file
+        } for h in history]
+    
+    @timed
+    def create_ai_batch(self, batch_id, prompt_template, write_mode, document_ids):
+        """创建AI批量任务"""
+        logger.info(f"创建AI批量任务 - ID: {batch_id}, 文档数: {len(document_ids)}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        INSERT INTO ai_batches (id, prompt_template, write_mode)
+        VALUES (?, ?, ?)
+        ''', (batch_id, prompt_template, write_mode))
+        
+        cursor.executemany('''
+        INSERT OR IGNORE INTO ai_batch_items (batch_id, document_id)
+        VALUES (?, ?)
+        ''', [(batch_id, doc_id) for doc_id in document_ids])
+        
+        conn.commit()
+        conn.close()
+        
+        logger.info(f"AI批量任务创建成功 - ID: {batch_id}")
+        return batch_id
+    
+    def _ai_batch_row_to_dict(self, row):
+        """批量任务查询结果转换为字典（row需包含统计列）"""
+        return {
+            'id': row[0],
+            'prompt_template': row[1],
+            'write_mode': row[2],
+            'status': row[3],
+            'created_at': row[4],
+            'updated_at': row[5],
+            'total': row[6],
+            'pending': row[7] or 0,
+            'done': row[8] or 0,
+            'failed': row[9] or 0
+        }
+    
+    @timed
+    def get_ai_batch(self, batch_id, include_items=False):
+        """获取AI批量任务及其进度"""
+        logger.info(f"获取AI批量任务 - ID: {batch_id}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(AI_BATCH_SELECT + '''
+        WHERE b.id = ?
+        GROUP BY b.id
+        ''', (batch_id,))
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            logger.warning(f"AI批量任务不存在 - ID: {batch_id}")
+            return None
+        
+        batch = self._ai_batch_row_to_dict(row)
+        if include_items:
+            cursor.execute('''
+            SELECT document_id, status, result, error, updated_at FROM ai_batch_items
+            WHERE batch_id = ?
+            ORDER BY document_id
+            ''', (batch_id,))
+            batch['items'] = [{
+                'document_id': item[0],
+                'status': item[1],
+                'result': item[2],
+                'error': item[3],
+                'updated_at': item[4]
+            } for item in cursor.fetchall()]
+        
+        conn.close()
+        return batch
+    
+    @timed
+    def get_ai_batches(self):
+        """获取所有AI批量任务"""
+        logger.info("获取AI批量任务列表")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(AI_BATCH_SELECT + '''
+        GROUP BY b.id
+        ORDER BY b.created_at DESC
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [self._ai_batch_row_to_dict(row) for row in rows]
+    
+    @timed
+    def update_ai_batch_status(self, batch_id, status):
+        """更新AI批量任务状态"""
+        logger.info(f"更新AI批量任务状态 - ID: {batch_id}, 状态: {status}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        UPDATE ai_batches
+        SET status = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''', (status, batch_id))
+        
+        conn.commit()
+        conn.close()
+    
+    @timed
+    def get_pending_ai_batch_items(self, batch_id):
+        """获取AI批量任务中尚未成功处理的文档（断点续跑时只处理这些文档）
+        
+        已被删除的文档同样返回，deleted 为True，由调用方记为失败，避免条目一直处于待处理状态
+        """
+        logger.info(f"获取AI批量任务待处理文档 - ID: {batch_id}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT i.document_id, d.title, d.content, d.id IS NULL FROM ai_batch_items i
+        LEFT JOIN documents d ON d.id = i.document_id
+        WHERE i.batch_id = ? AND i.status != 'done'
+        ORDER BY i.document_id
+        ''', (batch_id,))
+        
+        items = cursor.fetchall()
+        conn.close()
+        
+        return [{
+            'id': item[0],
+            'title': item[1],
+            'content': item[2],
+            'deleted': bool(item[3])
+        } for item in items]
+    
+    @timed
+    def save_ai_batch_results(self, batch_id, results, write_mode='none'):
+        """在单个事务中批量写回AI处理结果
+        
+        Args:
+            batch_id: 批量任务ID
+            results: 结果列表，每项包含 document_id、success、response 或 error
+            write_mode: 'none' 仅记录结果，'append' 追加到文档末尾，'replace' 替换文档内容
+        """
+        logger.info(f"写回AI批量任务结果 - ID: {batch_id}, 条数: {len(results)}, 写回方式: {write_mode}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+            UPDATE ai_batch_items
+            SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE batch_id = ? AND document_id = ?
+            ''', [(
+                'done' if item['success'] else 'failed',
+                item.get('response'),
+                item.get('error'),
+                batch_id,
+                item['document_id']
+            ) for item in results])
+            
+            succeeded = [item for item in results if item['success']]
+            if write_mode in ('append', 'replace') and succeeded:
+                if write_mode == 'append':
+                    cursor.executemany('''
+                    UPDATE documents
+                    SET content = COALESCE(content, '') || ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    ''', [('\n\n' + item['response'], item['document_id']) for item in succeeded])
+                else:
+                    cursor.executemany('''
+                    UPDATE documents
+                    SET content = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    ''', [(item['response'], item['document_id']) for item in succeeded])
+                
+                # 保存到历史记录
+                cursor.executemany('''
+                INSERT INTO document_history (document_id, content)
+                SELECT id, content FROM documents WHERE id = ?
+                ''', [(item['document_id'],) for item in succeeded])
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        logger.info(f"AI批量任务结果写回成功 - ID: {batch_id}")
+    
+    @timed
+    def create_chat_session(self, session_id, title=None):
+        """创建AI对话会话"""
+        logger.info(f"创建AI对话会话 - ID: {session_id}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        INSERT INTO chat_sessions (id, title)
+        VALUES (?, ?)
+        ''', (session_id, title))
+        
+        conn.commit()
+        conn.close()
+        return session_id
+    
+    def _chat_session_row_to_dict(self, row):
+        """会话查询结果转换为字典（row需包含统计列）"""
+        return {
+            'id': row[0],
+            'title': row[1],
+            'summary': row[2],
+            'summary_tokens': row[3],
+            'last_prompt_tokens': row[4],
+            'compactions': row[5],
+            'created_at': row[6],
+            'updated_at': row[7],
+            'message_count': row[8] or 0,
+            'active_messages': row[9] or 0,
+            'active_tokens': row[10] or 0,
+            'stored_bytes': (row[11] or 0) + len((row[2] or '').encode('utf-8'))
+        }
+    
+    @timed
+    def get_chat_session(self, session_id, include_messages=False):
+        """获取AI对话会话及其统计信息"""
+        logger.info(f"获取AI对话会话 - ID: {session_id}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(CHAT_SESSION_SELECT + '''
+        WHERE s.id = ?
+        GROUP BY s.id
+        ''', (session_id,))
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            logger.warning(f"AI对话会话不存在 - ID: {session_id}")
+            return None
+        
+        session = self._chat_session_row_to_dict(row)
+        if include_messages:
+            cursor.execute('''
+            SELECT id, role, content, tokens, summarized, created_at FROM chat_messages
+            WHERE session_id = ?
+            ORDER BY id
+            ''', (session_id,))
+            session['messages'] = [{
+                'id': message[0],
+                'role': message[1],
+                'content': message[2],
+                'tokens': message[3],
+                'summarized': bool(message[4]),
+                'created_at': message[5]
+            } for message in cursor.fetchall()]
+        
+        conn.close()
+        return session
+    
+    @timed
+    def get_chat_sessions(self):
+        """获取所有AI对话会话"""
+        logger.info("获取AI对话会话列表")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(CHAT_SESSION_SELECT + '''
+        GROUP BY s.id
+        ORDER BY s.updated_at DESC
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [self._chat_session_row_to_dict(row) for row in rows]
+    
+    @timed
+    def get_active_chat_messages(self, session_id):
+        """获取尚未并入摘要的对话消息"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT id, role, content, tokens FROM chat_messages
+        WHERE session_id = ? AND summarized = 0
+        ORDER BY id
+        ''', (session_id,))
+        messages = cursor.fetchall()
+        conn.close()
+        
+        return [{
+            'id': message[0],
+            'role': message[1],
+            'content': message[2],
+            'tokens': message[3]
+        } for message in messages]
+    
+    @timed
+    def add_chat_messages(self, session_id, messages, prompt_tokens=None):
+        """在单个事务中追加一轮对话消息
+        
+        Args:
+            messages: 消息列表，每项包含 role、content、tokens
+            prompt_tokens: 本轮请求的提示token数
+        """
+        logger.info(f"保存AI对话消息 - 会话ID: {session_id}, 条数: {len(messages)}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+            INSERT INTO chat_messages (session_id, role, content, tokens)
+            VALUES (?, ?, ?, ?)
+            ''', [(session_id, message['role'], message['content'], message.get('tokens', 0))
+                  for message in messages])
+            
+            cursor.execute('''
+            UPDATE chat_sessions
+            SET last_prompt_tokens = COALESCE(?, last_prompt_tokens), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''', (prompt_tokens, session_id))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    @timed
+    def compact_chat_session(self, session_id, message_ids, summary, summary_tokens):
+        """将指定消息并入滚动摘要（单个事务）"""
+        logger.info(f"压缩AI对话会话 - ID: {session_id}, 并入消息数: {len(message_ids)}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+            UPDATE chat_messages SET summarized = 1
+            WHERE session_id = ? AND id = ?
+            ''', [(session_id, message_id) for message_id in message_ids])
+            
+            cursor.execute('''
+            UPDATE chat_sessions
+            SET summary = ?, summary_tokens = ?, compactions = compactions + 1
+            WHERE id = ?
+            ''', (summary, summary_tokens, session_id))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    @timed
+    def delete_chat_session(self, session_id):
+        """删除AI对话会话及其消息"""
+        logger.info(f"删除AI对话会话 - ID: {session_id}")
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM chat_messages WHERE session_id = ?', (session_id,))
+        cursor.execute('DELETE FROM chat_sessions WHERE id = ?', (session_id,))
+        deleted = cursor.rowcount > 0
+        
+        conn.commit()
+        conn.close()
+        return deleted
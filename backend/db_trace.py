@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite语句追踪
+开启后 DBManager 使用带计时的连接和游标：每条语句从执行到取完结果的耗时按语句文本汇总，
+超过阈值的语句连同 EXPLAIN QUERY PLAN 写入慢查询日志（slow_query.log，由 LogManager 配置）
+"""
+
+import re
+import time
+import sqlite3
+import logging
+import threading
+from backend.config import Config
+
+# 配置日志
+logger = logging.getLogger('app.db_trace')
+
+# 慢查询日志记录器（由 LogManager.setup_slow_query_logger 配置）
+slow_query_logger = logging.getLogger('slow_query')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_statement(sql):
+    """合并空白字符，作为统计的键"""
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryTracer:
+    """语句耗时统计与慢查询记录"""
+
+    def __init__(self, enabled=None, slow_ms=None, max_statements=None):
+        """初始化语句追踪器
+
+        Args:
+            enabled: 是否开启追踪，None表示使用Config中的设置
+            slow_ms: 慢查询阈值（毫秒）
+            max_statements: 最多统计的不同语句数，超出后新语句只计入 untracked
+        """
+        self.enabled = Config.DB_TRACE_ENABLED if enabled is None else enabled
+        self.slow_ms = Config.DB_SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.max_statements = max_statements or Config.DB_TRACE_MAX_STATEMENTS
+        self._lock = threading.Lock()
+        self._statements = {}
+        self.untracked = 0
+
+    def configure(self, enabled=None, slow_ms=None):
+        """运行时开启/关闭追踪或调整慢查询阈值（对之后打开的连接生效）"""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if slow_ms is not None:
+            self.slow_ms = max(float(slow_ms), 0.0)
+        logger.info(f"SQLite语句追踪 - 开启: {self.enabled}, 慢查询阈值: {self.slow_ms} ms")
+
+    def connect(self, db_path):
+        """打开数据库连接，开启追踪时使用带计时的连接"""
+        if self.enabled:
+            return sqlite3.connect(db_path, factory=TracedConnection)
+        return sqlite3.connect(db_path)
+
+    def record(self, connection, sql, params, elapsed, rows, explain=True):
+        """记录一条语句的耗时，超过阈值时写慢查询日志（explain 为True时附带查询计划）"""
+        statement = normalize_statement(sql)
+        elapsed_ms = elapsed * 1000
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    self.untracked += 1
+                    stats = None
+                else:
+                    stats = self._statements[statement] = {
+                        'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'slow': 0
+                    }
+            if stats is not None:
+                stats['count'] += 1
+                stats['total_ms'] += elapsed_ms
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+                stats['rows'] += rows
+                if slow:
+                    stats['slow'] += 1
+
+        if slow:
+            plan = explain_query_plan(connection, sql, params) if explain else None
+            slow_query_logger.warning('%.3fms rows=%d %s | plan: %s', elapsed_ms, rows, statement,
+                                      plan if plan is not None else '-',
+                                      extra={'duration_ms': round(elapsed_ms, 3)})
+
+    def get_stats(self, sort='total_ms', limit=50):
+        """获取按语句汇总的耗时统计
+
+        Args:
+            sort: 排序字段（total_ms / max_ms / avg_ms / count / slow）
+            limit: 返回的语句数
+        """
+        with self._lock:
+            items = [
+                {
+                    'statement': statement,
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 3),
+                    'max_ms': round(stats['max_ms'], 3),
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0
+                }
+                for statement, stats in self._statements.items()
+            ]
+            untracked = self.untracked
+        if sort not in ('total_ms', 'max_ms', 'avg_ms', 'count', 'slow'):
+            sort = 'total_ms'
+        items.sort(key=lambda item: item[sort], reverse=True)
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'statements': len(items),
+            'untracked': untracked,
+            'items': items[:limit] if limit else items
+        }
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._statements.clear()
+            self.untracked = 0
+
+
+def explain_query_plan(connection, sql, params):
+    """获取语句的查询计划（多行以 ' / ' 连接），无法获取时返回None"""
+    try:
+        cursor = sqlite3.Connection.cursor(connection)
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params if params is not None else ())
+            return ' / '.join(row[3] for row in cursor.fetchall()) or None
+        finally:
+            cursor.close()
+    except sqlite3.Error:
+        return None
+
+
+class TracedCursor(sqlite3.Cursor):
+    """带计时的游标：从 execute 开始到取完结果（或游标、连接关闭）为一条语句的耗时"""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._trace_sql = None
+        self._trace_params = None
+        self._trace_elapsed = 0.0
+        self._trace_rows = 0
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._trace_sql = sql
+        self._trace_params = params
+        self._trace_elapsed = 0.0
+        self._trace_rows = 0
+
+    def _finish(self):
+        """结束当前语句的计时并记录"""
+        if self._trace_sql is None:
+            return
+        sql, self._trace_sql = self._trace_sql, None
+        rows = self._trace_rows if self._trace_rows else max(self.rowcount, 0)
+        tracer.record(self.connection, sql, self._trace_params, self._trace_elapsed, rows)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._trace_elapsed += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        self.connection._track(self)
+        self._timed(super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # 查询计划只依赖语句本身，使用第一组参数
+        seq_of_parameters = list(seq_of_parameters)
+        self._begin(sql, seq_of_parameters[0] if seq_of_parameters else None)
+        self.connection._track(self)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._trace_rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._trace_rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._trace_rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracedConnection(sqlite3.Connection):
+    """带计时的连接：游标默认使用 TracedCursor，提交、关闭前结束未取完结果的语句的计时"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = []
+
+    def _track(self, cursor):
+        if cursor not in self._pending:
+            self._pending.append(cursor)
+
+    def _finish_pending(self):
+        pending, self._pending = self._pending, []
+        for cursor in pending:
+            cursor._finish()
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # 内置的 execute 快捷方法不经过 cursor()，改为使用带计时的游标
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._finish_pending()
+        # 提交（落盘）的耗时单独记为 COMMIT
+        start = time.perf_counter()
+        super().commit()
+        tracer.record(self, 'COMMIT', None, time.perf_counter() - start, 0, explain=False)
+
+    # with conn: 的内置实现直接提交，不经过 commit()；成功时先经带计时的 commit 提交
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._finish_pending()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        self._finish_pending()
+        super().close()
+
+
+# 进程内共享的语句追踪器
+tracer = QueryTracer()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语义检索向量索引
+文档向量来自配置的 /embeddings 接口或本地哈希向量，保存为 float32 矩阵（与数据库同目录），
+文档保存后在后台增量更新：内容哈希未变的文档跳过，需要计算的文本按批请求
+"""
+
+import os
+import json
+import math
+import zlib
+import logging
+import threading
+from collections import Counter
+from backend.config import Config
+from backend.renderer import content_hash
+from backend.context_builder import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 配置日志
+logger = logging.getLogger('app.embedding_index')
+
+
+def hash_embedding(text, dim=None):
+    """本地哈希向量：词项（含中日韩双字）经带符号特征哈希映射到固定维度，并做L2归一化"""
+    dim = dim or Config.EMBEDDING_LOCAL_DIM
+    vector = np.zeros(dim, dtype=np.float32)
+    for term, count in Counter(tokenize(text)).items():
+        # 使用crc32而不是hash()，保证跨进程结果一致
+        value = zlib.crc32(term.encode('utf-8'))
+        vector[value % dim] += (1.0 + math.log(count)) * (1.0 if value & 0x80000000 else -1.0)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class EmbeddingIndex:
+    """文档向量索引"""
+
+    def __init__(self, db_manager, ai_service=None, path=None, batch_size=None):
+        """初始化向量索引，加载已保存的索引并在后台与数据库对齐
+
+        加载索引和首次获取AI服务都在后台线程中进行，构造本身不阻塞调用方（如保存文档的请求）
+
+        Args:
+            db_manager: 数据库管理器
+            ai_service: AI服务或返回AI服务的函数，配置了 embedding_model 时用于计算向量
+            path: 索引文件路径前缀（不含扩展名）
+            batch_size: 每次请求计算的文本条数
+        """
+        self.db_manager = db_manager
+        self._ai_service = ai_service
+        self.path = path or Config.EMBEDDING_INDEX_PATH
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._pending = set()
+        self._full_sync = True
+        self._busy = False
+        self._ready = threading.Event()
+        self.stats = {'embedded': 0, 'skipped': 0, 'removed': 0, 'embed_calls': 0, 'failures': 0,
+                      'searches': 0, 'last_error': None}
+        self._reset(None)
+
+        if np is None:
+            logger.warning("未安装numpy，语义检索不可用")
+            return
+
+        threading.Thread(target=self._worker, name='embedding-index', daemon=True).start()
+
+    @property
+    def ai_service(self):
+        """AI服务，传入的是函数时在首次使用时调用"""
+        if callable(self._ai_service):
+            self._ai_service = self._ai_service()
+        return self._ai_service
+
+    def _initialize(self):
+        """在后台线程中确定向量模型并加载已保存的索引"""
+        try:
+            self._reset(self._get_model())
+            self._load()
+            logger.info(f"向量索引初始化完成 - 模型: {self.model}, 文档数: {len(self.doc_ids)}")
+        except Exception as e:
+            logger.error(f"向量索引初始化异常: {str(e)}")
+            with self._lock:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = str(e)
+        finally:
+            self._ready.set()
+
+    def _get_model(self):
+        """当前使用的向量模型标识，变化时需要重建索引"""
+        model = self.ai_service.config.get('embedding_model') if self.ai_service is not None else None
+        return model or f'local-hash-{Config.EMBEDDING_LOCAL_DIM}'
+
+    def _reset(self, model):
+        """清空索引（调用方需持有锁或处于初始化阶段）"""
+        self.model = model
+        self.matrix = None
+        self.doc_ids = []
+        self.hashes = []
+        self.positions = {}
+
+    def _load(self):
+        """从磁盘加载索引，模型不一致或文件损坏时丢弃"""
+        meta_path, matrix_path = f'{self.path}.json', f'{self.path}.npy'
+        if not (os.path.exists(meta_path) and os.path.exists(matrix_path)):
+            return
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('model') != self.model:
+                logger.info(f"向量模型已变更（{meta.get('model')} -> {self.model}），重建索引")
+                return
+            matrix = np.load(matrix_path)
+            if matrix.shape[0] != len(meta['doc_ids']):
+                raise ValueError('索引矩阵与元数据不一致')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"向量索引加载失败，重建索引: {str(e)}")
+            return
+
+        self.matrix = matrix.astype(np.float32, copy=False)
+        self.doc_ids = list(meta['doc_ids'])
+        self.hashes = list(meta['hashes'])
+        self.positions = {doc_id: index for index, doc_id in enumerate(self.doc_ids)}
+
+    def _save(self):
+        """写入临时文件后替换，避免中途退出留下损坏的索引（调用方需持有锁）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        count = len(self.doc_ids)
+        matrix = self.matrix[:count] if self.matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        with open(f'{self.path}.npy.tmp', 'wb') as f:
+            np.save(f, matrix)
+        with open(f'{self.path}.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model, 'doc_ids': self.doc_ids, 'hashes': self.hashes}, f)
+        os.replace(f'{self.path}.npy.tmp', f'{self.path}.npy')
+        os.replace(f'{self.path}.json.tmp', f'{self.path}.json')
+
+    def schedule(self, doc_ids=None):
+        """登记需要更新的文档，None表示与数据库全部对齐"""
+        if np is None:
+            return
+        with self._condition:
+            if doc_ids is None:
+                self._full_sync = True
+            else:
+                self._pending.update(doc_ids)
+            self._condition.notify()
+
+    def wait_idle(self, timeout=None):
+        """等待后台更新完成"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._full_sync and not self._busy, timeout)
+
+    def _worker(self):
+        """后台线程：初始化后合并积压的更新请求统一处理"""
+        self._initialize()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._full_sync)
+                doc_ids, full_sync = self._pending, self._full_sync
+                self._pending, self._full_sync = set(), False
+                self._busy = True
+            try:
+                self._update(doc_ids, full_sync)
+            except Exception as e:
+                logger.error(f"向量索引更新异常: {str(e)}")
+                with self._lock:
+                    self.stats['failures'] += 1
+                    self.stats['last_error'] = str(e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _update(self, doc_ids, full_sync):
+        """更新指定文档的向量，内容哈希未变的跳过"""
+        model = self._get_model()
+        with self._lock:
+            if model != self.model:
+                logger.info(f"向量模型已变更（{self.model} -> {model}），重建索引")
+                self._reset(model)
+                full_sync = True
+
+        if full_sync:
+            documents = self.db_manager.get_all_documents()
+            removed = set(self.doc_ids) - {document['id'] for document in documents}
+        else:
+            documents = []
+            removed = set()
+            for doc_id in doc_ids:
+                document = self.db_manager.get_document(doc_id)
+                if document is None:
+                    removed.add(doc_id)
+                else:
+                    documents.append(document)
+
+        changed = []
+        for document in documents:
+            text = f"{document['title'] or ''}\n{document['content'] or ''}"[:Config.EMBEDDING_MAX_CHARS]
+            digest = content_hash(text)
+            position = self.positions.get(document['id'])
+            if position is not None and self.hashes[position] == digest:
+                continue
+            changed.append((document['id'], digest, text))
+
+        with self._lock:
+            self.stats['skipped'] += len(documents) - len(changed)
+            for doc_id in removed:
+                self._remove(doc_id)
+
+        for start in range(0, len(changed), self.batch_size):
+            batch = changed[start:start + self.batch_size]
+            vectors = self._embed([text for _, _, text in batch], model)
+            if vectors is None:
+                break
+            with self._lock:
+                if model != self.model:
+                    return
+                for (doc_id, digest, _), vector in zip(batch, vectors):
+                    self._set(doc_id, digest, vector)
+                self.stats['embedded'] += len(batch)
+
+        if changed or removed:
+            with self._lock:
+                self._save()
+            logger.info(f"向量索引已更新 - 计算: {len(changed)}, 删除: {len(removed)}, 文档数: {len(self.doc_ids)}")
+
+    def _embed(self, texts, model):
+        """批量计算归一化向量，失败时返回None"""
+        with self._lock:
+            self.stats['embed_calls'] += 1
+        if model.startswith('local-hash-'):
+            return np.vstack([hash_embedding(text) for text in texts])
+
+        vectors, error_msg = self.ai_service.embed(texts, model)
+        if error_msg:
+            logger.error(f"向量计算失败: {error_msg}")
+            with self._lock:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = error_msg
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _set(self, doc_id, digest, vector):
+        """写入一篇文档的向量，矩阵按倍数扩容（调用方需持有锁）"""
+        if self.matrix is not None and self.matrix.shape[1] != vector.shape[0]:
+            # 向量维度变化（如同名模型换了维度）：已有向量无法与新向量比较，清空后全量重建
+            logger.warning(f"向量维度已变更（{self.matrix.shape[1]} -> {vector.shape[0]}），重建索引")
+            self._reset(self.model)
+            self._full_sync = True
+            self._condition.notify()
+
+        position = self.positions.get(doc_id)
+        if position is None:
+            position = len(self.doc_ids)
+            if self.matrix is None:
+                self.matrix = np.zeros((16, vector.shape[0]), dtype=np.float32)
+            elif position >= self.matrix.shape[0]:
+                grown = np.zeros((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.float32)
+                grown[:position] = self.matrix[:position]
+                self.matrix = grown
+            self.doc_ids.append(doc_id)
+            self.hashes.append(digest)
+            self.positions[doc_id] = position
+        else:
+            self.hashes[position] = digest
+        self.matrix[position] = vector
+
+    def _remove(self, doc_id):
+        """删除一篇文档的向量：用最后一行填补空位（调用方需持有锁）"""
+        position = self.positions.pop(doc_id, None)
+        if position is None:
+            return
+        last = len(self.doc_ids) - 1
+        if position != last:
+            self.matrix[position] = self.matrix[last]
+            self.doc_ids[position] = self.doc_ids[last]
+            self.hashes[position] = self.hashes[last]
+            self.positions[self.doc_ids[position]] = position
+        self.doc_ids.pop()
+        self.hashes.pop()
+        self.stats['removed'] += 1
+
+    def search(self, query, top_k=10):
+        """语义检索
+
+        Returns:
+            ([{'id': 文档ID, 'score': 余弦相似度}], 错误信息)
+        """
+        if np is None:
+            return None, '未安装numpy，语义检索不可用'
+
+        self._ready.wait()
+        with self._lock:
+            model = self.model
+        if model is None:
+            return None, self.stats['last_error'] or '向量索引初始化失败'
+        vectors = self._embed([query], model)
+        if vectors is None:
+            return None, self.stats['last_error']
+
+        with self._lock:
+            self.stats['searches'] += 1
+            count = len(self.doc_ids)
+            if count == 0 or model != self.model:
+                return [], None
+            scores = self.matrix[:count] @ vectors[0]
+            top_k = min(top_k, count)
+            # argpartition选出前k个，只对这k个排序
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            order = candidates[np.argsort(-scores[candidates])]
+            return [{'id': self.doc_ids[index], 'score': round(float(scores[index]), 4)} for index in order], None
+
+    def get_stats(self):
+        """获取索引统计信息"""
+        with self._lock:
+            matrix_bytes = int(self.matrix[:len(self.doc_ids)].nbytes) if self.matrix is not None else 0
+            return {
+                'available': np is not None,
+                'model': self.model,
+                'documents': len(self.doc_ids),
+                'dim': int(self.matrix.shape[1]) if self.matrix is not None else 0,
+                'matrix_bytes': matrix_bytes,
+                'pending': len(self._pending) + (1 if self._full_sync else 0),
+                **self.stats
+            }
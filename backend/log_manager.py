@@ -3,25 +3,187 @@
 """
 日志管理器
 提供日志记录、查看和管理功能
+日志记录默认经有界队列交给后台线程写入文件和控制台，请求线程只负责入队，进程退出时写完队列中剩余的记录。
+日志文件可使用JSON行格式，每条记录带有请求ID、路由、耗时、文档ID等字段
 """
 
 import os
+import copy
+import uuid
+import atexit
 import logging
 import logging.handlers
 import json
+import threading
+from queue import Queue, Full
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+from flask import g, request, has_request_context
 from backend.config import Config
+from backend.log_reader import LogReader, parse_time_bound
+from backend.log_search import LogSearcher
+from backend.metrics import metrics, METRIC_COUNTER
+
+# 日志格式
+LOG_FORMAT_TEXT = 'text'
+LOG_FORMAT_JSON = 'json'
+
+# JSON行日志中的上下文字段（请求内记录时自动填充，也可通过 extra 传入）
+LOG_CONTEXT_FIELDS = ('request_id', 'method', 'route', 'path', 'status', 'bytes', 'duration_ms', 'duration_us',
+                      'sample_rate', 'doc_id')
+
+# 异步日志管道：[(日志记录器名称, 队列处理器, 后台监听器)]
+_pipelines = []
+_pipelines_lock = threading.Lock()
+
+
+def get_request_id() -> Optional[str]:
+    """当前请求的ID：优先使用请求头 X-Request-ID，否则生成，请求上下文之外返回None"""
+    if not has_request_context():
+        return None
+    request_id = g.get('request_id')
+    if request_id is None:
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        g.request_id = request_id
+    return request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """为请求内产生的日志记录填充请求ID、请求方法、路由和文档ID（在产生日志的线程上执行）"""
+    
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = get_request_id()
+        if getattr(record, 'method', None) is None:
+            record.method = request.method
+        if getattr(record, 'route', None) is None:
+            record.route = request.url_rule.rule if request.url_rule is not None else request.path
+        if getattr(record, 'doc_id', None) is None and request.view_args:
+            record.doc_id = request.view_args.get('doc_id')
+        return True
+
+
+class JsonLineFormatter(logging.Formatter):
+    """JSON行格式：每条记录一行JSON，time字段在最前且与文本格式的asctime相同，便于按时间定位"""
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.levelno >= logging.ERROR:
+            entry['file'] = record.pathname
+            entry['line'] = record.lineno
+            entry['function'] = record.funcName
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """有界队列处理器：队列已满时丢弃INFO及以下级别的记录并计数，WARNING及以上级别短暂等待后再丢弃"""
+    
+    def __init__(self, log_queue, block_timeout):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+            except Full:
+                self.dropped += 1
+                return
+        self.enqueued += 1
+    
+    def prepare(self, record):
+        """在产生日志的线程上展开消息参数和异常信息，格式化留给后台线程（保留异常文本供各格式使用）"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def stop_log_listeners():
+    """停止后台日志线程
+    
+    先写完队列中剩余的记录，再把文件和控制台处理器直接挂回日志记录器，之后的日志同步写入（进程退出时自动调用）
+    """
+    with _pipelines_lock:
+        pipelines = list(_pipelines)
+        _pipelines.clear()
+    for name, queue_handler, listener in pipelines:
+        listener.stop()
+        logger = logging.getLogger(name)
+        logger.removeHandler(queue_handler)
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+
+
+def get_log_queue_stats() -> Dict[str, Dict[str, int]]:
+    """获取异步日志队列统计信息（队列深度、容量、已入队和丢弃的记录数）"""
+    stats = {}
+    with _pipelines_lock:
+        for name, queue_handler, _ in _pipelines:
+            item = stats.setdefault(name, {'depth': 0, 'capacity': 0, 'enqueued': 0, 'dropped': 0})
+            item['depth'] += queue_handler.queue.qsize()
+            item['capacity'] += queue_handler.queue.maxsize
+            item['enqueued'] += queue_handler.enqueued
+            item['dropped'] += queue_handler.dropped
+    return stats
+
+
+def _collect_queue_stats(key):
+    def collect():
+        return {(name,): item[key] for name, item in get_log_queue_stats().items()}
+    return collect
+
+
+atexit.register(stop_log_listeners)
+
+# 异步日志队列指标（输出时读取当前值）
+metrics.gauge('notegen_log_queue_depth', '异步日志队列中等待写入的记录数', ('logger',), _collect_queue_stats('depth'))
+metrics.gauge('notegen_log_queue_capacity', '异步日志队列容量', ('logger',), _collect_queue_stats('capacity'))
+metrics.gauge('notegen_log_queue_dropped_total', '队列已满时丢弃的日志记录数', ('logger',),
+              _collect_queue_stats('dropped'), metric_type=METRIC_COUNTER)
+
 
 class LogManager:
     """日志管理器类"""
     
-    def __init__(self, log_dir=None):
+    def __init__(self, log_dir=None, async_logging=None, log_format=None):
         """初始化日志管理器
         
         Args:
             log_dir: 日志目录，如果为None则使用Config中的路径
+            async_logging: 是否经队列在后台线程写日志，None表示使用Config中的设置
+            log_format: 日志文件格式，'text' 或 'json'，None表示使用Config中的设置
         """
+        self.async_logging = Config.LOG_ASYNC if async_logging is None else async_logging
+        self.log_format = log_format or Config.LOG_FORMAT
         # 使用Config中的路径，如果没有提供log_dir参数
         if log_dir is None:
             self.log_dir = os.path.join(Config.EXECUTABLE_DIR, 'data', 'logs')
@@ -30,6 +192,10 @@ class LogManager:
             
         self.ensure_log_dir()
         
+        # 日志读取器（缓存行索引）和搜索引擎
+        self.reader = LogReader()
+        self.searcher = LogSearcher(self.log_dir, reader=self.reader)
+        
         # 配置应用日志
         self.setup_app_logger()
         
@@ -38,6 +204,9 @@ class LogManager:
         
         # 配置错误日志
         self.setup_error_logger()
+        
+        # 配置慢查询日志
+        self.setup_slow_query_logger()
     
     def ensure_log_dir(self):
         """确保日志目录存在"""
@@ -64,16 +233,15 @@ class LogManager:
             console_handler = logging.StreamHandler()
             console_handler.setLevel(logging.INFO)
             
-            # 设置格式
+            # 设置格式（控制台始终使用文本格式）
             formatter = logging.Formatter(
                 '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
             )
-            file_handler.setFormatter(formatter)
+            file_handler.setFormatter(self.make_file_formatter(formatter))
             console_handler.setFormatter(formatter)
             
             # 添加处理器
-            self.app_logger.addHandler(file_handler)
-            self.app_logger.addHandler(console_handler)
+            self.install_handlers(self.app_logger, [file_handler, console_handler])
     
     def setup_access_logger(self):
         """设置访问日志记录器"""
@@ -96,10 +264,10 @@ class LogManager:
             formatter = logging.Formatter(
                 '%(asctime)s - %(message)s'
             )
-            file_handler.setFormatter(formatter)
+            file_handler.setFormatter(self.make_file_formatter(formatter))
             
             # 添加处理器
-            self.access_logger.addHandler(file_handler)
+            self.install_handlers(self.access_logger, [file_handler])
     
     def setup_error_logger(self):
         """设置错误日志记录器"""
@@ -122,10 +290,77 @@ class LogManager:
                 '%(asctime)s - %(name)s - %(levelname)s - %(message)s\n'
                 '文件: %(pathname)s, 行号: %(lineno)d, 函数: %(funcName)s\n'
             )
-            file_handler.setFormatter(formatter)
+            file_handler.setFormatter(self.make_file_formatter(formatter))
             
             # 添加处理器
-            self.error_logger.addHandler(file_handler)
+            self.install_handlers(self.error_logger, [file_handler])
+    
+    def setup_slow_query_logger(self):
+        """设置慢查询日志记录器（SQLite语句追踪开启时写入）"""
+        self.slow_query_logger = logging.getLogger('slow_query')
+        self.slow_query_logger.setLevel(logging.WARNING)
+        
+        # 避免重复添加处理器
+        if not self.slow_query_logger.handlers:
+            # 文件处理器，按大小轮转
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(self.log_dir, 'slow_query.log'),
+                maxBytes=5*1024*1024,  # 5MB
+                backupCount=3,
+                encoding='utf-8'
+            )
+            file_handler.setLevel(logging.WARNING)
+            
+            # 设置格式
+            formatter = logging.Formatter(
+                '%(asctime)s - %(message)s'
+            )
+            file_handler.setFormatter(self.make_file_formatter(formatter))
+            
+            # 添加处理器
+            self.install_handlers(self.slow_query_logger, [file_handler])
+    
+    def make_file_formatter(self, text_formatter: logging.Formatter) -> logging.Formatter:
+        """日志文件使用的格式化器：JSON行格式或给定的文本格式"""
+        if self.log_format == LOG_FORMAT_JSON:
+            return JsonLineFormatter()
+        return text_formatter
+    
+    def install_handlers(self, logger: logging.Logger, handlers: List[logging.Handler]):
+        """为日志记录器添加处理器
+        
+        异步模式下记录器只挂一个有界队列处理器，由后台监听线程把记录交给实际的处理器
+        
+        Args:
+            logger: 日志记录器
+            handlers: 文件、控制台等实际写入日志的处理器
+        """
+        # 请求上下文只能在产生日志的线程上获取，过滤器挂在队列处理器（异步）或各处理器（同步）上
+        if not self.async_logging:
+            for handler in handlers:
+                handler.addFilter(RequestContextFilter())
+                logger.addHandler(handler)
+            return
+        
+        queue_handler = BoundedQueueHandler(Queue(maxsize=Config.LOG_QUEUE_SIZE), Config.LOG_QUEUE_BLOCK_TIMEOUT)
+        queue_handler.addFilter(RequestContextFilter())
+        listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        listener.start()
+        logger.addHandler(queue_handler)
+        with _pipelines_lock:
+            _pipelines.append((logger.name, queue_handler, listener))
+    
+    def get_queue_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取异步日志队列统计信息"""
+        return get_log_queue_stats()
+    
+    def close(self):
+        """写完队列中的日志，移除并关闭应用、访问、错误和慢查询日志的所有处理器"""
+        stop_log_listeners()
+        for logger in (self.app_logger, self.access_logger, self.error_logger, self.slow_query_logger):
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
     
     def get_log_files(self) -> List[Dict[str, str]]:
         """获取所有日志文件列表
@@ -149,85 +384,120 @@ class LogManager:
         
         return sorted(log_files, key=lambda x: x['modified'], reverse=True)
     
-    def get_log_content(self, file_name: str, lines: int = 100) -> Dict[str, any]:
+    def resolve_log_path(self, file_name: str) -> Optional[str]:
+        """获取日志文件路径，文件名包含路径分隔符时返回None
+        
+        Args:
+            file_name: 日志文件名
+            
+        Returns:
+            日志文件的完整路径
+        """
+        if not file_name or os.path.basename(file_name) != file_name or file_name in ('.', '..'):
+            return None
+        return os.path.join(self.log_dir, file_name)
+    
+    def get_log_content(self, file_name: str, lines: int = 100,
+                        before: Optional[int] = None, after: Optional[int] = None) -> Dict[str, any]:
         """获取日志文件内容
         
+        从文件末尾按块反向读取，不读取整个文件；总行数来自缓存的行索引
+        
         Args:
             file_name: 日志文件名
             lines: 读取的行数
+            before: 字节偏移游标，读取该位置之前的内容（向前翻页）
+            after: 字节偏移游标，读取该位置之后的内容（获取新增日志）
             
         Returns:
-            包含日志内容和元数据的字典
+            包含日志内容、元数据和分页游标的字典
         """
-        file_path = os.path.join(self.log_dir, file_name)
+        file_path = self.resolve_log_path(file_name)
         
-        if not os.path.exists(file_path):
+        if file_path is None or not os.path.exists(file_path):
             return {
                 'success': False,
                 'error': f'日志文件 {file_name} 不存在'
             }
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                # 读取最后N行
-                all_lines = f.readlines()
-                content_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
-                
-                return {
-                    'success': True,
-                    'content': ''.join(content_lines),
-                    'total_lines': len(all_lines),
-                    'showed_lines': len(content_lines),
-                    'file_size': self.format_file_size(os.path.getsize(file_path))
-                }
+            result = self.reader.read(file_path, lines, before=before, after=after)
+            return {
+                'success': True,
+                **result,
+                'file_size': self.format_file_size(result['file_bytes'])
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': f'读取日志文件失败: {str(e)}'
             }
     
-    def search_logs(self, keyword: str, file_name: Optional[str] = None, max_results: int = 100) -> Dict[str, any]:
-        """搜索日志内容
+    def get_log_range(self, file_name: str, start_time: Optional[str] = None, end_time: Optional[str] = None,
+                      lines: int = 100, after: Optional[int] = None) -> Dict[str, any]:
+        """按时间范围读取日志内容
+        
+        通过稀疏时间索引和按字节偏移的二分查找定位范围起点，不扫描整个文件
         
         Args:
-            keyword: 搜索关键词
-            file_name: 指定日志文件名，None表示搜索所有文件
-            max_results: 最大结果数
+            file_name: 日志文件名（未压缩）
+            start_time: 开始时间，格式 YYYY-MM-DD HH:MM:SS（可只写到日期、小时或分钟）
+            end_time: 结束时间（包含）
+            lines: 读取的行数
+            after: 上一页返回的 end_offset，从该位置继续读取
             
         Returns:
-            包含搜索结果的字典
+            包含日志内容、元数据和分页游标的字典
         """
-        results = []
+        file_path = self.resolve_log_path(file_name)
         
-        # 确定要搜索的文件
-        if file_name:
-            files_to_search = [file_name] if os.path.exists(os.path.join(self.log_dir, file_name)) else []
-        else:
-            files_to_search = [f for f in os.listdir(self.log_dir) if f.endswith('.log')]
+        if file_path is None or not os.path.exists(file_path):
+            return {
+                'success': False,
+                'error': f'日志文件 {file_name} 不存在'
+            }
         
-        for file_name in files_to_search:
-            file_path = os.path.join(self.log_dir, file_name)
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line_num, line in enumerate(f, 1):
-                        if keyword.lower() in line.lower():
-                            results.append({
-                                'file': file_name,
-                                'line_num': line_num,
-                                'content': line.strip()
-                            })
-                            
-                            if len(results) >= max_results:
-                                break
-            except Exception as e:
-                pass
+        start, error_msg = parse_time_bound(start_time)
+        if not error_msg:
+            end, error_msg = parse_time_bound(end_time, upper=True)
+        if error_msg:
+            return {
+                'success': False,
+                'error': error_msg
+            }
         
-        return {
-            'success': True,
-            'results': results,
-            'total': len(results)
-        }
+        try:
+            result = self.reader.read_range(file_path, start, end, lines, after=after)
+            return {
+                'success': True,
+                **result,
+                'file_size': self.format_file_size(result['file_bytes'])
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'读取日志文件失败: {str(e)}'
+            }
+    
+    def search_logs(self, keyword: str, file_name: Optional[str] = None, max_results: int = 100,
+                    **options) -> Dict[str, any]:
+        """搜索日志内容（包含轮转和压缩的历史日志）
+        
+        Args:
+            keyword: 搜索关键词
+            file_name: 日志名（包含其轮转版本）或具体文件名，None表示搜索所有文件
+            max_results: 最大结果数
+            **options: regex（正则表达式）、case_sensitive（区分大小写）、start_time / end_time（时间范围）、
+                fields（字段过滤，如 {'level': 'ERROR', 'route': '/api/documents'}）
+            
+        Returns:
+            包含搜索结果的字典
+        """
+        return self.searcher.search(keyword, file_name, max_results, **options)
+    
+    def iter_search_logs(self, keyword: str, file_name: Optional[str] = None, max_results: int = 100, **options):
+        """搜索日志内容，按文件（或分段）的任务顺序逐批返回结果事件"""
+        return self.searcher.iter_search(keyword, file_name, max_results, **options)
     
     def clear_logs(self, file_name: Optional[str] = None) -> Dict[str, any]:
         """清空日志文件
@@ -245,6 +515,7 @@ class LogManager:
                 if os.path.exists(file_path):
                     with open(file_path, 'w', encoding='utf-8') as f:
                         f.write('')
+                    self.reader.forget(file_path)
                     return {
                         'success': True,
                         'message': f'日志文件 {file_name} 已清空'
@@ -261,6 +532,7 @@ class LogManager:
                         file_path = os.path.join(self.log_dir, file_name)
                         with open(file_path, 'w', encoding='utf-8') as f:
                             f.write('')
+                self.reader.forget()
                 
                 return {
                     'success': True,
@@ -287,6 +559,7 @@ class LogManager:
                 file_path = os.path.join(self.log_dir, file_name)
                 if os.path.exists(file_path):
                     os.remove(file_path)
+                    self.reader.forget(file_path)
                     return {
                         'success': True,
                         'message': f'日志文件 {file_name} 已删除'
@@ -302,6 +575,7 @@ class LogManager:
                     if file_name.endswith('.log'):
                         file_path = os.path.join(self.log_dir, file_name)
                         os.remove(file_path)
+                self.reader.forget()
                 
                 return {
                     'success': True,
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志读取
+从文件末尾按块反向读取最后N行，分页使用字节偏移游标（before向前翻页、after读取新增内容），
+行数统计使用缓存的行索引：文件追加时只统计新增部分，被轮转或清空时重建。
+行索引同时在每个检查点记录该处第一条记录的时间（稀疏时间索引），
+按时间范围查询时先在稀疏索引中定位，再在块内按字节偏移二分查找
+"""
+
+import os
+import re
+import bisect
+import threading
+from backend.config import Config
+
+# 日志行以 asctime 开头（如 2025-01-01 12:00:00,123），按字符串比较即可判断先后
+TIMESTAMP_PATTERN = re.compile(rb'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+TIMESTAMP_LENGTH = 19
+
+# JSON行格式的日志以 {"time":"<asctime>" 开头
+JSON_TIME_PREFIX = b'{"time":"'
+
+# 判断行首时间戳需要读取的最大字节数
+TIMESTAMP_HEAD_LENGTH = len(JSON_TIME_PREFIX) + TIMESTAMP_LENGTH
+
+
+def line_time(line):
+    """行首的时间戳（bytes），没有时返回None（支持文本格式和JSON行格式）"""
+    start = len(JSON_TIME_PREFIX) if line[:len(JSON_TIME_PREFIX)] == JSON_TIME_PREFIX else 0
+    stamp = bytes(line[start:start + TIMESTAMP_LENGTH])
+    return stamp if TIMESTAMP_PATTERN.fullmatch(stamp) else None
+
+
+def parse_time_bound(value, upper=False):
+    """将时间参数转换为可与行首时间戳比较的bytes
+
+    可只写到日期、小时或分钟，缺少的部分按范围下界（或上界）补齐
+
+    Returns:
+        (时间戳, 错误信息)，value为空时时间戳为None
+    """
+    if not value:
+        return None, None
+    value = str(value).replace('T', ' ').strip()
+    padding = '9999-12-31 23:59:59' if upper else '0000-01-01 00:00:00'
+    stamp = (value + padding[len(value):])[:TIMESTAMP_LENGTH].encode('ascii', errors='replace')
+    if not TIMESTAMP_PATTERN.fullmatch(stamp):
+        return None, f'时间格式无效: {value}（应为 YYYY-MM-DD HH:MM:SS）'
+    return stamp, None
+
+
+class LineIndex:
+    """单个文件的行索引：每个检查点块起始处之前的换行数"""
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.size = 0
+        self.mtime_ns = 0
+        self.line_count = 0
+        # checkpoints[i] 为第 i 个检查点块起始偏移之前的换行数
+        self.checkpoints = [0]
+        # 稀疏时间索引：已统计完的检查点块中第一条记录的时间和偏移（按偏移递增）
+        self.mark_times = []
+        self.mark_offsets = []
+
+
+class LogReader:
+    """日志文件读取器"""
+
+    def __init__(self, block_size=None, checkpoint_size=None):
+        """初始化日志读取器
+
+        Args:
+            block_size: 反向读取时每次读取的字节数
+            checkpoint_size: 行索引检查点间隔（字节）
+        """
+        self.block_size = block_size or Config.LOG_READ_BLOCK_SIZE
+        self.checkpoint_size = checkpoint_size or Config.LOG_INDEX_CHECKPOINT_SIZE
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self.stats = {'index_builds': 0, 'index_appends': 0, 'index_hits': 0, 'bytes_read': 0, 'probes': 0}
+
+    def _count_newlines(self, f, start, end):
+        """统计 [start, end) 范围内的换行数"""
+        f.seek(start)
+        count = 0
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(self.checkpoint_size, remaining))
+            if not chunk:
+                break
+            count += chunk.count(b'\n')
+            remaining -= len(chunk)
+        self.stats['bytes_read'] += end - start
+        return count
+
+    def _get_index(self, path, f):
+        """获取文件的行索引：未变化时直接返回，追加写入时增量更新，否则重建（调用方需持有锁）"""
+        stat = os.fstat(f.fileno())
+        identity = (stat.st_dev, stat.st_ino)
+        index = self._indexes.get(path)
+
+        if index is not None and index.identity == identity and index.size == stat.st_size \
+                and index.mtime_ns == stat.st_mtime_ns:
+            self.stats['index_hits'] += 1
+            return index
+
+        if index is None or index.identity != identity or stat.st_size < index.size:
+            # 新文件、被轮转替换或被清空：重建
+            index = LineIndex(identity)
+            self.stats['index_builds'] += 1
+        else:
+            self.stats['index_appends'] += 1
+
+        # 从最后一个检查点开始补齐（该检查点之后的部分可能只统计过一部分）
+        position = (len(index.checkpoints) - 1) * self.checkpoint_size
+        count = index.checkpoints[-1]
+        while position + self.checkpoint_size <= stat.st_size:
+            count += self._count_newlines(f, position, position + self.checkpoint_size)
+            self._add_time_mark(f, index, position, position + self.checkpoint_size)
+            position += self.checkpoint_size
+            index.checkpoints.append(count)
+        index.line_count = count + self._count_newlines(f, position, stat.st_size)
+
+        # 末尾没有换行时，最后的半行也计为一行
+        if stat.st_size:
+            f.seek(stat.st_size - 1)
+            if f.read(1) != b'\n':
+                index.line_count += 1
+        index.size = stat.st_size
+        index.mtime_ns = stat.st_mtime_ns
+        self._indexes[path] = index
+        return index
+
+    def _add_time_mark(self, f, index, start, end):
+        """记录块内第一条记录的时间（时间倒退的记录不加入，保证索引有序）"""
+        offset, stamp = self._next_stamp(f, start, end)
+        if stamp is None:
+            return
+        if index.mark_times and stamp < index.mark_times[-1]:
+            return
+        index.mark_times.append(stamp)
+        index.mark_offsets.append(offset)
+
+    def _next_stamp(self, f, offset, limit):
+        """从 offset 所在行的下一行行首开始，查找 limit 之前第一条带时间戳的行
+
+        Returns:
+            (行首偏移, 时间戳)，没有时返回 (limit, None)
+        """
+        position = self._align_to_line(f, offset, limit)
+        f.seek(position)
+        while position < limit:
+            line = f.readline()
+            if not line:
+                break
+            self.stats['bytes_read'] += len(line)
+            stamp = line_time(line)
+            if stamp is not None:
+                return position, stamp
+            position += len(line)
+        return limit, None
+
+    def _find_time(self, f, index, stamp):
+        """第一条时间不早于 stamp 的记录的行首偏移
+
+        先在稀疏时间索引中定位到检查点块，再在块内按字节偏移二分查找，读取量为 O(log n)
+        """
+        position = bisect.bisect_left(index.mark_times, stamp)
+        low = index.mark_offsets[position - 1] if position else 0
+        high = index.mark_offsets[position] if position < len(index.mark_offsets) else index.size
+        answer = high
+        while high - low > self.block_size:
+            middle = (low + high) // 2
+            offset, found = self._next_stamp(f, middle, high)
+            self.stats['probes'] += 1
+            if found is None or found >= stamp:
+                if found is not None:
+                    answer = offset
+                high = middle
+            else:
+                low = offset
+
+        # 剩余范围不超过一个读取块，顺序查找
+        position = self._align_to_line(f, low, index.size)
+        f.seek(position)
+        while position < high:
+            line = f.readline()
+            if not line:
+                break
+            self.stats['bytes_read'] += len(line)
+            found = line_time(line)
+            if found is not None and found >= stamp:
+                return position
+            position += len(line)
+        return answer
+
+    def time_window(self, path, start=None, end=None):
+        """时间范围对应的字节范围
+
+        Args:
+            start / end: parse_time_bound 得到的时间戳（包含两端），None表示不限
+
+        Returns:
+            (起始偏移, 结束偏移, 起始行号)
+        """
+        with self._lock, open(path, 'rb') as f:
+            return self._time_window(f, self._get_index(path, f), start, end)
+
+    def _time_window(self, f, index, start, end):
+        low = self._find_time(f, index, start) if start is not None else 0
+        # 结束时间包含在范围内：查找第一条晚于 end 的记录
+        high = self._find_time(f, index, end + b'\x00') if end is not None else index.size
+        high = max(high, low)
+        return low, high, self._line_number(f, index, low)
+
+    def read_range(self, path, start=None, end=None, lines=100, after=None):
+        """读取时间范围内的日志
+
+        Args:
+            path: 日志文件路径
+            start / end: parse_time_bound 得到的时间戳（包含两端），None表示不限
+            lines: 读取的行数
+            after: 上一页返回的 end_offset，从该位置继续读取
+
+        Returns:
+            包含日志内容、行号和分页游标的字典
+        """
+        lines = max(int(lines), 1)
+        with self._lock, open(path, 'rb') as f:
+            index = self._get_index(path, f)
+            bytes_before = self.stats['bytes_read']
+            low, high, first_line = self._time_window(f, index, start, end)
+            position = low
+            if after is not None and int(after) > low:
+                position = self._align_to_line(f, min(int(after), high), high)
+                first_line = self._line_number(f, index, position)
+            end_offset, data = self._forward_lines(f, position, high, lines)
+            bytes_read = self.stats['bytes_read'] - bytes_before
+
+        content = data.decode('utf-8', errors='replace')
+        return {
+            'content': content,
+            'showed_lines': content.count('\n'),
+            'first_line': first_line,
+            'range_start': low,
+            'range_end': high,
+            'start_offset': position,
+            'end_offset': end_offset,
+            'has_more_after': end_offset < high,
+            'file_bytes': index.size,
+            'bytes_read': bytes_read
+        }
+
+    def _line_number(self, f, index, offset):
+        """字节偏移所在行的行号（从1开始），读取量不超过一个检查点间隔"""
+        block = min(offset // self.checkpoint_size, len(index.checkpoints) - 1)
+        start = block * self.checkpoint_size
+        return index.checkpoints[block] + self._count_newlines(f, start, offset) + 1
+
+    def _tail_lines(self, f, end, lines):
+        """从 end 处向前按块读取，返回 (起始偏移, 最后 lines 行的字节内容)"""
+        position = end
+        buffer = b''
+        # 末尾不是完整行时也算一行，因此需要 lines 个分隔换行（最后一个换行不计）
+        while position > 0:
+            size = min(self.block_size, position)
+            position -= size
+            f.seek(position)
+            buffer = f.read(size) + buffer
+            self.stats['bytes_read'] += size
+            if buffer.count(b'\n', 0, len(buffer) - 1) >= lines:
+                break
+
+        cut = len(buffer) - 1
+        for _ in range(lines):
+            cut = buffer.rfind(b'\n', 0, cut)
+            if cut < 0:
+                break
+        start = position + cut + 1 if cut >= 0 else position
+        return start, buffer[start - position:]
+
+    def _forward_lines(self, f, start, size, lines):
+        """从 start 处向后读取 lines 个完整行，返回 (结束偏移, 字节内容)"""
+        f.seek(start)
+        buffer = b''
+        position = start
+        while position < size and buffer.count(b'\n') < lines:
+            chunk = f.read(min(self.block_size, size - position))
+            if not chunk:
+                break
+            buffer += chunk
+            position += len(chunk)
+            self.stats['bytes_read'] += len(chunk)
+
+        cut = -1
+        for _ in range(lines):
+            found = buffer.find(b'\n', cut + 1)
+            if found < 0:
+                break
+            cut = found
+        # 只返回完整行，末尾正在写入的半行留到下次读取
+        return start + cut + 1, buffer[:cut + 1]
+
+    def _align_to_line(self, f, offset, size):
+        """将偏移调整到所在行的下一行行首（已位于行首时不变）"""
+        if offset == 0:
+            return 0
+        f.seek(offset - 1)
+        position = offset - 1
+        while position < size:
+            chunk = f.read(min(self.block_size, size - position))
+            if not chunk:
+                break
+            found = chunk.find(b'\n')
+            if found >= 0:
+                return position + found + 1
+            position += len(chunk)
+        return size
+
+    def read(self, path, lines=100, before=None, after=None):
+        """读取日志
+
+        Args:
+            path: 日志文件路径
+            lines: 读取的行数
+            before: 读取该字节偏移之前的 lines 行（向前翻页），None表示从文件末尾读取
+            after: 读取该字节偏移之后的 lines 行（读取新增内容）
+
+        Returns:
+            包含日志内容、行号和分页游标的字典
+        """
+        lines = max(int(lines), 1)
+        with self._lock, open(path, 'rb') as f:
+            index = self._get_index(path, f)
+            size = index.size
+            reset = False
+
+            if after is not None:
+                after = int(after)
+                if after > size:
+                    # 文件在两次读取之间被轮转或清空，从头读取
+                    after = 0
+                    reset = True
+                start = self._align_to_line(f, max(after, 0), size)
+                end, data = self._forward_lines(f, start, size, lines)
+            else:
+                end = size if before is None else min(max(int(before), 0), size)
+                start, data = self._tail_lines(f, end, lines)
+
+            first_line = self._line_number(f, index, start)
+
+        content = data.decode('utf-8', errors='replace')
+        return {
+            'content': content,
+            'total_lines': index.line_count,
+            'showed_lines': content.count('\n') + (1 if content and not content.endswith('\n') else 0),
+            'first_line': first_line,
+            'start_offset': start,
+            'end_offset': end,
+            'has_more_before': start > 0,
+            'has_more_after': end < size,
+            'file_bytes': size,
+            'reset': reset
+        }
+
+    def split(self, path, chunk_size, start=0, end=None):
+        """按行对齐将文件（或其中 [start, end) 部分）切分为若干段，借助行索引得到每段的起始行号
+
+        Returns:
+            [(起始偏移, 结束偏移, 起始行号)]
+        """
+        with self._lock, open(path, 'rb') as f:
+            index = self._get_index(path, f)
+            end = index.size if end is None else min(end, index.size)
+            step = max(chunk_size // self.checkpoint_size, 1)
+            ranges = []
+            first_line = self._line_number(f, index, start)
+            first_block = start // self.checkpoint_size + step
+            for block in range(first_block, len(index.checkpoints), step):
+                offset = block * self.checkpoint_size
+                if offset >= end:
+                    break
+                aligned = self._align_to_line(f, offset, end)
+                if aligned >= end:
+                    break
+                if aligned <= start:
+                    continue
+                ranges.append((start, aligned, first_line))
+                # 对齐时越过的换行（至多一个）计入行号
+                start, first_line = aligned, index.checkpoints[block] + (1 if aligned > offset else 0) + 1
+            ranges.append((start, end, first_line))
+            return ranges
+
+    def forget(self, path=None):
+        """丢弃文件的行索引（清空或删除日志后调用），None表示全部"""
+        with self._lock:
+            if path is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(path, None)
+
+    def get_stats(self):
+        """获取读取统计信息"""
+        with self._lock:
+            return {'indexed_files': len(self._indexes), **self.stats}
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志搜索
+搜索当前日志及其所有轮转版本（app.log.1、access.log.2025-01-01，含 .gz/.bz2/.xz 压缩文件）：
+未压缩文件通过内存映射直接做字节级正则匹配，压缩文件流式解压后逐行匹配；
+数据量较大时将文件按行切分后交给进程池并行搜索，结果按文件（或分段）的任务顺序逐批返回。
+已轮转的大文件可在后台建立三元组索引，关键词搜索时只扫描可能包含关键词的块
+"""
+
+import os
+import re
+import bz2
+import json
+import gzip
+import lzma
+import mmap
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backend.config import Config
+from backend.log_reader import TIMESTAMP_HEAD_LENGTH, line_time, parse_time_bound
+
+# 配置日志
+logger = logging.getLogger('app.log_search')
+
+COMPRESSED_OPENERS = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+# 多行记录（如错误日志的“文件: ...”行）向前查找所属记录时间的最大行数
+RECORD_LOOKBACK_LINES = 20
+
+# 三元组索引的桶数（2的幂）
+TRIGRAM_BUCKETS = 1 << 16
+
+# 文本格式日志行：应用和错误日志为 "时间 - 记录器 - 级别 - 消息"，访问日志为 "时间 - 消息"
+TEXT_LINE_PATTERN = re.compile(
+    r'(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - '
+    r'(?:(?P<logger>[\w.]+) - (?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL) - )?(?P<message>.*)', re.S)
+
+# 文本格式中也能识别的字段，以及其中在行内有固定字面形式（" - 值 - "）的字段
+TEXT_FIELDS = ('time', 'logger', 'level', 'message')
+TEXT_NEEDLE_FIELDS = ('logger', 'level')
+
+
+def parse_log_name(file_name):
+    """解析日志文件名
+
+    Returns:
+        (日志名, 轮转后缀, 压缩格式)，不是日志文件时返回None
+    """
+    name, compression = file_name, None
+    for extension in COMPRESSED_OPENERS:
+        if name.endswith('.' + extension):
+            name, compression = name[:-len(extension) - 1], extension
+            break
+    if name.endswith('.log'):
+        return name, '', compression
+    position = name.rfind('.log.')
+    if position > 0:
+        return name[:position + 4], name[position + 5:], compression
+    return None
+
+
+def _record_time(data, line_start, floor):
+    """匹配行所属记录的时间：行首没有时间戳时向前查找"""
+    position = line_start
+    for _ in range(RECORD_LOOKBACK_LINES):
+        stamp = line_time(data[position:position + TIMESTAMP_HEAD_LENGTH])
+        if stamp is not None or position <= floor:
+            return stamp
+        previous = data.rfind(b'\n', floor, position - 1)
+        position = previous + 1 if previous >= 0 else floor
+    return None
+
+
+def parse_log_line(line):
+    """将一行日志解析为字段字典（JSON行格式或文本格式），无法解析时返回None
+
+    Returns:
+        (字段字典, 是否为JSON行格式)
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='replace')
+    line = line.rstrip('\r\n')
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None, False
+        return (entry, True) if isinstance(entry, dict) else (None, False)
+    found = TEXT_LINE_PATTERN.match(line)
+    if found is None:
+        return None, False
+    return {name: value for name, value in found.groupdict().items() if value is not None}, False
+
+
+def _field_needles(name, value):
+    """字段在日志行中的字面形式（JSON行格式，以及文本格式中的记录器和级别），用于快速定位候选行"""
+    values = [value]
+    if isinstance(value, str) and value.lstrip('-').isdigit():
+        values.append(int(value))
+    elif isinstance(value, int) and not isinstance(value, bool):
+        values.append(str(value))
+    needles = [json.dumps({name: item}, ensure_ascii=False, separators=(',', ':'))[1:-1] for item in values]
+    if name in TEXT_NEEDLE_FIELDS:
+        needles.append(f' - {value} - ')
+    return needles
+
+
+def _fields_match(line, fields):
+    """日志行的字段是否与过滤条件完全一致，返回 (是否匹配, JSON行格式时的字段字典)"""
+    entry, is_json = parse_log_line(line)
+    if entry is None:
+        return False, None
+    for name, value in fields.items():
+        if name not in entry or str(entry[name]) != str(value):
+            return False, None
+    return True, entry if is_json else None
+
+
+def _in_range(stamp, query):
+    """记录时间是否在查询的时间范围内，返回 (是否匹配, 是否已超过结束时间)"""
+    if query['start'] is None and query['end'] is None:
+        return True, False
+    if stamp is None:
+        return False, False
+    if query['end'] is not None and stamp > query['end']:
+        return False, True
+    return query['start'] is None or stamp >= query['start'], False
+
+
+def _make_match(file_name, line_num, stamp, line, entry=None):
+    match = {
+        'file': file_name,
+        'line_num': line_num,
+        'time': stamp.decode('ascii') if stamp else None,
+        'content': line.rstrip(b'\r\n').decode('utf-8', errors='replace').strip()
+    }
+    if entry is not None:
+        match['fields'] = entry
+    return match
+
+
+def _search_mapped(data, regex, query, ranges, file_name):
+    """在内存映射的文件中按段搜索"""
+    matches = []
+    scanned = 0
+    for start, end, first_line in ranges:
+        end = min(end, len(data))
+        position, counted, line_num = start, start, first_line
+        while len(matches) < query['limit'] and position < end:
+            found = regex.search(data, position, end)
+            if found is None:
+                break
+            previous = data.rfind(b'\n', start, found.start())
+            line_start = previous + 1 if previous >= 0 else start
+            line_end = data.find(b'\n', found.start(), end)
+            line_end = end if line_end < 0 else line_end
+            line_num += data[counted:line_start].count(b'\n')
+            counted = line_start
+            position = line_end + 1
+
+            stamp = _record_time(data, line_start, start)
+            matched, past_end = _in_range(stamp, query)
+            if past_end:
+                # 日志按时间顺序写入，之后的记录都晚于结束时间
+                return matches, scanned + position - start
+            if not matched:
+                continue
+            line = data[line_start:line_end]
+            entry = None
+            if query['fields']:
+                matched, entry = _fields_match(line, query['fields'])
+                if not matched:
+                    continue
+            matches.append(_make_match(file_name, line_num, stamp, line, entry))
+        scanned += end - start
+    return matches, scanned
+
+
+def _search_stream(f, regex, query, file_name):
+    """逐行搜索（用于压缩文件）"""
+    matches = []
+    scanned = 0
+    stamp = None
+    for line_num, line in enumerate(f, 1):
+        scanned += len(line)
+        stamp = line_time(line) or stamp
+        if regex.search(line) is None:
+            continue
+        matched, past_end = _in_range(stamp, query)
+        if past_end:
+            break
+        if not matched:
+            continue
+        entry = None
+        if query['fields']:
+            matched, entry = _fields_match(line, query['fields'])
+            if not matched:
+                continue
+        matches.append(_make_match(file_name, line_num, stamp, line, entry))
+        if len(matches) >= query['limit']:
+            break
+    return matches, scanned
+
+
+def search_file(path, file_name, compression, ranges, query):
+    """搜索单个日志文件（或其中的若干段），可在子进程中执行
+
+    Args:
+        path: 文件路径
+        file_name: 结果中显示的文件名
+        compression: 压缩格式，None表示未压缩
+        ranges: [(起始偏移, 结束偏移, 起始行号)]，None表示整个文件
+        query: 由 LogSearcher.compile_query 生成的查询
+
+    Returns:
+        {'file': 文件名, 'matches': 匹配结果, 'bytes_scanned': 扫描字节数, 'error': 错误信息}
+    """
+    regex = re.compile(query['pattern'], query['flags'])
+    try:
+        if compression:
+            with COMPRESSED_OPENERS[compression](path, 'rb') as f:
+                matches, scanned = _search_stream(f, regex, query, file_name)
+        else:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return {'file': file_name, 'matches': [], 'bytes_scanned': 0, 'error': None}
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    matches, scanned = _search_mapped(data, regex, query, ranges or [(0, size, 1)], file_name)
+    except (OSError, EOFError, ValueError, lzma.LZMAError) as e:
+        return {'file': file_name, 'matches': [], 'bytes_scanned': 0, 'error': str(e)}
+    return {'file': file_name, 'matches': matches, 'bytes_scanned': scanned, 'error': None}
+
+
+def _clip_ranges(ranges, window):
+    """将搜索段限制在时间范围对应的字节范围内"""
+    low, high, first_line = window
+    clipped = []
+    for start, end, line_num in ranges:
+        if end <= low or start >= high:
+            continue
+        if start < low:
+            start, line_num = low, first_line
+        clipped.append((start, min(end, high), line_num))
+    return clipped
+
+
+class TrigramIndex:
+    """已轮转日志的三元组索引：文件按行对齐切分为块，记录每个（哈希后的）三元组出现在哪些块中"""
+
+    def __init__(self, signature, blocks, buckets):
+        self.signature = signature
+        # blocks[i] = (起始偏移, 结束偏移, 起始行号)
+        self.blocks = blocks
+        # buckets[哈希] = 块位图
+        self.buckets = buckets
+
+    @classmethod
+    def build(cls, path, signature, block_size):
+        """读取整个文件建立索引（三元组统一转为小写）"""
+        blocks = []
+        buckets = [0] * TRIGRAM_BUCKETS
+        mask = TRIGRAM_BUCKETS - 1
+        with open(path, 'rb') as f:
+            offset, line_num, rest = 0, 1, b''
+            while True:
+                chunk = f.read(block_size)
+                data = rest + chunk
+                if not data:
+                    break
+                cut = data.rfind(b'\n') + 1 if chunk else len(data)
+                if cut == 0:
+                    # 单行超过块大小，继续读取
+                    rest = data
+                    continue
+                block, rest = data[:cut], data[cut:]
+                bit = 1 << len(blocks)
+                lowered = block.lower()
+                for gram in {lowered[i:i + 3] for i in range(len(lowered) - 2)}:
+                    buckets[hash(gram) & mask] |= bit
+                blocks.append((offset, offset + cut, line_num))
+                offset += cut
+                line_num += block.count(b'\n')
+        return cls(signature, blocks, buckets)
+
+    def candidates(self, literal):
+        """可能包含关键词的块（相邻块合并），关键词少于3字节时返回None表示无法过滤"""
+        literal = literal.lower()
+        if len(literal) < 3:
+            return None
+        mask = TRIGRAM_BUCKETS - 1
+        bitmap = (1 << len(self.blocks)) - 1
+        for gram in {literal[i:i + 3] for i in range(len(literal) - 2)}:
+            bitmap &= self.buckets[hash(gram) & mask]
+            if not bitmap:
+                return []
+
+        ranges = []
+        for number, (start, end, first_line) in enumerate(self.blocks):
+            if not bitmap >> number & 1:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end, ranges[-1][2])
+            else:
+                ranges.append((start, end, first_line))
+        return ranges
+
+
+class LogSearcher:
+    """日志搜索引擎"""
+
+    def __init__(self, log_dir, reader=None, workers=None, parallel_min_bytes=None, chunk_size=None,
+                 trigram_enabled=None, trigram_min_bytes=None):
+        """初始化日志搜索引擎
+
+        Args:
+            log_dir: 日志目录
+            reader: 日志读取器（LogReader），用于按行切分大文件并得到起始行号
+            workers: 进程池大小，小于2时在当前进程中搜索
+            parallel_min_bytes: 待搜索数据超过该字节数时才使用进程池
+            chunk_size: 大文件切分的每段字节数
+            trigram_enabled: 是否为已轮转的大文件建立三元组索引
+            trigram_min_bytes: 建立三元组索引的最小文件大小
+        """
+        self.log_dir = log_dir
+        self.reader = reader
+        self.workers = workers if workers is not None else Config.LOG_SEARCH_WORKERS
+        self.parallel_min_bytes = parallel_min_bytes if parallel_min_bytes is not None \
+            else Config.LOG_SEARCH_PARALLEL_MIN_BYTES
+        self.chunk_size = chunk_size or Config.LOG_SEARCH_CHUNK_SIZE
+        self.trigram_enabled = trigram_enabled if trigram_enabled is not None else Config.LOG_TRIGRAM_INDEX_ENABLED
+        self.trigram_min_bytes = trigram_min_bytes if trigram_min_bytes is not None else Config.LOG_TRIGRAM_MIN_BYTES
+        self._lock = threading.Lock()
+        self._executor = None
+        self._trigrams = {}
+        self._building = set()
+        self.stats = {'searches': 0, 'parallel_searches': 0, 'bytes_scanned': 0, 'bytes_skipped': 0,
+                      'trigram_builds': 0, 'errors': 0}
+
+    def list_files(self, file_name=None):
+        """列出要搜索的日志文件（含轮转和压缩版本），按修改时间从新到旧排列
+
+        Args:
+            file_name: 日志名（如 app.log，包含其所有轮转版本）或具体的文件名，None表示全部
+        """
+        files = []
+        for name in os.listdir(self.log_dir):
+            parsed = parse_log_name(name)
+            if parsed is None:
+                continue
+            base, generation, compression = parsed
+            if file_name and file_name not in (name, base):
+                continue
+            path = os.path.join(self.log_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append({'name': name, 'path': path, 'base': base, 'generation': generation,
+                          'compression': compression, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                          'signature': (stat.st_ino, stat.st_size, stat.st_mtime_ns)})
+        return sorted(files, key=lambda item: item['mtime'], reverse=True)
+
+    @staticmethod
+    def compile_query(keyword, regex=False, case_sensitive=False, start_time=None, end_time=None, limit=100,
+                      fields=None):
+        """生成查询
+
+        Args:
+            keyword: 关键词或正则表达式
+            regex: keyword 是否为正则表达式
+            case_sensitive: 是否区分大小写
+            start_time / end_time: 时间范围，格式 YYYY-MM-DD HH:MM:SS（可只写到日期或分钟）
+            limit: 最大结果数
+            fields: 字段过滤条件（如 {'level': 'ERROR', 'route': '/api/documents'}），
+                JSON行格式的日志按字段完全匹配，文本格式的日志只能识别 time/logger/level/message
+
+        Returns:
+            (查询, 错误信息)
+        """
+        if fields is not None and (not isinstance(fields, dict) or not all(isinstance(name, str) for name in fields)):
+            return None, '字段过滤条件格式无效'
+        fields = {name: value for name, value in (fields or {}).items() if value not in (None, '')}
+
+        if keyword:
+            pattern = keyword.encode('utf-8')
+            if not regex:
+                pattern = re.escape(pattern)
+        elif fields:
+            # 没有关键词时直接在文件中查找一个字段的字面形式，再逐行核对所有字段；
+            # 文本格式的 time/message 在行内没有字面形式，只有这类字段时逐行扫描
+            searchable = [(name, value) for name, value in fields.items()
+                          if name not in TEXT_FIELDS or name in TEXT_NEEDLE_FIELDS]
+            if searchable:
+                name, value = searchable[0]
+                pattern = b'|'.join(re.escape(needle.encode('utf-8')) for needle in _field_needles(name, value))
+            else:
+                pattern = b''
+            regex = True
+        else:
+            pattern = b''
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            return None, f'正则表达式无效: {str(e)}'
+
+        start, error_msg = parse_time_bound(start_time)
+        if error_msg:
+            return None, error_msg
+        end, error_msg = parse_time_bound(end_time, upper=True)
+        if error_msg:
+            return None, error_msg
+
+        return {
+            'pattern': pattern,
+            'flags': flags,
+            # 非正则关键词可使用三元组索引过滤
+            'literal': None if regex or not keyword else keyword.encode('utf-8'),
+            'start': start,
+            'end': end,
+            'fields': fields,
+            'limit': max(int(limit), 1)
+        }, None
+
+    def _plan(self, files, query):
+        """为每个文件生成搜索任务：按时间范围跳过整个文件，用三元组索引缩小范围，大文件按行切分"""
+        tasks = []
+        skipped = 0
+        for item in files:
+            # 文件最后修改时间早于开始时间时，其中的记录都不在范围内
+            if query['start'] is not None and \
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['mtime'])).encode('ascii') < query['start']:
+                skipped += item['size']
+                continue
+
+            if item['compression']:
+                tasks.append((item, None, item['size']))
+                continue
+
+            # 有时间范围时通过稀疏时间索引二分定位，只搜索范围内的部分
+            window = None
+            if self.reader is not None and (query['start'] is not None or query['end'] is not None):
+                try:
+                    window = self.reader.time_window(item['path'], query['start'], query['end'])
+                except OSError:
+                    window = None
+            low, high = (window[0], window[1]) if window else (0, item['size'])
+
+            ranges = None
+            index = self._get_trigram_index(item)
+            if index is not None and query['literal'] is not None:
+                ranges = index.candidates(query['literal'])
+            if window:
+                ranges = _clip_ranges(ranges, window) if ranges is not None else [window][:window[1] > window[0]]
+
+            if ranges is not None:
+                skipped += item['size'] - sum(end - start for start, end, _ in ranges)
+                if not ranges:
+                    continue
+
+            if self.reader is not None and high - low > self.chunk_size and (ranges is None or ranges == [window]):
+                try:
+                    ranges = self.reader.split(item['path'], self.chunk_size, low, high)
+                except OSError:
+                    pass
+
+            if ranges is None:
+                tasks.append((item, None, item['size']))
+                continue
+            # 相邻的段合并为不超过 chunk_size 的任务
+            group, group_bytes = [], 0
+            for segment in ranges:
+                group.append(segment)
+                group_bytes += segment[1] - segment[0]
+                if group_bytes >= self.chunk_size:
+                    tasks.append((item, group, group_bytes))
+                    group, group_bytes = [], 0
+            if group:
+                tasks.append((item, group, group_bytes))
+        return tasks, skipped
+
+    def _get_trigram_index(self, item):
+        """获取已轮转大文件的三元组索引，尚未建立时在后台建立"""
+        if not self.trigram_enabled or item['compression'] or not item['generation'] \
+                or item['size'] < self.trigram_min_bytes:
+            return None
+        with self._lock:
+            index = self._trigrams.get(item['path'])
+            if index is not None and index.signature == item['signature']:
+                return index
+            if item['path'] in self._building:
+                return None
+            self._building.add(item['path'])
+        threading.Thread(target=self._build_trigram_index, args=(item,),
+                         name='log-trigram-index', daemon=True).start()
+        return None
+
+    def _build_trigram_index(self, item):
+        try:
+            start = time.perf_counter()
+            index = TrigramIndex.build(item['path'], item['signature'], Config.LOG_TRIGRAM_BLOCK_SIZE)
+            with self._lock:
+                self._trigrams[item['path']] = index
+                self.stats['trigram_builds'] += 1
+            logger.info(f"日志三元组索引建立完成 - 文件: {item['name']}, 块数: {len(index.blocks)}, "
+                        f"耗时: {time.perf_counter() - start:.2f}秒")
+        except OSError as e:
+            logger.warning(f"日志三元组索引建立失败 - 文件: {item['name']}, 错误: {str(e)}")
+        finally:
+            with self._lock:
+                self._building.discard(item['path'])
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_tasks(self, tasks, query):
+        """执行搜索任务，按任务顺序逐个返回结果（结果截断时与是否并行无关）；
+        数据量大时使用进程池，进程池不可用时回退到当前进程"""
+        total_bytes = sum(task_bytes for _, _, task_bytes in tasks)
+        if self.workers >= 2 and len(tasks) > 1 and total_bytes >= self.parallel_min_bytes:
+            with self._lock:
+                self.stats['parallel_searches'] += 1
+            remaining = list(tasks)
+            try:
+                executor = self._get_executor()
+                futures = [executor.submit(search_file, item['path'], item['name'], item['compression'], ranges, query)
+                           for item, ranges, _ in tasks]
+                try:
+                    for future in futures:
+                        result = future.result()
+                        remaining.pop(0)
+                        yield result
+                finally:
+                    for future in futures:
+                        future.cancel()
+                return
+            except BrokenProcessPool as e:
+                logger.warning(f"日志搜索进程池不可用，改为在当前进程中搜索: {str(e)}")
+                self._reset_executor()
+                tasks = remaining
+
+        for item, ranges, _ in tasks:
+            yield search_file(item['path'], item['name'], item['compression'], ranges, query)
+
+    def iter_search(self, keyword, file_name=None, max_results=100, regex=False, case_sensitive=False,
+                    start_time=None, end_time=None, fields=None):
+        """搜索日志，以事件形式逐批返回结果
+
+        Yields:
+            {'type': 'matches', 'file': 文件名, 'results': [...]}
+            {'type': 'error', 'file': 文件名, 'error': 错误信息}
+            {'type': 'done', 'total': 结果数, 'truncated': 是否达到上限, 'files': 文件数, ...}
+        """
+        started = time.perf_counter()
+        query, error_msg = self.compile_query(keyword, regex, case_sensitive, start_time, end_time, max_results,
+                                              fields)
+        if error_msg:
+            yield {'type': 'error', 'file': None, 'error': error_msg}
+            return
+
+        files = self.list_files(file_name)
+        tasks, skipped = self._plan(files, query)
+        total, scanned, errors = 0, 0, 0
+        results = self._run_tasks(tasks, query)
+        try:
+            for result in results:
+                scanned += result['bytes_scanned']
+                if result['error']:
+                    errors += 1
+                    logger.warning(f"搜索日志文件失败 - 文件: {result['file']}, 错误: {result['error']}")
+                    yield {'type': 'error', 'file': result['file'], 'error': result['error']}
+                    continue
+                matches = result['matches'][:query['limit'] - total]
+                if matches:
+                    total += len(matches)
+                    yield {'type': 'matches', 'file': result['file'], 'results': matches}
+                if total >= query['limit']:
+                    break
+        finally:
+            results.close()
+
+        with self._lock:
+            self.stats['searches'] += 1
+            self.stats['bytes_scanned'] += scanned
+            self.stats['bytes_skipped'] += skipped
+            self.stats['errors'] += errors
+        yield {
+            'type': 'done',
+            'total': total,
+            'truncated': total >= query['limit'],
+            'files': len(files),
+            'bytes_scanned': scanned,
+            'bytes_skipped': skipped,
+            'elapsed': round(time.perf_counter() - started, 4)
+        }
+
+    def search(self, keyword, file_name=None, max_results=100, **options):
+        """搜索日志并汇总结果（按文件从新到旧、行号从小到大排列）"""
+        order = {item['name']: position for position, item in enumerate(self.list_files(file_name))}
+        results, errors = [], []
+        summary = {}
+        for event in self.iter_search(keyword, file_name, max_results, **options):
+            if event['type'] == 'matches':
+                results.extend(event['results'])
+            elif event['type'] == 'error':
+                if event['file'] is None:
+                    return {'success': False, 'error': event['error']}
+                errors.append({'file': event['file'], 'error': event['error']})
+            else:
+                summary = event
+        results.sort(key=lambda match: (order.get(match['file'], len(order)), match['line_num']))
+        summary.pop('type', None)
+        return {'success': True, 'results': results, 'errors': errors, **summary}
+
+    def get_stats(self):
+        """获取搜索统计信息"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'trigram_indexes': len(self._trigrams),
+                'trigram_building': len(self._building),
+                **self.stats
+            }
+
+    def close(self):
+        """关闭进程池"""
+        self._reset_executor()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标
+进程内的计数器、直方图和按需采集的仪表，以Prometheus文本格式输出（/api/metrics）。
+每个线程固定使用一个分片记录，分片各有一把锁，记录时几乎不发生锁竞争；输出时再合并各分片
+"""
+
+import abc
+import bisect
+import itertools
+import logging
+import math
+import threading
+from backend.config import Config
+
+# 配置日志
+logger = logging.getLogger('app.metrics')
+
+# 指标类型
+METRIC_COUNTER = 'counter'
+METRIC_HISTOGRAM = 'histogram'
+METRIC_GAUGE = 'gauge'
+
+# 输出的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 线程 -> 分片序号（首次记录时轮流分配）
+_thread_local = threading.local()
+_stripe_counter = itertools.count()
+
+
+def _stripe_index(stripes):
+    index = getattr(_thread_local, 'stripe', None)
+    if index is None:
+        index = next(_stripe_counter)
+        _thread_local.stripe = index
+    return index % stripes
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def _label_values(labels):
+    """标签值统一转为字符串（None 等混入时排序不会出错）"""
+    return tuple(str(label) for label in labels)
+
+
+class _Metric(abc.ABC):
+    """指标基类：按标签值（元组）分别计数，记录写入当前线程的分片"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=(), stripes=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.stripes = stripes or Config.METRICS_STRIPES
+        self._shards = [(threading.Lock(), {}) for _ in range(self.stripes)]
+
+    def _shard(self):
+        return self._shards[_stripe_index(self.stripes)]
+
+    @abc.abstractmethod
+    def _collect(self):
+        """合并各分片，返回 {标签值: 值}"""
+
+    @abc.abstractmethod
+    def _render(self, lines):
+        """将各组标签的值追加到输出行"""
+
+    def render(self):
+        """以Prometheus文本格式输出"""
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.metric_type}']
+        self._render(lines)
+        return lines
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    metric_type = METRIC_COUNTER
+
+    def inc(self, *labels, amount=1):
+        """计数加 amount，labels 按 labelnames 的顺序传入"""
+        labels = _label_values(labels)
+        lock, values = self._shard()
+        with lock:
+            values[labels] = values.get(labels, 0) + amount
+
+    def _collect(self):
+        merged = {}
+        for lock, values in self._shards:
+            with lock:
+                items = list(values.items())
+            for labels, value in items:
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def get(self, *labels):
+        """获取某组标签的累计值"""
+        return self._collect().get(_label_values(labels), 0)
+
+    def _render(self, lines):
+        for labels, value in sorted(self._collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+
+
+class Histogram(_Metric):
+    """直方图：记录各桶的计数、总和与次数"""
+
+    metric_type = METRIC_HISTOGRAM
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None, stripes=None):
+        super().__init__(name, documentation, labelnames, stripes)
+        self.buckets = tuple(sorted(buckets or Config.METRICS_LATENCY_BUCKETS))
+
+    def observe(self, value, *labels):
+        """记录一次观测值，labels 按 labelnames 的顺序传入"""
+        index = bisect.bisect_left(self.buckets, value)
+        labels = _label_values(labels)
+        lock, values = self._shard()
+        with lock:
+            # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+            state = values.get(labels)
+            if state is None:
+                state = values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _collect(self):
+        merged = {}
+        for lock, values in self._shards:
+            with lock:
+                items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in values.items()]
+            for labels, (counts, total, count) in items:
+                state = merged.get(labels)
+                if state is None:
+                    merged[labels] = [counts, total, count]
+                    continue
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+        return merged
+
+    def get(self, *labels):
+        """获取某组标签的 (次数, 总和)"""
+        state = self._collect().get(_label_values(labels))
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    def _render(self, lines):
+        for labels, (counts, total, count) in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+
+
+class Gauge(_Metric):
+    """仪表：输出时调用采集函数取当前值
+
+    采集函数返回数值（无标签时）或 {标签值元组: 数值}
+    """
+
+    def __init__(self, name, documentation, labelnames=(), collect=None, metric_type=METRIC_GAUGE):
+        super().__init__(name, documentation, labelnames, stripes=1)
+        self.collect_func = collect
+        self.metric_type = metric_type
+
+    def _collect(self):
+        if self.collect_func is None:
+            return {}
+        values = self.collect_func()
+        if values is None:
+            return {}
+        if not isinstance(values, dict):
+            return {(): values}
+        return {_label_values(labels): value for labels, value in values.items()}
+
+    def _render(self, lines):
+        for labels, value in sorted(self._collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次，重复注册时返回已有实例"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"指标已以其他类型注册: {name}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """注册计数器"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        """注册直方图"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def gauge(self, name, documentation, labelnames=(), collect=None, metric_type=METRIC_GAUGE):
+        """注册按需采集的仪表（metric_type 可设为 counter，用于输出其他模块维护的累计值）；
+        重复注册时替换采集函数"""
+        metric = self._register(Gauge, name, documentation, labelnames, collect=collect, metric_type=metric_type)
+        if collect is not None:
+            metric.collect_func = collect
+        return metric
+
+    def render(self):
+        """以Prometheus文本格式输出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"指标采集失败 - {metric.name}: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内共享的指标注册表
+metrics = MetricsRegistry()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限流器
+令牌桶实现，以及按客户端和全局两级限流的AI请求限流器
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from backend.config import Config
+
+
+class TokenBucket:
+    """令牌桶：以固定速率补充令牌，容量决定允许的突发量"""
+
+    def __init__(self, rate, capacity=None):
+        """初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量，默认等于 rate（至少为1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """按时间补充令牌（调用方需持有锁）"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """尝试获取令牌
+
+        Returns:
+            (是否成功, 需要等待的秒数)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0.0
+            wait = (tokens - self.tokens) / self.rate if self.rate > 0 else float('inf')
+            return False, wait
+
+    def refund(self, tokens=1):
+        """归还令牌（请求最终未被执行时）"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def available(self):
+        """当前可用的令牌数"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def acquire(self, tokens=1, cancel_event=None):
+        """阻塞获取令牌，cancel_event 被设置时放弃
+
+        Returns:
+            是否获取成功
+        """
+        while True:
+            acquired, wait = self.try_acquire(tokens)
+            if acquired:
+                return True
+            if cancel_event is not None:
+                if cancel_event.wait(min(wait, 1.0)):
+                    return False
+            else:
+                time.sleep(min(wait, 1.0))
+
+
+class RateLimiter:
+    """AI请求限流器：每个客户端一个令牌桶，另有一个全局令牌桶，速率为0表示不限制"""
+
+    def __init__(self, client_rate=None, client_burst=None, global_rate=None, global_burst=None, max_clients=None):
+        """初始化限流器
+
+        Args:
+            client_rate: 每个客户端每分钟允许的请求数
+            client_burst: 每个客户端允许的突发请求数
+            global_rate: 所有客户端合计每分钟允许的请求数
+            global_burst: 全局允许的突发请求数
+            max_clients: 最多跟踪的客户端数，超出时淘汰最久未访问的客户端
+        """
+        self.client_rate = Config.AI_RATE_LIMIT_PER_MINUTE if client_rate is None else client_rate
+        self.client_burst = client_burst or Config.AI_RATE_LIMIT_BURST
+        self.global_rate = Config.AI_GLOBAL_RATE_LIMIT_PER_MINUTE if global_rate is None else global_rate
+        self.global_burst = global_burst or Config.AI_GLOBAL_RATE_LIMIT_BURST
+        self.max_clients = max_clients or Config.AI_RATE_LIMIT_MAX_CLIENTS
+        self.global_bucket = TokenBucket(self.global_rate / 60.0, self.global_burst) if self.global_rate else None
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.active_streams = 0
+        self.stats = {'allowed': 0, 'rejected_client': 0, 'rejected_global': 0, 'rejected_queue': 0}
+
+    def _get_client(self, client_id):
+        """获取客户端状态，不存在时创建（调用方需持有锁）"""
+        client = self._clients.get(client_id)
+        if client is None:
+            client = {'bucket': TokenBucket(self.client_rate / 60.0, self.client_burst),
+                      'allowed': 0, 'rejected': 0, 'last_seen': None}
+            self._clients[client_id] = client
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client_id)
+        client['last_seen'] = time.time()
+        return client
+
+    def check(self, client_id):
+        """检查请求是否允许执行
+
+        Returns:
+            (是否允许, 建议重试等待秒数, 拒绝范围 'client' / 'global' / None)
+        """
+        client = None
+        if self.client_rate:
+            with self._lock:
+                client = self._get_client(client_id)
+            allowed, wait = client['bucket'].try_acquire()
+            if not allowed:
+                with self._lock:
+                    client['rejected'] += 1
+                    self.stats['rejected_client'] += 1
+                return False, wait, 'client'
+
+        if self.global_bucket is not None:
+            allowed, wait = self.global_bucket.try_acquire()
+            if not allowed:
+                # 全局限流时不消耗客户端配额
+                if client is not None:
+                    client['bucket'].refund()
+                with self._lock:
+                    self.stats['rejected_global'] += 1
+                return False, wait, 'global'
+
+        with self._lock:
+            if client is not None:
+                client['allowed'] += 1
+            self.stats['allowed'] += 1
+        return True, 0.0, None
+
+    def record_queue_rejection(self):
+        """记录一次因积压超过阈值而被拒绝的请求"""
+        with self._lock:
+            self.stats['rejected_queue'] += 1
+
+    def stream_started(self):
+        with self._lock:
+            self.active_streams += 1
+
+    def stream_finished(self):
+        with self._lock:
+            self.active_streams -= 1
+
+    def get_stats(self, recent_clients=20):
+        """获取限流统计信息及最近活跃客户端的状态"""
+        with self._lock:
+            clients = list(self._clients.items())[-recent_clients:]
+            stats = {
+                'client_rate_per_minute': self.client_rate,
+                'client_burst': self.client_burst,
+                'global_rate_per_minute': self.global_rate,
+                'global_burst': self.global_burst,
+                'tracked_clients': len(self._clients),
+                'active_streams': self.active_streams,
+                **self.stats
+            }
+        stats['global_tokens'] = round(self.global_bucket.available(), 2) if self.global_bucket is not None else None
+        stats['clients'] = [{
+            'client': client_id,
+            'tokens': round(client['bucket'].available(), 2),
+            'allowed': client['allowed'],
+            'rejected': client['rejected'],
+            'last_seen': client['last_seen']
+        } for client_id, client in reversed(clients)]
+        return stats
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown渲染服务
+负责Markdown渲染、大纲(TOC)提取以及按内容哈希缓存渲染结果
+"""
+
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+import markdown
+from markdown.extensions.toc import TocExtension, slugify as toc_slugify
+from backend.config import Config
+from backend.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger('app.renderer')
+
+# 渲染缓存查询次数（result 为 hit / miss）
+RENDER_CACHE_REQUESTS = metrics.counter('notegen_render_cache_requests_total', 'Markdown渲染缓存查询次数', ('result',))
+
+# 渲染使用的Markdown扩展（移除代码高亮）
+MARKDOWN_EXTENSIONS = [
+    'tables',
+    'toc',
+    'fenced_code'
+]
+
+# 标题识别用的正则
+ATX_HEADING_RE = re.compile(r'^ {0,3}(?:> ?)*(#{1,6})(?:[ \t]+|$)')
+SETEXT_UNDERLINE_RE = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+REFERENCE_DEF_RE = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S')
+
+
+def content_hash(content):
+    """计算内容哈希，作为缓存键"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def scan_heading_lines(content):
+    """扫描源文本中的标题所在行
+
+    Args:
+        content: Markdown源文本
+
+    Returns:
+        列表，每个元素为 (级别, 行号(从1开始), 字符偏移)
+    """
+    headings = []
+    lines = content.split('\n')
+    offset = 0
+    fence = None
+    prev_offset = 0
+    prev_is_text = False
+
+    for index, line in enumerate(lines):
+        line_offset = offset
+        offset += len(line) + 1
+
+        # 跳过围栏代码块
+        fence_match = FENCE_RE.match(line)
+        if fence:
+            if fence_match and fence_match.group(1)[0] == fence[0] and len(fence_match.group(1)) >= len(fence):
+                fence = None
+            prev_is_text = False
+            continue
+        if fence_match:
+            fence = fence_match.group(1)
+            prev_is_text = False
+            continue
+
+        atx_match = ATX_HEADING_RE.match(line)
+        if atx_match:
+            headings.append((len(atx_match.group(1)), index + 1, line_offset))
+            prev_is_text = False
+            continue
+
+        # Setext标题：非空段落行下方紧跟 === 或 ---
+        setext_match = SETEXT_UNDERLINE_RE.match(line)
+        if setext_match and prev_is_text:
+            level = 1 if setext_match.group(1)[0] == '=' else 2
+            headings.append((level, index, prev_offset))
+            prev_is_text = False
+            continue
+
+        prev_offset = line_offset
+        prev_is_text = bool(line.strip()) and not line.startswith('    ')
+
+    return headings
+
+
+def split_sections(content, split_level=2):
+    """在标题边界处切分文档
+
+    Args:
+        content: Markdown源文本
+        split_level: 在级别小于等于该值的标题处切分
+
+    Returns:
+        (源文本行列表, 分段列表)，分段的行号区间为 [start_line, end_line)，从0开始
+    """
+    lines = content.split('\n')
+    boundaries = [
+        (level, line - 1) for level, line, _ in scan_heading_lines(content)
+        if level <= split_level
+    ]
+
+    sections = []
+    starts = [line for _, line in boundaries]
+    if not starts or starts[0] > 0:
+        # 第一个标题之前的内容作为前言段
+        boundaries.insert(0, (0, 0))
+        starts.insert(0, 0)
+    starts.append(len(lines))
+
+    for index, (level, start) in enumerate(boundaries):
+        end = starts[index + 1]
+        sections.append({
+            'index': index,
+            'level': level,
+            'title': lines[start].strip().lstrip('>').strip().strip('#').strip() if level else '',
+            'start_line': start,
+            'end_line': end,
+            'length': sum(len(line) + 1 for line in lines[start:end])
+        })
+
+    return lines, sections
+
+
+class MarkdownRenderer:
+    """Markdown渲染器，按内容哈希缓存HTML和TOC"""
+
+    def __init__(self, cache_size=None):
+        logger.info("初始化Markdown渲染器")
+        self.cache_size = cache_size or Config.RENDER_CACHE_SIZE
+        self._cache = OrderedDict()
+        # 分段文档（含已渲染的分段HTML），与整篇文档的渲染缓存分开
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Markdown渲染器初始化完成 - 缓存容量: {self.cache_size}")
+
+    def _get_markdown(self):
+        """获取线程私有的Markdown实例（Markdown对象非线程安全）"""
+        md = getattr(self._local, 'md', None)
+        if md is None:
+            md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+            self._local.md = md
+        return md
+
+    def _get_section_markdown(self):
+        """获取线程私有的分段渲染用Markdown实例，标题锚点取自预先分配的锚点"""
+        md = getattr(self._local, 'section_md', None)
+        if md is None:
+            extensions = [TocExtension(slugify=self._section_slugify) if name == 'toc' else name
+                          for name in MARKDOWN_EXTENSIONS]
+            md = markdown.Markdown(extensions=extensions)
+            self._local.section_md = md
+        return md
+
+    def _section_slugify(self, value, separator):
+        anchors = getattr(self._local, 'anchors', None)
+        if anchors:
+            return anchors.popleft()
+        return toc_slugify(value, separator)
+
+    def _get_entry(self, content):
+        """获取缓存条目，未命中时渲染并写入缓存"""
+        key = content_hash(content)
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                RENDER_CACHE_REQUESTS.inc('hit')
+                return key, entry, True
+            self.misses += 1
+        RENDER_CACHE_REQUESTS.inc('miss')
+
+        md = self._get_markdown()
+        md.reset()
+        html = md.convert(content)
+        entry = {
+            'html': html,
+            'toc_tokens': md.toc_tokens,
+            'content': content,
+            'outline': None
+        }
+
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return key, entry, False
+
+    def render(self, content):
+        """渲染Markdown
+
+        Returns:
+            (html, 是否命中缓存)
+        """
+        _, entry, cached = self._get_entry(content)
+        return entry['html'], cached
+
+    def get_outline(self, content=None, content_key=None):
+        """获取文档大纲
+
+        Args:
+            content: Markdown源文本
+            content_key: 内容哈希，仅在已缓存时可单独使用
+
+        Returns:
+            (大纲字典, 是否命中缓存)，哈希未命中且未提供内容时返回 (None, False)
+        """
+        if content is None:
+            with self._lock:
+                entry = self._cache.get(content_key)
+                if entry is None:
+                    self.misses += 1
+                    return None, False
+                self._cache.move_to_end(content_key)
+                self.hits += 1
+            key = content_key
+            cached = True
+        else:
+            key, entry, cached = self._get_entry(content)
+
+        outline = entry['outline']
+        if outline is None:
+            outline = {
+                'hash': key,
+                'headings': self._build_outline(entry['toc_tokens'], entry['content'])
+            }
+            entry['outline'] = outline
+        return outline, cached
+
+    def _build_outline(self, toc_tokens, content):
+        """将toc扩展输出的标题树补充上行号和字符偏移"""
+        source_headings = scan_heading_lines(content)
+        position = [0]
+
+        def locate(level):
+            # 按文档顺序匹配同级别标题
+            for index in range(position[0], len(source_headings)):
+                if source_headings[index][0] == level:
+                    position[0] = index + 1
+                    return source_headings[index]
+            return None
+
+        def convert(tokens):
+            nodes = []
+            for token in tokens:
+                located = locate(token['level'])
+                node = {
+                    'level': token['level'],
+                    'anchor': token['id'],
+                    'title': token['name'],
+                    'line': located[1] if located else None,
+                    'offset': located[2] if located else None
+                }
+                node['children'] = convert(token.get('children', []))
+                nodes.append(node)
+            return nodes
+
+        return convert(toc_tokens)
+
+    def paginate(self, content, split_level=None):
+        """分段渲染：返回分段索引，分段HTML按需通过 render_sections 获取
+
+        Returns:
+            分段索引字典
+        """
+        split_level = split_level or Config.RENDER_SPLIT_LEVEL
+        key = f"{content_hash(content)}:{split_level}"
+
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+
+        if document is None:
+            lines, sections = split_sections(content, split_level)
+            # 引用式链接定义附加到每一段，保证分段渲染时链接仍可解析
+            references = [line for line in lines if REFERENCE_DEF_RE.match(line)]
+            document = {
+                'lines': lines,
+                'sections': sections,
+                'references': '\n'.join(references),
+                'anchors': self._assign_anchors(content, lines, sections),
+                'html': {}
+            }
+            with self._lock:
+                self._documents[key] = document
+                while len(self._documents) > Config.RENDER_PAGINATED_DOCUMENTS:
+                    self._documents.popitem(last=False)
+
+        return {
+            'hash': key,
+            'total': len(document['sections']),
+            'sections': document['sections']
+        }
+
+    def _assign_anchors(self, content, lines, sections):
+        """按整篇文档的顺序为各分段的标题分配锚点，重名标题与整篇渲染时一样依次加 _1、_2 后缀
+
+        只渲染标题行得到去重后的锚点，再按行号归属到各分段
+
+        Returns:
+            每个分段的锚点列表；标题数量与扫描结果不一致时返回 None（各分段自行生成锚点）
+        """
+        headings = [line for _, line, _ in scan_heading_lines(content)]
+        # ATX标题只取本行，Setext标题连同下方的下划线
+        source = '\n\n'.join(
+            lines[line - 1] if ATX_HEADING_RE.match(lines[line - 1]) else '\n'.join(lines[line - 1:line + 1])
+            for line in headings
+        )
+        md = self._get_markdown()
+        md.reset()
+        md.convert(source)
+
+        anchors = []
+
+        def collect(tokens):
+            for token in tokens:
+                anchors.append(token['id'])
+                collect(token.get('children', []))
+
+        collect(md.toc_tokens)
+        if len(anchors) != len(headings):
+            logger.warning(f"分段标题锚点分配失败 - 标题数: {len(headings)}, 锚点数: {len(anchors)}")
+            return None
+
+        return [
+            [anchor for line, anchor in zip(headings, anchors) if section['start_line'] < line <= section['end_line']]
+            for section in sections
+        ]
+
+    def _render_section(self, source, anchors):
+        """渲染单个分段，anchors 为该分段标题依次使用的锚点"""
+        md = self._get_section_markdown()
+        md.reset()
+        self._local.anchors = deque(anchors) if anchors is not None else None
+        try:
+            return md.convert(source)
+        finally:
+            self._local.anchors = None
+
+    def render_sections(self, document_key, start=0, count=None):
+        """按需渲染分段
+
+        Args:
+            document_key: paginate 返回的哈希
+            start: 起始分段序号
+            count: 分段数量
+
+        Returns:
+            生成器，逐段产出 {'index', 'html'}；文档不在缓存中时返回 None
+        """
+        with self._lock:
+            document = self._documents.get(document_key)
+            if document is None:
+                return None
+            self._documents.move_to_end(document_key)
+
+        count = min(count or Config.RENDER_PAGE_SIZE, Config.RENDER_MAX_PAGE_SIZE)
+        sections = document['sections'][max(start, 0):max(start, 0) + count]
+
+        def generate():
+            for section in sections:
+                index = section['index']
+                with self._lock:
+                    html = document['html'].get(index)
+                if html is None:
+                    source = '\n'.join(document['lines'][section['start_line']:section['end_line']])
+                    if document['references']:
+                        source += '\n\n' + document['references']
+                    anchors = document['anchors'][index] if document['anchors'] is not None else None
+                    html = self._render_section(source, anchors)
+                    with self._lock:
+                        document['html'][index] = html
+                yield {'index': index, 'html': html}
+
+        return generate()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'paginated_documents': len(self._documents),
+                'capacity': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
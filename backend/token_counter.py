@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token计数与用量统计
+提供本地token估算（可替换分词器，带缓存）以及AI调用的token用量记录
+"""
+
+import re
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from backend.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger('app.token_counter')
+
+# 按模型和类型（prompt / completion）累计的token数，source 区分上游返回值与本地估算值
+AI_TOKENS = metrics.counter('notegen_ai_tokens_total', 'AI调用token数', ('model', 'type', 'source'))
+
+CJK_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]')
+
+# 每条消息的格式开销（role、分隔符等），以及回复起始的固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# 超过该长度的文本按哈希作为缓存键，避免缓存中保存大段文本
+CACHE_KEY_HASH_THRESHOLD = 256
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中日韩字符按1个token计，其余按约4个字符1个token计"""
+    if not text:
+        return 0
+    cjk_count = len(CJK_RE.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+def load_tiktoken_tokenizer(encoding_name='cl100k_base'):
+    """加载tiktoken分词器，未安装时返回None"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f"tiktoken编码加载失败，使用估算分词器: {str(e)}")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenCounter:
+    """Token计数器，分词器可替换，重复文本的计数结果会被缓存"""
+
+    def __init__(self, tokenizer=None, cache_size=256):
+        """初始化Token计数器
+
+        Args:
+            tokenizer: 分词计数函数 text -> int；None时优先使用tiktoken，不可用则使用估算
+            cache_size: 计数缓存条目数
+        """
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.set_tokenizer(tokenizer)
+
+    def set_tokenizer(self, tokenizer=None):
+        """设置分词器，并清空计数缓存"""
+        if tokenizer is None:
+            tokenizer = load_tiktoken_tokenizer()
+            self.tokenizer_name = 'tiktoken' if tokenizer else 'estimate'
+            tokenizer = tokenizer or estimate_tokens
+        else:
+            self.tokenizer_name = getattr(tokenizer, '__name__', 'custom')
+
+        with self._lock:
+            self.tokenizer = tokenizer
+            self._cache.clear()
+        logger.info(f"Token计数器使用分词器: {self.tokenizer_name}")
+
+    def count(self, text):
+        """计算文本的token数"""
+        if not text:
+            return 0
+
+        key = text if len(text) <= CACHE_KEY_HASH_THRESHOLD else hashlib.sha1(text.encode('utf-8')).digest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                return tokens
+
+        tokens = self.tokenizer(text)
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages):
+        """计算对话消息列表的token数（含格式开销）"""
+        return sum(self.count(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+                   for message in messages) + REPLY_OVERHEAD_TOKENS
+
+
+class TokenUsageTracker:
+    """记录每次请求及累计的token用量"""
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self.history = deque(maxlen=history_size)
+        self.totals = {
+            'requests': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_tokens': 0,
+            'estimated_requests': 0,
+            'rejected_requests': 0,
+            'trimmed_requests': 0
+        }
+        self.by_model = {}
+
+    def record(self, model, prompt_tokens, completion_tokens, estimated=False):
+        """记录一次请求的用量
+
+        Args:
+            model: 模型名称
+            prompt_tokens: 提示token数
+            completion_tokens: 生成token数
+            estimated: 是否为本地估算值（上游未返回usage时）
+        """
+        total_tokens = prompt_tokens + completion_tokens
+        source = 'estimated' if estimated else 'upstream'
+        AI_TOKENS.inc(model, 'prompt', source, amount=prompt_tokens)
+        AI_TOKENS.inc(model, 'completion', source, amount=completion_tokens)
+        with self._lock:
+            self.history.append({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'model': model,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': total_tokens,
+                'estimated': estimated
+            })
+            self.totals['requests'] += 1
+            self.totals['prompt_tokens'] += prompt_tokens
+            self.totals['completion_tokens'] += completion_tokens
+            self.totals['total_tokens'] += total_tokens
+            if estimated:
+                self.totals['estimated_requests'] += 1
+
+            model_totals = self.by_model.setdefault(model, {
+                'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0
+            })
+            model_totals['requests'] += 1
+            model_totals['prompt_tokens'] += prompt_tokens
+            model_totals['completion_tokens'] += completion_tokens
+            model_totals['total_tokens'] += total_tokens
+
+    def record_event(self, name):
+        """记录请求前的预算处理事件（rejected / trimmed）"""
+        with self._lock:
+            self.totals[f'{name}_requests'] += 1
+
+    def get_usage(self, recent=20):
+        """获取用量统计"""
+        with self._lock:
+            return {
+                'totals': dict(self.totals),
+                'by_model': {model: dict(totals) for model, totals in self.by_model.items()},
+                'recent': list(self.history)[-recent:] if recent else []
+            }
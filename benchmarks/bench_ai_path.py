@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI调用链路压测
+启动本地替身服务和Flask应用，以不同并发度请求 /api/chat 与 /api/edit，
+输出吞吐量以及 p50/p95/p99 延迟（流式模式下另外输出首个token延迟）
+
+用法:
+    python benchmarks/bench_ai_path.py [--concurrency 1,4,16] [--requests 100] [--stream]
+                                       [--latency 0.05] [--token-rate 200] [--tokens 20] [--error-rate 0]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.app import create_app
+from backend.ai_service import AIService
+from backend.ai_jobs import AIJobQueue
+from backend.rate_limiter import RateLimiter
+from benchmarks.standin_server import StandInServer, expected_content
+
+SAMPLE_DOCUMENT = '# 示例文档\n\n' + '\n\n'.join(
+    f'## 第{i}节\n\n这是第{i}节的内容，用于压测AI上下文构建。' * 3 for i in range(1, 21))
+
+
+def percentile(samples, percent):
+    """最近秩法计算百分位数（samples需已排序）"""
+    if not samples:
+        return 0.0
+    index = max(int(len(samples) * percent / 100.0 + 0.5) - 1, 0)
+    return samples[min(index, len(samples) - 1)]
+
+
+def send(session, url, payload, stream):
+    """发送一次请求，返回 (状态, 总耗时, 首个token耗时)"""
+    start = time.perf_counter()
+    first_token = None
+    try:
+        response = session.post(url, json=payload, timeout=60, stream=stream)
+        if stream and response.status_code == 200:
+            status = 'ok'
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                if '"type": "error"' in line:
+                    status = 'stream_error'
+        else:
+            data = response.json()
+            status = 'ok' if response.status_code == 200 and data.get('success') else str(response.status_code)
+        response.close()
+    except requests.exceptions.RequestException as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - start, first_token
+
+
+def check_content(app_url, tokens):
+    """回归检查：流式与非流式响应的内容应与替身服务生成的内容（含中文）完全一致
+
+    Returns:
+        不一致的模式及实际内容列表，为空表示通过
+    """
+    expected = expected_content(tokens)
+    failures = []
+    for stream in (False, True):
+        response = requests.post(f'{app_url}/api/chat', json={'message': '编码检查', 'use_cache': False,
+                                                            'stream': stream}, timeout=60, stream=stream)
+        content = None
+        if stream:
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8')
+                if line.startswith('data:'):
+                    event = json.loads(line[5:])
+                    if event.get('type') == 'done':
+                        content = event.get('response')
+        else:
+            content = response.json().get('response')
+        response.close()
+        if content != expected:
+            failures.append(('流式' if stream else '非流式', content))
+    return failures
+
+
+def check_threads(app, app_url, count=30):
+    """回归检查：重复的非流式请求结束后不应遗留线程（如上游请求的辅助线程）
+
+    检查期间不限流，确保每个请求都实际发往替身服务
+
+    Returns:
+        (请求前线程数, 请求后线程数)
+    """
+    rate_limiter = app.rate_limiter
+    app.rate_limiter = RateLimiter(client_rate=0, global_rate=0)
+    before = threading.active_count()
+    try:
+        for _ in range(count):
+            requests.post(f'{app_url}/api/chat', json={'message': '线程检查', 'use_cache': False},
+                          timeout=60).close()
+    finally:
+        app.rate_limiter = rate_limiter
+    # 辅助线程在请求返回后才退出，稍等片刻再计数
+    deadline = time.monotonic() + 2
+    while threading.active_count() > before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return before, threading.active_count()
+
+
+def run_level(app_url, endpoint, concurrency, total, stream):
+    """以指定并发度发送 total 个请求并统计结果"""
+    url = f'{app_url}/api/{endpoint}'
+    payload = {
+        'message': '请总结这篇文档' if endpoint == 'chat' else '请修正文档中的错别字',
+        'context': SAMPLE_DOCUMENT,
+        'use_cache': False,
+        'stream': stream
+    }
+    local = threading.local()
+
+    def task(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return send(local.session, url, payload, stream)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(task, range(total)))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(status for status, _, _ in results)
+    latencies = sorted(latency * 1000 for status, latency, _ in results if status == 'ok')
+    first_tokens = sorted(first * 1000 for status, _, first in results if status == 'ok' and first is not None)
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'ok': statuses.pop('ok', 0),
+        'errors': dict(statuses),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'ttft_p50': percentile(first_tokens, 50) if first_tokens else None
+    }
+
+
+def print_row(row):
+    ttft = f"{row['ttft_p50']:8.1f}" if row['ttft_p50'] is not None else f"{'-':>8}"
+    errors = ', '.join(f'{name}: {count}' for name, count in row['errors'].items()) or '-'
+    print(f"{row['endpoint']:<6} {row['concurrency']:>4} {row['ok']:>6} {row['throughput']:>9.1f} "
+          f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} {ttft}  {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI调用链路压测')
+    parser.add_argument('--concurrency', default='1,4,16', help='并发度列表，逗号分隔')
+    parser.add_argument('--requests', type=int, default=100, help='每个并发度发送的请求数')
+    parser.add_argument('--endpoints', default='chat,edit', help='压测的接口，逗号分隔')
+    parser.add_argument('--stream', action='store_true', help='使用流式响应')
+    parser.add_argument('--ai-workers', type=int, default=None, help='AI任务队列并发数（默认取配置）')
+    parser.add_argument('--latency', type=float, default=0.05, help='替身服务首字节延迟（秒）')
+    parser.add_argument('--token-rate', type=float, default=200, help='替身服务每秒生成的token数')
+    parser.add_argument('--tokens', type=int, default=20, help='替身服务每次响应的token数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='替身服务返回错误的比例')
+    parser.add_argument('--error-status', type=int, default=503, help='注入错误的HTTP状态码')
+    args = parser.parse_args()
+
+    standin = StandInServer(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens,
+                            error_rate=args.error_rate, error_status=args.error_status)
+    standin_url = standin.start()
+
+    app = create_app()
+    # 压测期间只输出警告以上的日志，避免逐请求日志影响结果
+    logging.getLogger('app').setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app.ai_service = AIService(config={
+        'api_key': 'bench',
+        'base_url': standin_url,
+        'model': 'bench-model',
+        'timeout': 30,
+        'cache_enabled': False
+    })
+    if args.ai_workers:
+        app.ai_jobs = AIJobQueue(max_workers=args.ai_workers)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = f'http://127.0.0.1:{server.server_port}'
+
+    print(f"替身服务: {standin_url}  首字节延迟: {args.latency}s  生成速率: {args.token_rate} token/s  "
+          f"token数: {args.tokens}  错误率: {args.error_rate}")
+    print(f"应用地址: {app_url}  模式: {'流式' if args.stream else '非流式'}  每组请求数: {args.requests}")
+    print(f"{'接口':<5} {'并发':>3} {'成功':>5} {'吞吐(次/秒)':>7} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} "
+          f"{'首token':>6}  错误")
+
+    # 预热连接池，并检查响应内容的解码
+    requests.post(f'{app_url}/api/chat', json={'message': 'hi', 'use_cache': False}, timeout=30)
+    error_rate = standin.settings['error_rate']
+    standin.settings['error_rate'] = 0.0
+    failures = check_content(app_url, args.tokens)
+    if failures:
+        for mode, content in failures:
+            print(f"内容检查失败（{mode}）: {content!r}")
+        server.shutdown()
+        standin.shutdown()
+        app.ai_service.close()
+        sys.exit(1)
+    print("内容检查通过（流式与非流式响应与替身服务生成的内容一致）")
+    threads_before, threads_after = check_threads(app, app_url)
+    standin.settings['error_rate'] = error_rate
+    if threads_after > threads_before:
+        print(f"线程检查失败：非流式请求后线程数从 {threads_before} 增加到 {threads_after}")
+        server.shutdown()
+        standin.shutdown()
+        app.ai_service.close()
+        sys.exit(1)
+    print(f"线程检查通过（非流式请求前后线程数: {threads_before} -> {threads_after}）")
+
+    for endpoint in args.endpoints.split(','):
+        for concurrency in (int(value) for value in args.concurrency.split(',')):
+            print_row(run_level(app_url, endpoint.strip(), concurrency, args.requests, args.stream))
+
+    print(f"替身服务统计: {standin.stats}")
+    server.shutdown()
+    standin.shutdown()
+    app.ai_service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI连接池基准测试
+对比每次请求新建连接（requests.post）与 AIService 连接池长连接的单次请求延迟
+
+用法:
+    python benchmarks/bench_ai_session.py [请求次数]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.ai_service import AIService
+from benchmarks.standin_server import StandInServer
+
+
+def measure(func, count):
+    """执行 count 次并返回每次耗时（毫秒）"""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    """打印统计结果"""
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<24} 平均: {statistics.mean(samples):7.3f} ms  中位数: {statistics.median(samples):7.3f} ms  p95: {p95:7.3f} ms")
+    return statistics.mean(samples)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server = StandInServer(latency=0, token_rate=0, tokens=1)
+    base_url = server.start()
+
+    config = {
+        'api_key': 'bench',
+        'base_url': base_url,
+        'model': 'bench-model',
+        'timeout': 10,
+        'cache_enabled': False
+    }
+    payload = {'model': 'bench-model', 'messages': [{'role': 'user', 'content': 'hi'}]}
+
+    def without_pool():
+        requests.post(f'{base_url}/chat/completions', json=payload, timeout=10)
+
+    service = AIService(config=config)
+
+    def with_pool():
+        service.chat('hi')
+
+    print(f"替身服务: {base_url}, 每组请求次数: {count}")
+    # 预热
+    without_pool()
+    with_pool()
+
+    baseline = report('requests.post (新连接)', measure(without_pool, count))
+    pooled = report('AIService (连接池)', measure(with_pool, count))
+    print(f"单次请求节省: {baseline - pooled:.3f} ms ({(baseline - pooled) / baseline * 100:.1f}%)")
+    print("注：本地回环无TLS，远程HTTPS服务还会额外节省TLS握手时间")
+
+    service.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志写入方式基准测试
+分别以同步写入和队列异步写入配置日志，以不同并发度请求应用接口，对比单次请求延迟（p50/p95/p99）和吞吐量。
+可通过 --handler-delay 模拟较慢的磁盘或控制台（每条日志写入额外耗时）
+
+用法:
+    python benchmarks/bench_logging.py [--requests 2000] [--concurrency 1,8] [--endpoint /api/version]
+                                       [--handler-delay 0.5] [--console]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.app import create_app
+from backend.log_manager import LogManager, log_manager as default_log_manager
+from benchmarks.bench_ai_path import percentile
+
+
+class DelayHandler(logging.Handler):
+    """每条记录额外耗时的处理器，模拟较慢的磁盘或控制台"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def emit(self, record):
+        time.sleep(self.delay)
+
+
+def run_level(app, endpoint, concurrency, total):
+    """以指定并发度请求 total 次，返回延迟统计"""
+    local = threading.local()
+
+    def task(_):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        response = local.client.get(endpoint)
+        elapsed = (time.perf_counter() - start) * 1000
+        return response.status_code, elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(task, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for status, latency in results if status == 200)
+    return {
+        'ok': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志写入方式基准测试')
+    parser.add_argument('--requests', type=int, default=2000, help='每个并发度发送的请求数')
+    parser.add_argument('--concurrency', default='1,8', help='并发度列表，逗号分隔')
+    parser.add_argument('--endpoint', default='/api/version', help='请求的接口（GET）')
+    parser.add_argument('--handler-delay', type=float, default=0.0, help='每条日志额外写入耗时（毫秒）')
+    parser.add_argument('--console', action='store_true', help='保留控制台输出（默认丢弃，只测文件写入）')
+    args = parser.parse_args()
+
+    app = create_app()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    default_log_manager.close()
+    stderr = sys.stderr
+
+    print(f"接口: {args.endpoint}  每组请求数: {args.requests}  额外写入耗时: {args.handler_delay} ms")
+    print(f"{'模式':<4} {'并发':>4} {'成功':>6} {'吞吐(次/秒)':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8}")
+    for async_logging in (False, True):
+        with tempfile.TemporaryDirectory() as log_dir:
+            # 控制台处理器在创建时绑定 sys.stderr，默认将其指向空设备
+            if not args.console:
+                sys.stderr = open(os.devnull, 'w', encoding='utf-8')
+            manager = LogManager(log_dir, async_logging=async_logging)
+            if args.handler_delay:
+                manager.install_handlers(manager.app_logger, [DelayHandler(args.handler_delay / 1000)])
+            app.log_manager = manager
+
+            mode = '异步' if async_logging else '同步'
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                row = run_level(app, args.endpoint, concurrency, args.requests)
+                print(f"{mode:<4} {concurrency:>6} {row['ok']:>8} {row['throughput']:>12.1f} "
+                      f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f}")
+
+            # 关闭时写完队列中剩余的日志
+            start = time.perf_counter()
+            queue_stats = manager.get_queue_stats()
+            manager.close()
+            if async_logging:
+                dropped = sum(item['dropped'] for item in queue_stats.values())
+                print(f"异步模式关闭耗时: {(time.perf_counter() - start) * 1000:.1f} ms  丢弃记录: {dropped}")
+            if sys.stderr is not stderr:
+                sys.stderr.close()
+                sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地OpenAI兼容替身服务
+实现 /chat/completions（含流式）、/embeddings 与 /models，可配置首字节延迟、生成速率和错误注入，
+用于离线压测AI调用链路
+
+用法:
+    python benchmarks/standin_server.py [--port 8001] [--latency 0.2] [--token-rate 50]
+                                        [--tokens 40] [--error-rate 0.05] [--error-status 503]
+"""
+
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_token(index):
+    """第 index 个生成的token（含中文，用于检查非ASCII内容的解码）"""
+    return f'词元{index} '
+
+
+def expected_content(token_count):
+    """生成 token_count 个token时的完整响应内容"""
+    return ''.join(make_token(i) for i in range(token_count))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """/chat/completions 替身，支持HTTP/1.1长连接与分块传输的流式响应"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        """以分块传输编码写出一块数据并立即发送"""
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'standin', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        settings = self.server.settings
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        self.server.record('requests')
+
+        if self.path.rstrip('/').endswith('/embeddings'):
+            self._handle_embeddings(request)
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        time.sleep(settings['latency'])
+
+        # 错误注入：按比例返回错误状态码，429时附带Retry-After
+        if settings['error_rate'] and random.random() < settings['error_rate']:
+            self.server.record('errors')
+            status = settings['error_status']
+            headers = {'Retry-After': str(settings['retry_after'])} if status == 429 else None
+            self._send_json(status, {'error': {'message': 'injected error', 'code': status}}, headers)
+            return
+
+        token_count = settings['tokens']
+        delay = 1.0 / settings['token_rate'] if settings['token_rate'] else 0
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in request.get('messages', [])) // 4
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': token_count,
+            'total_tokens': prompt_tokens + token_count
+        }
+
+        if not request.get('stream'):
+            time.sleep(delay * token_count)
+            self._send_json(200, {
+                'id': 'standin',
+                'object': 'chat.completion',
+                'model': request.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant',
+                                                     'content': expected_content(token_count)},
+                             'finish_reason': 'stop'}],
+                'usage': usage
+            })
+            return
+
+        # 与部分上游服务一致：Content-Type 不声明charset，数据为未转义的UTF-8
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for i in range(token_count):
+                if delay:
+                    time.sleep(delay)
+                chunk = {'choices': [{'index': 0, 'delta': {'content': make_token(i)}}]}
+                self._write_chunk(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+            self._write_chunk(b'data: [DONE]\n\n')
+            self._write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（取消或超时）
+            self.server.record('disconnects')
+            self.close_connection = True
+
+    def _handle_embeddings(self, request):
+        """返回按字符哈希生成的固定维度向量（相同文本得到相同向量）"""
+        inputs = request.get('input') or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self.server.record('embedding_inputs', len(inputs))
+        data = []
+        for index, text in enumerate(inputs):
+            vector = [0.0] * 64
+            for char in text:
+                vector[zlib.crc32(char.encode('utf-8')) % 64] += 1.0
+            data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+        self._send_json(200, {'object': 'list', 'data': data, 'model': request.get('model')})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """替身服务，settings 可在运行中修改"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, token_rate=100, tokens=20,
+                 error_rate=0.0, error_status=503, retry_after=1):
+        """初始化替身服务
+
+        Args:
+            latency: 首字节延迟（秒）
+            token_rate: 每秒生成的token数，0表示不限速
+            tokens: 每次响应生成的token数
+            error_rate: 返回错误的比例（0~1）
+            error_status: 注入错误时返回的HTTP状态码
+            retry_after: 状态码为429时返回的Retry-After秒数
+        """
+        super().__init__((host, port), StandInHandler)
+        self.settings = {
+            'latency': latency,
+            'token_rate': token_rate,
+            'tokens': tokens,
+            'error_rate': error_rate,
+            'error_status': error_status,
+            'retry_after': retry_after
+        }
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'disconnects': 0, 'embedding_inputs': 0}
+
+    @property
+    def base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def record(self, name, count=1):
+        with self._lock:
+            self.stats[name] += count
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭空闲长连接属于正常情况，不打印异常
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        """在后台线程中启动服务，返回 base_url"""
+        threading.Thread(target=self.serve_forever, name='standin-server', daemon=True).start()
+        return self.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地OpenAI兼容替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help='首字节延迟（秒）')
+    parser.add_argument('--token-rate', type=float, default=50, help='每秒生成的token数，0表示不限速')
+    parser.add_argument('--tokens', type=int, default=40, help='每次响应生成的token数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误的比例（0~1）')
+    parser.add_argument('--error-status', type=int, default=503, help='注入错误时的HTTP状态码')
+    parser.add_argument('--retry-after', type=int, default=1, help='429错误的Retry-After秒数')
+    args = parser.parse_args()
+
+    server = StandInServer(args.host, args.port, args.latency, args.token_rate, args.tokens,
+                           args.error_rate, args.error_status, args.retry_after)
+    print(f"替身服务已启动: {server.base_url}（在设置中将API地址指向该地址即可）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"替身服务统计: {server.stats}")
+
+
+if __name__ == '__main__':
+    main()
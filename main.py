@@ -14,8 +14,9 @@ import signal
 import requests
 import time
 import socket
+import multiprocessing
 from backend.app import create_app
-from backend.config_manager import ConfigManager
+from backend.config_manager import get_config_manager
 from backend.log_manager import log_manager
 
 # 配置日志
@@ -62,7 +63,7 @@ def start_backend():
     backend_app = create_app()
     
     # 获取应用配置
-    config_manager = ConfigManager()
+    config_manager = get_config_manager()
     app_config = config_manager.get_app_config()
     
     host = app_config.get('host', '127.0.0.1')
@@ -110,7 +111,7 @@ def main():
     logger.debug("数据目录已准备就绪")
     
     # 获取应用配置
-    config_manager = ConfigManager()
+    config_manager = get_config_manager()
     app_config = config_manager.get_app_config()
     
     host = app_config.get('host', '127.0.0.1')
@@ -178,4 +179,6 @@ def on_window_closed(backend_already_running=False):
         logger.debug("后端服务不是由本实例启动的，跳过关闭")
 
 if __name__ == '__main__':
+    # 打包后的程序中使用进程池（日志搜索）需要先调用
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
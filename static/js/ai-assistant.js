@@ -130,7 +130,7 @@ class AIAssistant {
             let response;
             
             if (this.aiMode === 'chat') {
-                // 对话模式：发送消息和当前文档内容
+                // 对话模式：发送消息、当前文档内容以及选区和光标位置（用于服务端裁剪上下文）
                 const currentContent = this.app.editor.getValue();
                 response = await fetch('/api/chat', {
                     method: 'POST',
@@ -139,7 +139,9 @@ class AIAssistant {
                     },
                     body: JSON.stringify({
                         message: message,
-                        context: currentContent
+                        context: currentContent,
+                        selection: this.app.editor.getSelection(),
+                        cursor: this.app.editor.indexFromPos(this.app.editor.getCursor())
                     })
                 });
             } else {